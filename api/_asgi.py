@@ -0,0 +1,360 @@
+"""Async variant of the API for ASGI servers.
+
+The Flask app in index.py pins a worker thread for every MongoDB round trip
+and for the Google token check, so a sync deployment serves as many
+concurrent requests as it has threads. This app serves the I/O-bound hot
+routes on an event loop with motor, the async MongoDB driver:
+
+    GET  /api/electricians              directory pages
+    GET  /api/electricians/<id>         profiles
+    POST /api/auth/login                password login
+    POST /api/auth/google               Google sign-in
+    GET  /api/auth/session              identity for page headers
+
+Every other route is the Flask app itself, mounted through a WSGI adapter,
+so both modes expose the same routes. The async handlers reuse index.py's
+query building, response shaping, JSON encoding, session cookie, response
+cache and metrics, and answer with byte-identical bodies and ETags. Password
+checks still run on the bounded hasher pool (and answer 503 when it is
+full); the loop only awaits them.
+
+The sync app stays the default (Vercel deploys api/index.py, with
+requirements.txt). This one needs motor, starlette, uvicorn and a2wsgi on
+top, listed in requirements-async.txt:
+
+    pip install -r requirements-async.txt
+    uvicorn _asgi:app --app-dir api --port 5000
+
+bench_async.py compares the two under concurrent load.
+"""
+import os
+import sys
+import time
+import asyncio
+import contextlib
+from urllib.parse import urlencode
+
+import certifi
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from itsdangerous import BadSignature
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route, Mount
+from werkzeug.http import parse_etags
+from werkzeug.security import check_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import index
+from _http import COMPRESS_MIN_SIZE, strong_etag, negotiate_encoding, compress, cache_control_for
+from _passwords import HasherBusy
+from _serialize import dumps as serialize_dumps
+
+flask_app = index.app
+# Threads for the mounted Flask routes; the native routes never use them
+wsgi_app = WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+
+motor_client = AsyncIOMotorClient(index.MONGO_URI, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000,
+                                  event_listeners=[index.metrics.command_listener])
+db = motor_client.get_database(index.db.name)
+
+# Flask's own cookie signer, so a session started on either app is valid on both
+session_signer = flask_app.session_interface.get_signing_serializer(flask_app)
+SESSION_COOKIE = flask_app.config['SESSION_COOKIE_NAME']
+
+# key -> asyncio.Event set when the entry being computed for key is stored
+in_flight = {}
+
+def dumps(obj):
+    """The same bytes jsonify would produce"""
+    return serialize_dumps(obj) + b'\n'
+
+def read_session(request):
+    raw = request.cookies.get(SESSION_COOKIE)
+    if not raw:
+        return {}
+    try:
+        return session_signer.loads(raw, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+def write_session(response, session):
+    interface = flask_app.session_interface
+    response.set_cookie(
+        SESSION_COOKIE, session_signer.dumps(session),
+        path=interface.get_cookie_path(flask_app),
+        domain=interface.get_cookie_domain(flask_app),
+        secure=interface.get_cookie_secure(flask_app),
+        httponly=interface.get_cookie_httponly(flask_app),
+        samesite=interface.get_cookie_samesite(flask_app)
+    )
+
+def respond(request, body, status=200, etag=None, session=None):
+    """Build the response with the headers _http.install adds to Flask responses"""
+    headers = {'Cache-Control': cache_control_for(request.url.path, request.method)}
+    if request.method in ('GET', 'HEAD') and status == 200:
+        etag = etag or strong_etag(body)
+        encoding = None
+        if len(body) >= COMPRESS_MIN_SIZE:
+            headers['Vary'] = 'Accept-Encoding'
+            encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        headers['ETag'] = f'"{etag}"'
+        if etag in parse_etags(request.headers.get('if-none-match')):
+            return Response(b'', 304, headers=headers)
+        if encoding:
+            body = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+    elif etag:
+        # Cached error responses keep their ETag, as they do on the sync app
+        headers['ETag'] = f'"{etag}"'
+    response = Response(body, status, headers=headers, media_type='application/json')
+    if session is not None:
+        write_session(response, session)
+    return response
+
+def error(request, message, status):
+    return respond(request, dumps({'error': message}), status)
+
+def endpoint(rule):
+    """Record the handler in the shared metrics under the Flask rule it stands in for"""
+    def decorator(handler):
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            index.metrics.observe_request(rule, request.method, response.status_code,
+                                          time.perf_counter() - started, len(response.body), None)
+            return response
+        return wrapper
+    return decorator
+
+async def cached(request, tags, compute):
+    """Serve through index.response_cache, sharing entries with the sync app.
+
+    compute is a coroutine function returning (body, status). Fresh entries
+    are served as-is, stale ones are served while one task refreshes them,
+    and concurrent misses on one key wait for a single computation.
+    """
+    cache = index.response_cache
+    if cache is None:
+        body, status = await compute()
+        return respond(request, body, status)
+
+    async def entry_for():
+        body, status = await compute()
+        return {'body': body.decode(), 'etag': strong_etag(body), 'status': status,
+                'mimetype': 'application/json'}, status == 200
+
+    key = request.url.path + '?' + urlencode(sorted(request.query_params.multi_items()))
+    try:
+        key = cache.versioned_key(key, tags)
+        stored = cache.backend.get(key)
+    except Exception:
+        cache.count('errors')
+        entry, _ = await entry_for()
+        return respond(request, entry['body'].encode(), entry['status'], entry['etag'])
+
+    if stored is not None:
+        entry = stored['value']
+        if stored['fresh_until'] >= time.time():
+            cache.count('hits')
+        else:
+            cache.count('stale_hits')
+            if cache.backend.add(f"refresh:{key}", 1, 30):
+                asyncio.create_task(refresh(cache, key, entry_for))
+        return respond(request, entry['body'].encode(), entry['status'], entry['etag'])
+
+    cache.count('misses')
+    event = in_flight.get(key)
+    if event is not None:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(event.wait(), 10)
+        stored = cache.backend.get(key)
+        entry = stored['value'] if stored is not None else (await entry_for())[0]
+    else:
+        event = in_flight[key] = asyncio.Event()
+        try:
+            entry, cacheable = await entry_for()
+            if cacheable:
+                cache.store(key, entry)
+        finally:
+            in_flight.pop(key, None)
+            event.set()
+    return respond(request, entry['body'].encode(), entry['status'], entry['etag'])
+
+async def refresh(cache, key, entry_for):
+    cache.count('refreshes')
+    try:
+        entry, cacheable = await entry_for()
+        if cacheable:
+            cache.store(key, entry)
+    except Exception:
+        cache.count('errors')
+    finally:
+        cache.backend.delete(f"refresh:{key}")
+
+async def verify_password(password_hash, password):
+    if not password_hash or not password:
+        return False
+    return await asyncio.wrap_future(index.password_hasher.run(check_password_hash, password_hash, password))
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def hasher_busy_response(request):
+    response = error(request, 'Server busy, please try again', 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+@endpoint('/api/electricians')
+async def get_electricians(request):
+    async def compute():
+        try:
+            query, sort_spec, limit, sort_field, fields = index.listing_query(request.query_params)
+        except ValueError as e:
+            return dumps({'error': str(e)}), 400
+        # Fetch one extra document to know whether another page exists
+        projection = index.listing_projection(fields, sort_field)
+        docs = await db.users.find(query, projection).sort(sort_spec).limit(limit + 1).to_list(None)
+        return dumps(index.listing_page(docs, limit, sort_field, fields)), 200
+    return await cached(request, ['directory'], compute)
+
+@endpoint('/api/electricians/<string:id>')
+async def get_electrician(request):
+    id = request.path_params['id']
+
+    async def compute():
+        try:
+            projection, review_count = index.profile_projection(request.query_params)
+        except ValueError as e:
+            return dumps({'error': str(e)}), 400
+        try:
+            user = await db.users.find_one({'_id': ObjectId(id)}, projection)
+        except Exception:
+            return dumps({'error': 'Invalid ID'}), 400
+        if not user:
+            return dumps({'error': 'Electrician not found'}), 404
+        if review_count:
+            reviews = db.reviews.find({'electrician_id': user['_id']}, {'electrician_id': 0})
+            user['reviewsList'] = [index.serialize_doc(r) for r in
+                                   await reviews.sort('_id', -1).limit(review_count).to_list(None)]
+        return dumps(index.profile_body(user)), 200
+    return await cached(request, [f"user:{id}"], compute)
+
+@endpoint('/api/auth/login')
+async def login(request):
+    data = await read_json(request)
+    if data is None:
+        return error(request, 'Invalid JSON body', 400)
+    email = data.get('email', '').lower()
+    password = data.get('password')
+
+    try:
+        user = await db.users.find_one({'$or': [{'email': email}, {'name': email}]})
+
+        if user and await verify_password(user.get('password'), password):
+            if index.password_hasher.needs_rehash(user['password']):
+                # Same background upgrade as the sync route; the save runs on a hasher thread
+                stale_hash = user['password']
+                index.password_hasher.rehash_later(password, lambda new_hash: index.db.users.update_one(
+                    {'_id': user['_id'], 'password': stale_hash}, {'$set': {'password': new_hash}}))
+            session = read_session(request)
+            session.update({'user_id': str(user['_id']), 'claims': index.session_claims(user)})
+            return respond(request, dumps(index.login_body(user, 'Logged in')), session=session)
+
+        return error(request, 'Invalid credentials', 401)
+    except HasherBusy:
+        return hasher_busy_response(request)
+    except Exception as e:
+        return error(request, f"Database connection error: {str(e)}", 500)
+
+@endpoint('/api/auth/google')
+async def google_auth(request):
+    data = await read_json(request)
+    if data is None:
+        return error(request, 'Invalid JSON body', 400)
+    token = data.get('idToken')
+    if not token:
+        return error(request, 'Missing ID Token', 400)
+
+    try:
+        # Verification is local, but a cold key cache blocks on an HTTP fetch; keep it off the loop
+        idinfo = await asyncio.to_thread(index.verify_google_token, token)
+
+        user = await db.users.find_one({'email': idinfo['email'].lower()})
+        if not user:
+            user = index.google_signup(idinfo)
+            user['_id'] = (await db.users.insert_one(user)).inserted_id
+
+        session = read_session(request)
+        session.update({'user_id': str(user['_id']), 'claims': index.session_claims(user)})
+        return respond(request, dumps(index.login_body(user, 'Logged in with Google')), session=session)
+    except ValueError:
+        return error(request, 'Invalid Google ID Token', 401)
+    except Exception as e:
+        return error(request, str(e), 500)
+
+@endpoint('/api/auth/session')
+async def get_session_claims(request):
+    session = read_session(request)
+    user_id = session.get('user_id')
+    if user_id is None:
+        return respond(request, dumps(None))
+    claims = session.get('claims')
+    updated = None
+    # Same rules as index.current_claims: reload when missing, older than a known update, or due a re-check
+    stale = claims is None or claims['v'] < index.known_version(user_id, claims['v'])
+    if not stale and time.time() - claims.get('checked_at', 0) > index.CLAIMS_MAX_AGE:
+        try:
+            current = await db.users.find_one({'_id': ObjectId(user_id)}, {'session_version': 1})
+        except Exception:
+            current = None
+        if not current:
+            return respond(request, dumps(None))
+        index.note_version(user_id, current.get('session_version', 0))
+        stale = current.get('session_version', 0) != claims['v']
+        if not stale:
+            claims = session['claims'] = {**claims, 'checked_at': int(time.time())}
+            updated = session
+    if stale:
+        try:
+            user = await db.users.find_one({'_id': ObjectId(user_id)}, index.CURRENT_USER_PROJECTION)
+        except Exception:
+            user = None
+        if not user:
+            return respond(request, dumps(None))
+        claims = session['claims'] = index.session_claims(user)
+        updated = session
+    return respond(request, dumps(index.session_body(user_id, claims)), session=updated)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Native routes skip Flask's before_request hooks, so bootstrap indexes up front
+    await asyncio.to_thread(index.ensure_indexes_once)
+    yield
+    motor_client.close()
+
+app = Starlette(routes=[
+    Route('/api/electricians', get_electricians, methods=['GET']),
+    # Sync routes that the profile pattern below would otherwise capture
+    Route('/api/electricians/search', wsgi_app),
+    Route('/api/electricians/nearby', wsgi_app),
+    Route('/api/electricians/export', wsgi_app),
+    Route('/api/electricians/{id}', get_electrician, methods=['GET']),
+    Route('/api/auth/login', login, methods=['POST']),
+    Route('/api/auth/google', google_auth, methods=['POST']),
+    Route('/api/auth/session', get_session_claims, methods=['GET']),
+    Mount('', app=wsgi_app),
+], middleware=[
+    # flask-cors as configured in index.py: any origin, with credentials
+    Middleware(CORSMiddleware, allow_origin_regex='.*', allow_credentials=True, allow_methods=['*'],
+               allow_headers=['*'])
+], lifespan=lifespan)
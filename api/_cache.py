@@ -0,0 +1,214 @@
+"""Response cache for read-heavy API routes.
+
+Entries are keyed on route plus normalized query parameters and grouped by
+tags ("directory", "user:<id>"). Invalidating a tag bumps its version
+counter, and the counter is part of every key, so stale entries are never
+served after a write and simply age out of the backend.
+
+Reads serve stale-while-revalidate: a fresh entry is returned as-is, a stale
+one is returned immediately while a single background refresh recomputes
+it, and concurrent misses for the same key wait on one computation instead
+of all hitting MongoDB (single flight).
+
+Backends: MemoryBackend (LRU + TTL, per process) and RedisBackend for a
+local Redis-compatible server shared by workers. The redis package is only
+needed when CACHE_BACKEND=redis.
+
+Tag versions live in the backend, so with MemoryBackend an invalidation
+only reaches the process that made the write: other instances keep serving
+their copy for up to ttl + stale_ttl (330 s with the defaults). Deployments
+running more than one instance or worker process should use
+CACHE_BACKEND=redis, or CACHE_BACKEND=none.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key -> (expires_at, value)
+        self.tag_versions = {}          # kept apart so the LRU never evicts a counter
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[1]
+
+    def store(self, key, value, ttl):
+        # Caller holds the lock; refresh locks written by add() count towards max_entries too
+        self.entries[key] = (time.time() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.store(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; returns True when this call set it"""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and item[0] >= time.time():
+                return False
+            self.store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def versions(self, tags):
+        return [self.tag_versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tag):
+        with self.lock:
+            self.tag_versions[tag] = self.tag_versions.get(tag, 0) + 1
+
+    def __len__(self):
+        return len(self.entries)
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, json.dumps(value), ex=max(int(ttl), 1), nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def versions(self, tags):
+        if not tags:
+            return []
+        return [int(v or 0) for v in self.client.mget([f"tag:{tag}" for tag in tags])]
+
+    def bump(self, tag):
+        self.client.incr(f"tag:{tag}")
+
+    def __len__(self):
+        return self.client.dbsize()
+
+class ResponseCache:
+    def __init__(self, backend, ttl=30, stale_ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'invalidations': 0, 'errors': 0}
+        self.in_flight = {}     # key -> threading.Event, for single-flight misses
+        self.lock = threading.Lock()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def versioned_key(self, key, tags):
+        versions = self.backend.versions(tags)
+        return f"{key}|{','.join(f'{tag}={version}' for tag, version in zip(tags, versions))}"
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            try:
+                self.backend.bump(tag)
+            except Exception:
+                self.count('errors')
+            self.count('invalidations')
+
+    def store(self, key, value):
+        now = time.time()
+        self.backend.set(key, {'fresh_until': now + self.ttl, 'value': value}, self.ttl + self.stale_ttl)
+
+    def get_or_compute(self, key, tags, compute, refresh=None):
+        """Return the cached value for key, calling compute() on a miss.
+
+        compute must return (value, cacheable). refresh, if given, is a
+        callable wrapping compute for use from a background thread (e.g. with
+        the request context copied). A backend failure degrades to computing
+        the value directly.
+        """
+        try:
+            key = self.versioned_key(key, tags)
+            entry = self.backend.get(key)
+        except Exception:
+            self.count('errors')
+            return compute()[0]
+
+        if entry is not None:
+            if entry['fresh_until'] >= time.time():
+                self.count('hits')
+                return entry['value']
+            self.count('stale_hits')
+            # Only one worker refreshes a stale key; the rest keep serving the stale copy
+            if self.backend.add(f"refresh:{key}", 1, 30):
+                threading.Thread(target=self.refresh, args=(key, refresh or compute), daemon=True).start()
+            return entry['value']
+
+        self.count('misses')
+        with self.lock:
+            event = self.in_flight.get(key)
+            leader = event is None
+            if leader:
+                event = self.in_flight[key] = threading.Event()
+        if not leader:
+            event.wait(timeout=10)
+            entry = self.backend.get(key)
+            if entry is not None:
+                return entry['value']
+            return compute()[0]
+
+        try:
+            value, cacheable = compute()
+            if cacheable:
+                self.store(key, value)
+            return value
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            event.set()
+
+    def refresh(self, key, compute):
+        self.count('refreshes')
+        try:
+            value, cacheable = compute()
+            if cacheable:
+                self.store(key, value)
+        except Exception:
+            self.count('errors')
+        finally:
+            self.backend.delete(f"refresh:{key}")
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else None
+        try:
+            stats['entries'] = len(self.backend)
+        except Exception:
+            stats['entries'] = None
+        return stats
+
+def create_cache(backend_name, redis_url=None, max_entries=1024, ttl=30, stale_ttl=300):
+    """Build the configured cache, or None when caching is disabled"""
+    if backend_name == 'none':
+        return None
+    if backend_name == 'redis':
+        return ResponseCache(RedisBackend(redis_url or 'redis://localhost:6379/0'), ttl, stale_ttl)
+    return ResponseCache(MemoryBackend(max_entries), ttl, stale_ttl)
@@ -0,0 +1,173 @@
+"""Offline gazetteer for placing profiles on the map.
+
+Profiles only carry free-text state and location strings. resolve() turns
+them into coordinates from PLACES, a bundled list of state capitals, LGA
+headquarters and major towns (roughly town-centre coordinates), without any
+network geocoding:
+
+- the first place named in the location text wins ("Ikeja, Lagos", "Lekki");
+- otherwise the state's first entry, its capital, stands in for the state.
+
+Every profile therefore sits on one of a few hundred gazetteer points, its
+geo_cell ("Lagos/Ikeja"). Nearby search works cell by cell: cells_within()
+lists the points inside a radius, nearest first, and the API reads each
+cell's best-rated profiles from the (geo_cell, rating) index.
+
+To place more towns, append (name, lat, lng) to the state's list and re-run
+migrate_geo.py for existing profiles.
+"""
+import re
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+# state -> [(place, lat, lng), ...]; the first place is the state capital
+PLACES = {
+    'Abia': [('Umuahia', 5.532, 7.486), ('Aba', 5.107, 7.367), ('Ohafia', 5.617, 7.833), ('Arochukwu', 5.383, 7.917)],
+    'Adamawa': [('Yola', 9.204, 12.495), ('Jimeta', 9.279, 12.458), ('Mubi', 10.268, 13.264), ('Numan', 9.467, 12.033),
+                ('Ganye', 8.433, 12.050)],
+    'Akwa Ibom': [('Uyo', 5.038, 7.913), ('Eket', 4.642, 7.924), ('Ikot Ekpene', 5.179, 7.715), ('Oron', 4.833, 8.233)],
+    'Anambra': [('Awka', 6.210, 7.074), ('Onitsha', 6.150, 6.786), ('Nnewi', 6.018, 6.915), ('Ekwulobia', 6.033, 7.083),
+                ('Ihiala', 5.854, 6.860)],
+    'Bauchi': [('Bauchi', 10.316, 9.844), ('Azare', 11.677, 10.195), ('Misau', 11.313, 10.466), ('Jama\'are', 11.667, 9.933)],
+    'Bayelsa': [('Yenagoa', 4.927, 6.268), ('Brass', 4.317, 6.233), ('Ogbia', 4.683, 6.317), ('Sagbama', 5.150, 6.200)],
+    'Benue': [('Makurdi', 7.732, 8.539), ('Gboko', 7.325, 9.002), ('Otukpo', 7.191, 8.130), ('Katsina-Ala', 7.167, 9.283)],
+    'Borno': [('Maiduguri', 11.831, 13.151), ('Biu', 10.611, 12.195), ('Bama', 11.522, 13.686), ('Monguno', 12.671, 13.612)],
+    'Cross River': [('Calabar', 4.976, 8.342), ('Ikom', 5.962, 8.711), ('Ogoja', 6.658, 8.799), ('Ugep', 5.809, 8.081),
+                    ('Obudu', 6.667, 9.167)],
+    'Delta': [('Asaba', 6.199, 6.732), ('Warri', 5.517, 5.750), ('Sapele', 5.894, 5.677), ('Ughelli', 5.490, 5.991),
+              ('Agbor', 6.252, 6.194), ('Effurun', 5.556, 5.784)],
+    'Ebonyi': [('Abakaliki', 6.325, 8.114), ('Afikpo', 5.893, 7.935), ('Onueke', 6.150, 8.033)],
+    'Edo': [('Benin City', 6.335, 5.604), ('Auchi', 7.068, 6.264), ('Ekpoma', 6.743, 6.140), ('Uromi', 6.700, 6.333)],
+    'Ekiti': [('Ado-Ekiti', 7.621, 5.221), ('Ikere-Ekiti', 7.497, 5.231), ('Ikole', 7.798, 5.514), ('Ijero', 7.813, 5.067)],
+    'Enugu': [('Enugu', 6.458, 7.546), ('Nsukka', 6.857, 7.396), ('Agbani', 6.304, 7.553), ('Oji River', 6.262, 7.271)],
+    'FCT - Abuja': [('Abuja', 9.077, 7.399), ('Garki', 9.036, 7.490), ('Wuse', 9.069, 7.475), ('Maitama', 9.088, 7.497),
+                    ('Gwarinpa', 9.109, 7.407), ('Kubwa', 9.155, 7.322), ('Lugbe', 8.972, 7.372),
+                    ('Gwagwalada', 8.943, 7.083), ('Bwari', 9.283, 7.383), ('Kuje', 8.880, 7.228)],
+    'Gombe': [('Gombe', 10.290, 11.167), ('Kaltungo', 9.817, 11.317), ('Billiri', 9.867, 11.233)],
+    'Imo': [('Owerri', 5.485, 7.035), ('Orlu', 5.796, 7.035), ('Okigwe', 5.830, 7.350), ('Oguta', 5.710, 6.800)],
+    'Jigawa': [('Dutse', 11.756, 9.339), ('Hadejia', 12.450, 10.044), ('Kazaure', 12.652, 8.412), ('Gumel', 12.627, 9.388)],
+    'Kaduna': [('Kaduna', 10.511, 7.417), ('Zaria', 11.086, 7.720), ('Kafanchan', 9.583, 8.283), ('Kagoro', 9.600, 8.383)],
+    'Kano': [('Kano', 12.002, 8.592), ('Nassarawa', 11.990, 8.550), ('Fagge', 12.010, 8.520), ('Wudil', 11.794, 8.839),
+             ('Rano', 11.557, 8.583), ('Bichi', 12.233, 8.233)],
+    'Katsina': [('Katsina', 12.991, 7.602), ('Funtua', 11.523, 7.308), ('Daura', 13.033, 8.317), ('Malumfashi', 11.783, 7.617)],
+    'Kebbi': [('Birnin Kebbi', 12.454, 4.198), ('Argungu', 12.745, 4.525), ('Yauri', 10.783, 4.767), ('Zuru', 11.433, 5.233)],
+    'Kogi': [('Lokoja', 7.802, 6.733), ('Okene', 7.551, 6.236), ('Anyigba', 7.492, 7.174), ('Kabba', 7.833, 6.067),
+             ('Idah', 7.107, 6.734)],
+    'Kwara': [('Ilorin', 8.497, 4.542), ('Offa', 8.149, 4.721), ('Omu-Aran', 8.139, 5.103), ('Jebba', 9.133, 4.833)],
+    'Lagos': [('Ikeja', 6.602, 3.352), ('Lagos Island', 6.455, 3.395), ('Victoria Island', 6.428, 3.422),
+              ('Ikoyi', 6.452, 3.435), ('Lekki', 6.470, 3.585), ('Ajah', 6.467, 3.567), ('Eti-Osa', 6.459, 3.602),
+              ('Yaba', 6.510, 3.371), ('Surulere', 6.500, 3.350), ('Apapa', 6.449, 3.359), ('Mushin', 6.533, 3.350),
+              ('Oshodi', 6.536, 3.309), ('Isolo', 6.530, 3.322), ('Agege', 6.618, 3.321), ('Ikotun', 6.550, 3.267),
+              ('Alimosho', 6.611, 3.296), ('Ojo', 6.467, 3.183), ('Festac', 6.467, 3.283), ('Amuwo-Odofin', 6.467, 3.300),
+              ('Gbagada', 6.553, 3.389), ('Ketu', 6.594, 3.390), ('Ojota', 6.583, 3.383), ('Maryland', 6.573, 3.367),
+              ('Ikorodu', 6.619, 3.511), ('Epe', 6.584, 3.983), ('Badagry', 6.432, 2.888)],
+    'Nasarawa': [('Lafia', 8.494, 8.515), ('Keffi', 8.846, 7.874), ('Karu', 9.020, 7.600), ('Akwanga', 8.900, 8.400),
+                 ('Nasarawa', 8.533, 7.700)],
+    'Niger': [('Minna', 9.614, 6.557), ('Bida', 9.083, 6.017), ('Suleja', 9.181, 7.179), ('Kontagora', 10.400, 5.467),
+              ('New Bussa', 9.883, 4.517)],
+    'Ogun': [('Abeokuta', 7.148, 3.362), ('Ijebu Ode', 6.819, 3.917), ('Sagamu', 6.832, 3.632), ('Ota', 6.680, 3.236),
+             ('Ilaro', 6.889, 3.014), ('Ifo', 6.816, 3.196), ('Mowe', 6.806, 3.437)],
+    'Ondo': [('Akure', 7.257, 5.206), ('Ondo', 7.093, 4.835), ('Owo', 7.196, 5.587), ('Ikare', 7.527, 5.760),
+             ('Okitipupa', 6.500, 4.783)],
+    'Osun': [('Osogbo', 7.783, 4.542), ('Ile-Ife', 7.482, 4.560), ('Ilesa', 7.627, 4.742), ('Ede', 7.737, 4.437),
+             ('Iwo', 7.629, 4.187), ('Ikirun', 7.913, 4.667)],
+    'Oyo': [('Ibadan', 7.378, 3.947), ('Ogbomosho', 8.134, 4.240), ('Oyo', 7.853, 3.931), ('Iseyin', 7.967, 3.600),
+            ('Saki', 8.667, 3.394), ('Eruwa', 7.533, 3.417)],
+    'Plateau': [('Jos', 9.897, 8.858), ('Bukuru', 9.795, 8.872), ('Pankshin', 9.333, 9.450), ('Shendam', 8.883, 9.533)],
+    'Rivers': [('Port Harcourt', 4.816, 7.050), ('Obio-Akpor', 4.867, 7.000), ('Rumuokoro', 4.868, 6.995),
+               ('Eleme', 4.790, 7.120), ('Oyigbo', 4.880, 7.133), ('Bonny', 4.452, 7.170), ('Ahoada', 5.083, 6.650),
+               ('Omoku', 5.343, 6.657)],
+    'Sokoto': [('Sokoto', 13.006, 5.248), ('Tambuwal', 12.405, 4.646), ('Wurno', 13.291, 5.424)],
+    'Taraba': [('Jalingo', 8.883, 11.367), ('Wukari', 7.870, 9.778), ('Bali', 7.850, 10.967), ('Takum', 7.267, 9.983)],
+    'Yobe': [('Damaturu', 11.747, 11.961), ('Potiskum', 11.709, 11.069), ('Nguru', 12.879, 10.453), ('Gashua', 12.868, 11.046)],
+    'Zamfara': [('Gusau', 12.163, 6.661), ('Kaura Namoda', 12.594, 6.587), ('Talata Mafara', 12.567, 6.067),
+                ('Anka', 12.117, 5.933)],
+}
+
+# Other ways people write a state, normalized
+STATE_ALIASES = {
+    'abuja': 'FCT - Abuja',
+    'fct': 'FCT - Abuja',
+    'federal capital territory': 'FCT - Abuja',
+    'akwa-ibom': 'Akwa Ibom',
+    'nassarawa': 'Nasarawa',
+}
+
+def normalize(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', str(text or '').lower()))
+
+def cell_key(state, place):
+    return f"{state}/{place}"
+
+STATE_NAMES = {normalize(state): state for state in PLACES}
+STATE_NAMES.update({normalize(alias): state for alias, state in STATE_ALIASES.items()})
+# (normalized place, state, place, lat, lng), longest names first
+PLACE_NAMES = sorted(
+    ((normalize(place), state, place, lat, lng) for state, places in PLACES.items() for place, lat, lng in places),
+    key=lambda entry: -len(entry[0])
+)
+CELLS = {cell_key(state, place): (lat, lng) for _, state, place, lat, lng in PLACE_NAMES}
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def match_state(text):
+    """State named by text, either exactly or as words inside it"""
+    text = normalize(text)
+    if text in STATE_NAMES:
+        return STATE_NAMES[text]
+    padded = f" {text} "
+    for name in sorted(STATE_NAMES, key=len, reverse=True):
+        if f" {name} " in padded:
+            return STATE_NAMES[name]
+    return None
+
+def resolve(state, location):
+    """Return (state, place, lat, lng, precision) for a profile, or None when nothing matches"""
+    known_state = match_state(state) if state else None
+    padded = f" {normalize(location)} "
+    best = None
+    for name, place_state, place, lat, lng in PLACE_NAMES:
+        if known_state is not None and place_state != known_state:
+            continue
+        position = padded.find(f" {name} ")
+        # The first place named is the most specific one ("Wuse 2, Abuja"); PLACE_NAMES is
+        # longest first, so a shorter name at the same position never replaces a longer one
+        if position >= 0 and (best is None or position < best[0]):
+            best = (position, place_state, place, lat, lng)
+    if best is not None:
+        return best[1:] + ('place',)
+    known_state = known_state or match_state(location)
+    if known_state is None:
+        return None
+    place, lat, lng = PLACES[known_state][0]
+    return known_state, place, lat, lng, 'state'
+
+def geo_fields(state, location):
+    """Fields to store on a profile for its state and location text"""
+    resolved = resolve(state, location)
+    if resolved is None:
+        return {'geo': None, 'geo_cell': None, 'geo_precision': None}
+    place_state, place, lat, lng, precision = resolved
+    return {
+        # GeoJSON order is [longitude, latitude]
+        'geo': {'type': 'Point', 'coordinates': [lng, lat]},
+        'geo_cell': cell_key(place_state, place),
+        'geo_precision': precision
+    }
+
+def cells_within(lat, lng, radius_km):
+    """[(distance_km, cell), ...] for gazetteer points inside radius_km, nearest first"""
+    cells = []
+    for cell, (cell_lat, cell_lng) in CELLS.items():
+        distance = distance_km(lat, lng, cell_lat, cell_lng)
+        if distance <= radius_km:
+            cells.append((distance, cell))
+    cells.sort()
+    return cells
@@ -0,0 +1,138 @@
+"""Google ID token verification against cached signing keys.
+
+id_token.verify_oauth2_token fetches Google's public certificates on every
+call. GoogleKeyCache fetches them once over a pooled HTTP session, keeps
+them for the max-age Google sends in Cache-Control (less the response's
+Age), and verifies tokens locally, so a sign-in normally makes no network
+call at all:
+
+- REFRESH_AHEAD seconds before the keys expire, the next verification
+  starts one background refetch and carries on with the current keys;
+- only a cold or expired cache makes a caller wait for the fetch, and
+  concurrent callers share that one fetch;
+- a token signed with a key id the cache has not seen (Google rotated its
+  keys early) triggers one refetch, at most once per MIN_REFETCH_INTERVAL,
+  so a flood of forged key ids cannot turn into a flood of fetches;
+- a failed background refresh keeps the current keys until they expire
+  and is retried after MIN_REFETCH_INTERVAL.
+
+The certificate URL is configurable (GOOGLE_CERTS_URL) so the verifier can
+be exercised offline against a local key server; see verify_google_keys.py.
+"""
+import re
+import time
+import threading
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+# Used when the response carries no usable max-age
+DEFAULT_MAX_AGE = 3600
+REFRESH_AHEAD = 300
+MIN_REFETCH_INTERVAL = 60
+FETCH_TIMEOUT = 5
+
+def cache_lifetime(headers):
+    """Seconds the certificates may be used for, from Cache-Control max-age minus Age"""
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if not match:
+        return DEFAULT_MAX_AGE
+    try:
+        age = int(headers.get('Age', 0))
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+class GoogleKeyCache:
+    def __init__(self, certs_url=GOOGLE_CERTS_URL, clock_skew=10):
+        self.certs_url = certs_url
+        self.clock_skew = clock_skew
+        self.certs = None
+        self.expires_at = 0
+        self.last_fetch = 0
+        self.session = None
+        self.fetch_lock = threading.Lock()
+        self.refreshing = False
+        self.stats = {'fetches': 0, 'fetch_errors': 0, 'background_refreshes': 0, 'verified': 0, 'rejected': 0}
+
+    def fetch(self):
+        """Download the certificates and reset the expiry; returns them"""
+        if self.session is None:
+            # requests is only imported once a Google sign-in needs it
+            import requests
+            self.session = requests.Session()
+        self.last_fetch = time.time()
+        self.stats['fetches'] += 1
+        try:
+            response = self.session.get(self.certs_url, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            certs = response.json()
+        except Exception:
+            self.stats['fetch_errors'] += 1
+            raise
+        self.certs = certs
+        self.expires_at = self.last_fetch + cache_lifetime(response.headers)
+        return certs
+
+    def get_certs(self, need_kid=None):
+        """Current certificates, fetching only when missing, expired or lacking need_kid"""
+        now = time.time()
+        certs, expires_at = self.certs, self.expires_at
+        if certs is not None and now < expires_at and (need_kid is None or need_kid in certs):
+            if now >= expires_at - REFRESH_AHEAD:
+                self.refresh_in_background(expires_at)
+            return certs
+        if certs is not None and now < expires_at and now - self.last_fetch < MIN_REFETCH_INTERVAL:
+            # Unknown key id, but the keys were just fetched: the token is what's wrong
+            return certs
+
+        with self.fetch_lock:
+            # Another caller may have fetched while this one waited
+            certs = self.certs
+            if certs is not None and time.time() < self.expires_at and (need_kid is None or need_kid in certs):
+                return certs
+            return self.fetch()
+
+    def refresh_in_background(self, seen_expiry):
+        with self.fetch_lock:
+            # Skip if a refresh is running, has already replaced the keys this caller saw,
+            # or failed moments ago
+            if (self.refreshing or self.expires_at != seen_expiry
+                    or time.time() - self.last_fetch < MIN_REFETCH_INTERVAL):
+                return
+            self.refreshing = True
+        threading.Thread(target=self.background_refresh, daemon=True).start()
+
+    def background_refresh(self):
+        self.stats['background_refreshes'] += 1
+        try:
+            with self.fetch_lock:
+                self.fetch()
+        except Exception:
+            pass
+        finally:
+            self.refreshing = False
+
+    def verify(self, token, audience):
+        """Claims of a valid Google ID token for audience; raises ValueError otherwise"""
+        from google.auth import jwt
+
+        try:
+            kid = jwt.decode_header(token).get('kid')
+            claims = jwt.decode(token, certs=self.get_certs(kid), audience=audience,
+                                clock_skew_in_seconds=self.clock_skew)
+            if claims.get('iss') not in GOOGLE_ISSUERS:
+                raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        except ValueError:
+            self.stats['rejected'] += 1
+            raise
+        self.stats['verified'] += 1
+        return claims
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['keys'] = len(self.certs or {})
+        stats['expires_in'] = round(self.expires_at - time.time(), 1) if self.certs is not None else None
+        return stats
@@ -0,0 +1,129 @@
+"""Conditional GET, compression and Cache-Control for API responses.
+
+install(app) registers an after_request hook that, for successful GET/HEAD
+responses:
+
+- adds a strong ETag (a hash of the body, unless the view already set one),
+  suffixed with the content coding so gzip and brotli bodies get their own
+  validators, and answers a matching If-None-Match with 304;
+- compresses text and JSON bodies above COMPRESS_MIN_SIZE with brotli (when
+  the optional brotli package is installed) or gzip, per Accept-Encoding;
+- sets Cache-Control: shared caching for public listing routes, revalidate
+  on every use for per-user routes, and no-store for writes.
+
+Run this file directly for a bytes-on-the-wire comparison on a synthetic
+directory page.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/', 'image/svg+xml')
+# (path prefix, Cache-Control); the first matching prefix wins
+PUBLIC_CACHE_RULES = (
+    ('/api/electricians', 'public, max-age=30, stale-while-revalidate=300'),
+)
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+def strong_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def negotiate_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, or None for identity"""
+    offered = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    if brotli is not None and offered.get('br', 0) > 0:
+        return 'br'
+    if offered.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        # Quality 5 keeps dynamic responses well under a millisecond per page
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def cache_control_for(path, method):
+    if method not in ('GET', 'HEAD'):
+        return 'no-store'
+    for prefix, value in PUBLIC_CACHE_RULES:
+        if path.startswith(prefix):
+            return value
+    return PRIVATE_CACHE_CONTROL
+
+def install(app):
+    from flask import request
+
+    @app.after_request
+    def conditional_and_compressed(response):
+        if request.path.startswith('/api/') and 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = cache_control_for(request.path, request.method)
+
+        if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        body = response.get_data()
+        etag, _ = response.get_etag()
+        etag = etag or strong_etag(body)
+
+        encoding = None
+        mimetype = response.mimetype or ''
+        if len(body) >= COMPRESS_MIN_SIZE and mimetype.startswith(COMPRESSIBLE_TYPES):
+            response.vary.add('Accept-Encoding')
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        response.set_etag(etag)
+
+        if etag in request.if_none_match:
+            response.status_code = 304
+            response.set_data(b'')
+            response.headers.pop('Content-Length', None)
+            return response
+
+        if encoding:
+            response.set_data(compress(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+if __name__ == '__main__':
+    import json
+    import random
+
+    random.seed(7)
+    specialties = ['Solar Panel Installer', 'Inverter Technician', 'Residential Wiring', 'Commercial Systems']
+    states = ['Lagos', 'Kano', 'FCT - Abuja', 'Rivers', 'Oyo']
+    page = {'electricians': [{
+        'id': '%024x' % random.getrandbits(96),
+        'name': f"Electrician {i}",
+        'specialty': random.choice(specialties),
+        'state': random.choice(states),
+        'location': 'Nigeria',
+        'description': 'Experienced electrical professional ready to help with your projects.',
+        'image': 'assets/images/profile_placeholder.jpg',
+        'rating': round(random.uniform(3, 5), 1),
+        'reviews': random.randint(0, 200),
+    } for i in range(20)], 'next_cursor': 'eyJpZCI6ICJhYmMiLCAidiI6IDQuNX0'}
+    body = json.dumps(page).encode()
+
+    print(f"identity: {len(body)} bytes")
+    print(f"gzip:     {len(compress(body, 'gzip'))} bytes")
+    if brotli is not None:
+        print(f"br:       {len(compress(body, 'br'))} bytes")
+    print("304:      0 bytes of body on a repeat visit with If-None-Match")
@@ -0,0 +1,78 @@
+"""Index bootstrap for the SparkConnect collections.
+
+Runs idempotently: create_index is a no-op when an index with the same name
+and keys already exists. Deployments run this file from a deploy step (with
+MONGO_URI set) after every change to the index lists below; the API itself
+only creates them when ENSURE_INDEXES=1 or when api/index.py is run directly,
+so serverless cold starts do not pay for the round trips:
+
+    python api/_indexes.py
+"""
+import os
+import sys
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+# name -> (keys, options). Listing indexes follow equality-sort-range order
+# so filtered, rating-sorted pages never need an in-memory sort.
+USERS_INDEXES = {
+    'users_email_unique': ([('email', ASCENDING)], {'unique': True}),
+    'users_name': ([('name', ASCENDING)], {}),
+    'users_rating': ([('rating', DESCENDING), ('_id', DESCENDING), ('specialty', ASCENDING)], {}),
+    'users_state_rating': ([('state', ASCENDING), ('rating', DESCENDING), ('_id', DESCENDING), ('specialty', ASCENDING)], {}),
+    'users_specialty_rating': ([('specialty', ASCENDING), ('rating', DESCENDING), ('_id', DESCENDING)], {}),
+    # ?sort=reviews, unfiltered and by state
+    'users_reviews': ([('reviews', DESCENDING), ('_id', DESCENDING), ('specialty', ASCENDING)], {}),
+    'users_state_reviews': ([('state', ASCENDING), ('reviews', DESCENDING), ('_id', DESCENDING), ('specialty', ASCENDING)], {}),
+    # Best-rated profiles at one gazetteer point, for nearby search
+    'users_geo_cell_rating': ([('geo_cell', ASCENDING), ('rating', DESCENDING), ('_id', DESCENDING)], {}),
+}
+
+# Newest-first review pages per electrician
+REVIEWS_INDEXES = {
+    'reviews_electrician_newest': ([('electrician_id', ASCENDING), ('_id', DESCENDING)], {}),
+}
+
+# Mail worker claims (see _mail.py); sent messages are dropped after a week
+OUTBOX_INDEXES = {
+    'outbox_due': ([('status', ASCENDING), ('due_at', ASCENDING)], {}),
+    'outbox_sent_ttl': ([('sent_at', ASCENDING)], {'expireAfterSeconds': 7 * 24 * 3600}),
+}
+
+# Orphaned uploads waiting for the collector (see _upload_gc.py); referenced files are not in the index
+UPLOAD_REFS_INDEXES = {
+    'upload_refs_released': ([('released_at', ASCENDING)], {'partialFilterExpression': {'released_at': {'$exists': True}}}),
+}
+
+# Resumable uploads in progress (see _uploads.py), scanned for ones that went quiet
+PARTIAL_UPLOADS_INDEXES = {
+    'partial_uploads_updated': ([('updated_at', ASCENDING)], {}),
+}
+
+def ensure_indexes(db):
+    """Create any missing indexes. Returns the list of index names that failed."""
+    failed = []
+    for collection, indexes in (('users', USERS_INDEXES), ('reviews', REVIEWS_INDEXES), ('outbox', OUTBOX_INDEXES),
+                                ('upload_refs', UPLOAD_REFS_INDEXES), ('partial_uploads', PARTIAL_UPLOADS_INDEXES)):
+        for name, (keys, options) in indexes.items():
+            try:
+                db[collection].create_index(keys, name=name, **options)
+            except PyMongoError as e:
+                # e.g. duplicate emails already in the collection block the unique index
+                print(f"Index {name} not created: {e}")
+                failed.append(name)
+    return failed
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'public', '.env'))
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    database = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+
+    failed = ensure_indexes(database)
+    for name in {**USERS_INDEXES, **REVIEWS_INDEXES, **OUTBOX_INDEXES, **UPLOAD_REFS_INDEXES, **PARTIAL_UPLOADS_INDEXES}:
+        print(f"[{'FAIL' if name in failed else 'OK'}] {name}")
+    sys.exit(1 if failed else 0)
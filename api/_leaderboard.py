@@ -0,0 +1,206 @@
+"""Materialized leaderboards of electricians by state and by specialty.
+
+Profiles are ranked by a Bayesian average rather than their raw rating, so
+one 5-star review does not beat a hundred 4.8s:
+
+    score = (prior_weight * prior_mean + rating_sum) / (prior_weight + reviews)
+
+prior_mean is the mean of every review on the site, taken when the boards are
+built and held until the next build; that keeps each update local to the
+profile that changed. prior_weight is how many reviews a profile needs
+before its own ratings count as much as the prior.
+
+Each board is a list of (-score, -reviews, doc_id) kept sorted with bisect,
+so reading the top N is a slice. A profile sits on four boards (everyone,
+its state, its specialty, and its state and specialty together), so any
+combination of the two filters is one lookup. State and specialty match
+case-insensitively; a specialty that is not on any board is treated as a
+prefix ("solar" for "Solar Panel Installer") and the few matching boards are
+merged. Profiles without reviews are not ranked.
+
+Run this file directly to benchmark updates and reads on synthetic profiles:
+
+    python api/_leaderboard.py 100000
+"""
+import heapq
+import bisect
+import itertools
+import threading
+
+from _search import listing_summary
+
+# Reviews a profile needs before its own average outweighs the site-wide one
+DEFAULT_PRIOR_WEIGHT = 5
+# Prior mean used while the site has no reviews at all
+DEFAULT_PRIOR_MEAN = 3.5
+
+def board_key(value):
+    return (value or '').strip().lower() or None
+
+def rating_sum(doc):
+    """Sum of a profile's ratings; profiles from before rating_sum existed have rating * reviews"""
+    if doc.get('rating_sum') is not None:
+        return float(doc['rating_sum'])
+    return float(doc.get('rating') or 0) * (doc.get('reviews') or 0)
+
+class Leaderboards:
+    def __init__(self, prior_weight=DEFAULT_PRIOR_WEIGHT):
+        self.lock = threading.RLock()
+        self.prior_weight = prior_weight
+        self.prior_mean = DEFAULT_PRIOR_MEAN
+        self.boards = {}        # (state, specialty), either may be None -> [(-score, -reviews, doc_id), ...]
+        self.entries = {}       # doc_id -> (entry, board keys), for removal
+        self.docs = {}          # doc_id -> listing summary
+        self.specialties = []   # sorted specialty keys, for prefix lookups
+
+    def __len__(self):
+        return len(self.entries)
+
+    def score(self, doc, prior_mean=None):
+        reviews = doc.get('reviews') or 0
+        prior_mean = self.prior_mean if prior_mean is None else prior_mean
+        return (self.prior_weight * prior_mean + rating_sum(doc)) / (self.prior_weight + reviews)
+
+    def placement(self, doc, prior_mean=None):
+        """The entry and board keys for doc, or None when it is not ranked"""
+        reviews = doc.get('reviews') or 0
+        if reviews <= 0:
+            return None
+        doc_id = str(doc.get('id') or doc['_id'])
+        state, specialty = board_key(doc.get('state')), board_key(doc.get('specialty'))
+        keys = {(None, None), (state, None), (None, specialty), (state, specialty)}
+        return (-self.score(doc, prior_mean), -reviews, doc_id), keys
+
+    def build(self, docs):
+        """Replace every board; sorts each one once instead of per insert"""
+        docs = list(docs)
+        total_reviews = sum(doc.get('reviews') or 0 for doc in docs)
+        prior_mean = sum(rating_sum(doc) for doc in docs) / total_reviews if total_reviews else DEFAULT_PRIOR_MEAN
+
+        boards, entries, summaries = {}, {}, {}
+        for doc in docs:
+            placed = self.placement(doc, prior_mean)
+            if placed is None:
+                continue
+            entry, keys = placed
+            for key in keys:
+                boards.setdefault(key, []).append(entry)
+            entries[entry[2]] = placed
+            summaries[entry[2]] = listing_summary(doc)
+        for board in boards.values():
+            board.sort()
+        # Built outside the lock, so reads keep answering from the old boards until the swap
+        with self.lock:
+            self.prior_mean = prior_mean
+            self.boards = boards
+            self.entries = entries
+            self.docs = summaries
+            self.specialties = sorted({specialty for _, specialty in boards if specialty is not None})
+
+    def add(self, doc):
+        """Insert, move or drop a profile after its rating or listing fields changed"""
+        placed = self.placement(doc)
+        with self.lock:
+            if placed is None:
+                self.remove(doc.get('id') or doc['_id'])
+                return
+            entry, keys = placed
+            doc_id = entry[2]
+            self.remove(doc_id)
+            for key in keys:
+                if key not in self.boards:
+                    self.boards[key] = []
+                    if key[0] is None and key[1] is not None:
+                        bisect.insort(self.specialties, key[1])
+                bisect.insort(self.boards[key], entry)
+            self.entries[doc_id] = placed
+            self.docs[doc_id] = listing_summary(doc)
+
+    def remove(self, doc_id):
+        doc_id = str(doc_id)
+        with self.lock:
+            placed = self.entries.pop(doc_id, None)
+            self.docs.pop(doc_id, None)
+            if placed is None:
+                return
+            entry, keys = placed
+            for key in keys:
+                board = self.boards[key]
+                del board[bisect.bisect_left(board, entry)]
+                if not board:
+                    del self.boards[key]
+                    if key[0] is None and key[1] is not None:
+                        del self.specialties[bisect.bisect_left(self.specialties, key[1])]
+
+    def top(self, state=None, specialty=None, limit=10):
+        """Summaries of the best limit profiles, best first, each with its score"""
+        state, specialty = board_key(state), board_key(specialty)
+        with self.lock:
+            board = self.boards.get((state, specialty))
+            if board is not None or specialty is None:
+                ranked = (board or [])[:limit]
+            else:
+                start = bisect.bisect_left(self.specialties, specialty)
+                matches = itertools.takewhile(lambda s: s.startswith(specialty), self.specialties[start:])
+                boards = [self.boards.get((state, s), []) for s in matches]
+                ranked = list(itertools.islice(heapq.merge(*boards), limit))
+
+            results = []
+            for neg_score, _, doc_id in ranked:
+                summary = dict(self.docs[doc_id])
+                summary['id'] = doc_id
+                summary['score'] = round(-neg_score, 3)
+                results.append(summary)
+            return results
+
+    def snapshot(self):
+        with self.lock:
+            return {'profiles': len(self.entries), 'boards': len(self.boards),
+                    'prior_mean': round(self.prior_mean, 3), 'prior_weight': self.prior_weight}
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import random
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(42)
+    specialties = ['Solar Panel Installer', 'Inverter Technician', 'Residential Wiring', 'Commercial Systems',
+                   'Industrial Electrician', 'Generator Repair', 'Earthing and Surge Protection', 'LED Lighting']
+    states = ['Lagos', 'Kano', 'FCT - Abuja', 'Rivers', 'Oyo', 'Enugu', 'Kaduna', 'Delta', 'Ogun', 'Anambra']
+
+    profiles = []
+    for i in range(size):
+        reviews = random.randint(0, 200)
+        profiles.append({
+            'id': str(i),
+            'name': f"Electrician {i}",
+            'specialty': random.choice(specialties),
+            'state': random.choice(states),
+            'reviews': reviews,
+            'rating_sum': sum(random.randint(1, 5) for _ in range(reviews)),
+        })
+    boards = Leaderboards()
+    started = time.perf_counter()
+    boards.build(profiles)
+    print(f"Built {len(boards.boards)} boards over {len(boards)} profiles in {time.perf_counter() - started:.1f}s")
+
+    def timed(label, operation, runs=2000):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            operation()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{label}: p50 {timings[len(timings) // 2]:.3f} ms, p95 {timings[int(len(timings) * 0.95)]:.3f} ms")
+
+    def review():
+        doc = random.choice(profiles)
+        doc['reviews'] += 1
+        doc['rating_sum'] += random.randint(1, 5)
+        boards.add(doc)
+
+    timed('review update', review)
+    timed('top 10 overall', lambda: boards.top(limit=10))
+    timed('top 10 in a state and specialty', lambda: boards.top(random.choice(states), random.choice(specialties)))
+    timed('top 10 by specialty prefix', lambda: boards.top(specialty='solar'))
@@ -0,0 +1,307 @@
+"""Outbound email through a durable queue.
+
+Requests never talk to SMTP: enqueue() stores the message in the outbox
+collection, wakes the worker and returns. MailQueue drains the outbox on a
+daemon thread:
+
+- due messages are claimed with a lease (status sending, due_at moved to
+  the lease expiry), so several instances can share one outbox and a
+  message held by a process that died is claimed again once its lease
+  runs out;
+- one SMTP connection carries a whole batch of up to batch_size messages,
+  and is reopened once if the server drops it mid-batch;
+- temporary failures (4xx replies, connection errors) are retried with
+  exponential backoff and jitter, up to MAX_ATTEMPTS; permanent ones (5xx)
+  fail the message at once;
+- each recipient domain gets domain_rate messages per minute from this
+  process. A message over the limit goes back to the queue for when its
+  domain has room again, which does not count as an attempt.
+
+Sent messages are kept for a week (a TTL index on sent_at, see
+_indexes.py); failed ones stay until someone looks at them.
+
+Configuration uses the Flask-Mail names: MAIL_SERVER (no server, no
+sending: messages wait in the outbox), MAIL_PORT, MAIL_USE_TLS,
+MAIL_USE_SSL, MAIL_USERNAME, MAIL_PASSWORD and MAIL_DEFAULT_SENDER, plus
+MAIL_DOMAIN_RATE and MAIL_BATCH_SIZE.
+
+Serverless instances may be frozen between requests, so the worker only
+drains while its instance is alive. Nothing is lost meanwhile; run this file
+from a scheduled job to drain the outbox regardless:
+
+    python api/_mail.py
+"""
+import os
+import time
+import random
+import smtplib
+import threading
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import make_msgid
+from pymongo import ReturnDocument
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 60
+BACKOFF_MAX = 3600
+LEASE_SECONDS = 300
+
+def backoff(attempts):
+    """Seconds before retry number attempts, with jitter so a failed batch does not retry in lockstep"""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+def is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+class DomainLimiter:
+    """Token bucket per recipient domain: per_minute messages, refilled continuously"""
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.buckets = {}   # domain -> [tokens, updated_at]
+        self.lock = threading.Lock()
+
+    def reserve(self, domain, now=None):
+        """Take a token for domain; returns 0, or the seconds until one is available"""
+        now = time.time() if now is None else now
+        with self.lock:
+            bucket = self.buckets.setdefault(domain, [self.capacity, now])
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+class MailQueue:
+    def __init__(self, get_db, server=None, port=587, use_tls=True, use_ssl=False, username=None, password=None,
+                 sender=None, domain_rate=30, batch_size=50, poll_interval=60):
+        self.get_db = get_db
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.sender = sender or username or 'SparkConnect <no-reply@sparkconnect.com>'
+        self.limiter = DomainLimiter(domain_rate)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.started = False
+        self.drain_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'postponed': 0, 'batches': 0,
+                      'connections': 0}
+        self.last_error = None
+
+    def count(self, stat, n=1):
+        with self.lock:
+            self.stats[stat] += n
+
+    def enqueue(self, to, subject, body, html=None):
+        """Store a message for delivery and return its id; never waits on SMTP"""
+        now = time.time()
+        doc = {
+            'to': to,
+            'domain': to.rsplit('@', 1)[-1].lower(),
+            'subject': subject,
+            'body': body,
+            'html': html,
+            'status': 'queued',
+            'attempts': 0,
+            'due_at': now,
+            'created_at': now
+        }
+        self.get_db().outbox.insert_one(doc)
+        self.count('enqueued')
+        self.wake()
+        return doc['_id']
+
+    def wake(self):
+        if not self.server:
+            return
+        self.start()
+        self.wakeup.set()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self.work, name='mail-worker', daemon=True).start()
+
+    def work(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                while self.drain():
+                    pass
+            except Exception as e:
+                # e.g. MongoDB unreachable; the next wakeup or poll tries again
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def drain(self):
+        """Claim and send one batch of due messages; returns how many were claimed"""
+        with self.drain_lock:
+            batch = self.claim()
+            sendable = []
+            for message in batch:
+                wait = self.limiter.reserve(message['domain'])
+                if wait:
+                    self.postpone(message, wait)
+                else:
+                    sendable.append(message)
+            if sendable:
+                self.send_batch(sendable)
+            return len(batch)
+
+    def claim(self):
+        outbox = self.get_db().outbox
+        now = time.time()
+        batch = []
+        while len(batch) < self.batch_size:
+            message = outbox.find_one_and_update(
+                {'status': {'$in': ['queued', 'sending']}, 'due_at': {'$lte': now}},
+                {'$set': {'status': 'sending', 'due_at': now + LEASE_SECONDS}},
+                sort=[('due_at', 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if message is None:
+                break
+            batch.append(message)
+        return batch
+
+    def connect(self):
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.server, self.port, timeout=30)
+        else:
+            connection = smtplib.SMTP(self.server, self.port, timeout=30)
+            if self.use_tls:
+                connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        self.count('connections')
+        return connection
+
+    def build(self, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message['to']
+        email['Subject'] = message['subject']
+        email['Message-ID'] = make_msgid(domain=self.sender.rsplit('@', 1)[-1].strip('>'))
+        email.set_content(message['body'])
+        if message.get('html'):
+            email.add_alternative(message['html'], subtype='html')
+        return email
+
+    def send_batch(self, messages):
+        self.count('batches')
+        connection = None
+        try:
+            for i, message in enumerate(messages):
+                for reconnected in (False, True):
+                    if connection is None:
+                        try:
+                            connection = self.connect()
+                        except (OSError, smtplib.SMTPException) as e:
+                            # Server unreachable or refusing: the rest of the batch waits too
+                            for pending in messages[i:]:
+                                self.retry_or_fail(pending, e, temporary=True)
+                            return
+                    try:
+                        connection.send_message(self.build(message))
+                        self.mark_sent(message)
+                        break
+                    except smtplib.SMTPServerDisconnected as e:
+                        # Dropped connection: reopen once and resend this message on it
+                        connection = None
+                        if reconnected:
+                            self.retry_or_fail(message, e)
+                    except (OSError, smtplib.SMTPException) as e:
+                        self.retry_or_fail(message, e)
+                        break
+        finally:
+            if connection is not None:
+                try:
+                    connection.quit()
+                except (OSError, smtplib.SMTPException):
+                    connection.close()
+
+    def mark_sent(self, message):
+        self.get_db().outbox.update_one({'_id': message['_id']}, {
+            '$set': {'status': 'sent', 'sent_at': datetime.now(timezone.utc)},
+            '$inc': {'attempts': 1},
+            '$unset': {'due_at': '', 'last_error': ''}
+        })
+        self.count('sent')
+
+    def retry_or_fail(self, message, error, temporary=False):
+        attempts = message['attempts'] + 1
+        update = {'attempts': attempts, 'last_error': f"{type(error).__name__}: {error}"}
+        self.last_error = update['last_error']
+        if (is_permanent(error) and not temporary) or attempts >= MAX_ATTEMPTS:
+            update['status'] = 'failed'
+            self.count('failed')
+        else:
+            update.update({'status': 'queued', 'due_at': time.time() + backoff(attempts)})
+            self.count('retried')
+        self.get_db().outbox.update_one({'_id': message['_id']}, {'$set': update})
+
+    def postpone(self, message, seconds):
+        self.get_db().outbox.update_one({'_id': message['_id']},
+                                        {'$set': {'status': 'queued', 'due_at': time.time() + seconds}})
+        self.count('postponed')
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['configured'] = bool(self.server)
+        stats['worker'] = self.started
+        stats['last_error'] = self.last_error
+        try:
+            outbox = self.get_db().outbox
+            stats['outbox'] = {status: outbox.count_documents({'status': status})
+                               for status in ('queued', 'sending', 'failed')}
+        except Exception:
+            stats['outbox'] = None
+        return stats
+
+def create_mail_queue(get_db):
+    return MailQueue(
+        get_db,
+        server=os.environ.get('MAIL_SERVER'),
+        port=int(os.environ.get('MAIL_PORT', 587)),
+        use_tls=os.environ.get('MAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes'),
+        use_ssl=os.environ.get('MAIL_USE_SSL', 'false').lower() in ('1', 'true', 'yes'),
+        username=os.environ.get('MAIL_USERNAME'),
+        password=os.environ.get('MAIL_PASSWORD'),
+        sender=os.environ.get('MAIL_DEFAULT_SENDER'),
+        domain_rate=int(os.environ.get('MAIL_DOMAIN_RATE', 30)),
+        batch_size=int(os.environ.get('MAIL_BATCH_SIZE', 50))
+    )
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'public', '.env'))
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    database = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+
+    queue = create_mail_queue(lambda: database)
+    if not queue.server:
+        sys.exit('MAIL_SERVER is not set')
+    while queue.drain():
+        pass
+    stats = queue.snapshot()
+    print(f"sent {stats['sent']}, retrying {stats['retried']}, failed {stats['failed']}, "
+          f"postponed {stats['postponed']}; outbox now {stats['outbox']}")
+    sys.exit(1 if stats['failed'] else 0)
@@ -0,0 +1,242 @@
+"""Resized image variants and video poster frames for uploaded media.
+
+Every upload is queued for a small pool of background workers, so the upload
+response never waits on image processing. A worker writes, under variants/
+in the same storage backend as the uploads (see _storage.py):
+
+- thumb, card and full renditions (VARIANT_WIDTHS) in WebP, and in AVIF
+  when the installed Pillow can encode it; images are never upscaled;
+- for videos, a poster frame grabbed with ffmpeg, which then gets the same
+  renditions.
+
+Uploads are content-addressed, so variant names follow from the source name
+and a re-upload of known bytes finds its variants already stored.
+
+The result is recorded in the media collection (one document per source
+URL) and copied next to the profiles that use it: gallery_media.<key> for
+gallery items and image_media for the profile picture. Each record carries
+srcset strings ready for <img srcset> / <source srcset>.
+
+Pillow is only needed by the workers and ffmpeg only for video posters; a
+missing one fails the job, which shows up in MediaPipeline.snapshot().
+
+Run this file directly to generate and record variants for every upload
+already referenced by a profile:
+
+    python api/_media.py
+"""
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+
+VARIANT_WIDTHS = (('thumb', 160), ('card', 480), ('full', 1600))
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'webm'}
+VARIANT_FOLDER = 'variants'
+# Encoder settings per output format; AVIF reaches WebP quality at a lower setting
+ENCODE_OPTIONS = {'avif': {'quality': 50}, 'webp': {'quality': 80, 'method': 4}}
+
+def media_key(url):
+    """Field name for url's entry under gallery_media (MongoDB keys cannot contain dots)"""
+    return url.rsplit('/', 1)[-1].replace('.', '_')
+
+def output_formats():
+    from PIL import features
+    return [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+def extract_poster(video_path, poster_path):
+    """Grab a frame one second in (or the first frame of a shorter clip) as a JPEG"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg not found, cannot make a video poster')
+    for seek in ('1', '0'):
+        subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-ss', seek, '-i', video_path,
+                        '-frames:v', '1', '-q:v', '3', poster_path], check=True, timeout=60)
+        if os.path.exists(poster_path) and os.path.getsize(poster_path):
+            return
+    raise RuntimeError('ffmpeg produced no poster frame')
+
+def render_variants(image_path, storage, stem, formats, scratch_dir):
+    """Store every width/format rendition of image_path; renditions already stored are kept"""
+    from PIL import Image, ImageOps
+
+    variants = {}
+    with Image.open(image_path) as original:
+        # Honour camera rotation before resizing, and drop alpha for formats that mind
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        for label, width in VARIANT_WIDTHS:
+            width = min(width, image.width)
+            height = max(round(image.height * width / image.width), 1)
+            variant = {'width': width}
+            resized = None
+            for fmt in formats:
+                key = f"{VARIANT_FOLDER}/{stem}-{label}.{fmt}"
+                if not storage.exists(key):
+                    if resized is None:
+                        resized = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+                    path = os.path.join(scratch_dir, os.path.basename(key))
+                    resized.save(path, fmt.upper(), **ENCODE_OPTIONS[fmt])
+                    storage.save_file(path, key)
+                variant[fmt] = storage.url(key)
+            variants[label] = variant
+    return variants
+
+def derive(filename, storage):
+    """Generate the variants of an uploaded file and return its media record"""
+    stem, _, ext = filename.rpartition('.')
+    source = filename
+    poster = None
+    # Work files are written next to the uploads when storage is local, so storing them is a rename
+    with tempfile.TemporaryDirectory(prefix='.derive-', dir=storage.scratch_dir) as scratch_dir:
+        if ext.lower() in VIDEO_EXTENSIONS:
+            poster = f"{VARIANT_FOLDER}/{stem}-poster.jpg"
+            if not storage.exists(poster):
+                poster_path = os.path.join(scratch_dir, os.path.basename(poster))
+                with storage.local_path(filename) as video_path:
+                    extract_poster(video_path, poster_path)
+                storage.save_file(poster_path, poster)
+            source = poster
+
+        formats = output_formats()
+        with storage.local_path(source) as source_path:
+            variants = render_variants(source_path, storage, stem, formats, scratch_dir)
+    srcset = {
+        fmt: ', '.join(f"{variant[fmt]} {variant['width']}w" for variant in variants.values())
+        for fmt in formats
+    }
+    return {
+        'poster': storage.url(poster) if poster else None,
+        'variants': variants,
+        'srcset': srcset,
+        'created_at': time.time()
+    }
+
+def record_media(db, url, entry):
+    """Store entry for url and copy it onto the profiles using url; returns their ids"""
+    db.media.replace_one({'_id': url}, entry, upsert=True)
+    user_ids = [u['_id'] for u in db.users.find({'$or': [{'gallery': url}, {'image': url}]}, {'_id': 1})]
+    if user_ids:
+        db.users.update_many({'gallery': url}, {'$set': {f"gallery_media.{media_key(url)}": entry}})
+        db.users.update_many({'image': url}, {'$set': {'image_media': entry}})
+    return user_ids
+
+def lookup_media(db, urls):
+    """Recorded media entries for urls, as {gallery_media key: entry}"""
+    entries = {}
+    for doc in db.media.find({'_id': {'$in': list(urls)}}):
+        entries[media_key(doc.pop('_id'))] = doc
+    return entries
+
+class MediaPipeline:
+    """Bounded queue of derivative jobs served by daemon worker threads.
+
+    on_done(url, entry) is called by the worker after each successful job.
+    The workers start with the first submitted job, so importing the app
+    costs no threads.
+    """
+    def __init__(self, storage, on_done, workers=2, max_queue=256):
+        self.storage = storage
+        self.on_done = on_done
+        self.workers = workers
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.started = False
+        self.lock = threading.Lock()
+        self.running = set()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0}
+        self.total_seconds = 0.0
+        self.recent_failures = []   # last few (filename, error), newest last
+
+    def submit(self, filename):
+        """Queue filename for processing; returns False when the pipeline is off or full"""
+        if self.workers <= 0:
+            return False
+        self.start()
+        try:
+            self.jobs.put_nowait(filename)
+        except queue.Full:
+            # Dropped jobs can be redone later with `python api/_media.py`
+            self.count('dropped')
+            return False
+        self.count('submitted')
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for i in range(self.workers):
+            threading.Thread(target=self.work, name=f"media-worker-{i}", daemon=True).start()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def work(self):
+        while True:
+            filename = self.jobs.get()
+            with self.lock:
+                self.running.add(filename)
+            started = time.perf_counter()
+            try:
+                entry = derive(filename, self.storage)
+                self.on_done(self.storage.url(filename), entry)
+                with self.lock:
+                    self.stats['completed'] += 1
+                    self.total_seconds += time.perf_counter() - started
+            except Exception as e:
+                with self.lock:
+                    self.stats['failed'] += 1
+                    self.recent_failures = self.recent_failures[-9:] + [(filename, str(e))]
+            finally:
+                with self.lock:
+                    self.running.discard(filename)
+                self.jobs.task_done()
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['running'] = sorted(self.running)
+            stats['recent_failures'] = [{'file': f, 'error': e} for f, e in self.recent_failures]
+            completed = stats['completed']
+            stats['avg_seconds'] = round(self.total_seconds / completed, 3) if completed else None
+        stats['workers'] = self.workers if self.started else 0
+        stats['queued'] = self.jobs.qsize()
+        return stats
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+    from _storage import create_storage
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'public', '.env'))
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    database = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+    storage = create_storage(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'assets', 'uploads'))
+
+    urls = set()
+    for user in database.users.find({}, {'gallery': 1, 'image': 1}):
+        for url in list(user.get('gallery') or []) + [user.get('image')]:
+            if storage.key_for(url):
+                urls.add(url)
+
+    failures = 0
+    for url in sorted(urls):
+        filename = storage.key_for(url)
+        if not storage.exists(filename):
+            print(f"[MISSING] {url}")
+            continue
+        try:
+            users = record_media(database, url, derive(filename, storage))
+            print(f"[OK] {url} ({len(users)} profiles)")
+        except Exception as e:
+            failures += 1
+            print(f"[FAIL] {url}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,169 @@
+"""Request and MongoDB metrics in Prometheus text format.
+
+install(app, metrics) times every request from the first before_request
+hook to the last after_request hook (so compression is included) and
+records, per route template and method:
+
+- a latency histogram and a response size histogram;
+- request counts by status code;
+- how many MongoDB commands the request issued and how long they took,
+  collected by CommandTracker, a pymongo CommandListener that must be passed
+  to MongoClient(event_listeners=[...]).
+
+Commands are attributed through a context variable that is only set while a
+request is being handled, so work on background threads (cache refreshes,
+media workers, rehashing) counts towards the per-command totals but not
+towards any route.
+
+Every observation is a bisect into a fixed bucket list plus a few additions
+under one lock, so the middleware is cheap enough to leave on. Numbers are
+per process; Prometheus sums them across workers.
+"""
+import time
+import bisect
+import threading
+import contextvars
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+DB_COMMAND_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50)
+PREFIX = 'sparkconnect'
+
+# [commands, seconds] for the request being handled on this thread, if any
+request_db_usage = contextvars.ContextVar('request_db_usage', default=None)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{labels},le=\"{bound}\"}} {cumulative}")
+        lines.append(f"{name}_sum{{{labels}}} {self.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class CommandTracker(monitoring.CommandListener):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, 'ok')
+
+    def failed(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, 'error')
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}      # (route, method, status) -> count
+        self.latency = {}       # (route, method) -> Histogram
+        self.sizes = {}         # (route, method) -> Histogram
+        self.db_commands = {}   # (route, method) -> Histogram of commands per request
+        self.db_time = {}       # (route, method) -> Histogram of database seconds per request
+        self.commands = {}      # (command, outcome) -> [count, seconds]
+        self.command_listener = CommandTracker(self)
+
+    def observe_command(self, command, seconds, outcome):
+        usage = request_db_usage.get()
+        if usage is not None:
+            usage[0] += 1
+            usage[1] += seconds
+        with self.lock:
+            totals = self.commands.setdefault((command, outcome), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def observe_request(self, route, method, status, seconds, size, db_usage):
+        key = (route, method)
+        with self.lock:
+            self.requests[(route, method, status)] = self.requests.get((route, method, status), 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.sizes[key] = Histogram(SIZE_BUCKETS)
+                self.db_commands[key] = Histogram(DB_COMMAND_BUCKETS)
+                self.db_time[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(seconds)
+            if size is not None:
+                self.sizes[key].observe(size)
+            if db_usage is not None:
+                self.db_commands[key].observe(db_usage[0])
+                self.db_time[key].observe(db_usage[1])
+
+    def render(self):
+        """The current values in Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                f"# HELP {PREFIX}_http_requests_total Requests handled, by route template, method and status.",
+                f"# TYPE {PREFIX}_http_requests_total counter",
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f"{PREFIX}_http_requests_total{{route=\"{label_value(route)}\",method=\"{method}\","
+                             f"status=\"{status}\"}} {count}")
+
+            histograms = (
+                ('http_request_duration_seconds', 'Time from routing to the finished response.', self.latency),
+                ('http_response_size_bytes', 'Response body size as sent, after compression.', self.sizes),
+                ('db_commands_per_request', 'MongoDB commands issued while handling a request.', self.db_commands),
+                ('db_seconds_per_request', 'Time spent in MongoDB commands while handling a request.', self.db_time),
+            )
+            for name, help_text, series in histograms:
+                lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                for (route, method), histogram in sorted(series.items()):
+                    lines.extend(histogram.render(f"{PREFIX}_{name}",
+                                                  f"route=\"{label_value(route)}\",method=\"{method}\""))
+
+            lines.append(f"# HELP {PREFIX}_db_commands_total MongoDB commands, from requests and background work.")
+            lines.append(f"# TYPE {PREFIX}_db_commands_total counter")
+            for (command, outcome), (count, _) in sorted(self.commands.items()):
+                lines.append(f"{PREFIX}_db_commands_total{{command=\"{command}\",outcome=\"{outcome}\"}} {count}")
+            lines.append(f"# HELP {PREFIX}_db_command_seconds_total Time spent in MongoDB commands.")
+            lines.append(f"# TYPE {PREFIX}_db_command_seconds_total counter")
+            for (command, outcome), (_, seconds) in sorted(self.commands.items()):
+                lines.append(f"{PREFIX}_db_command_seconds_total{{command=\"{command}\",outcome=\"{outcome}\"}} "
+                             f"{seconds:.6f}")
+        return '\n'.join(lines) + '\n'
+
+def install(app, metrics):
+    """Register the timing hooks. Call before any other before/after_request
+    registration so the measurement wraps them."""
+    from flask import request, g
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_usage = [0, 0.0]
+        g.metrics_db_token = request_db_usage.set(g.metrics_db_usage)
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        request_db_usage.reset(g.pop('metrics_db_token'))
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.observe_request(route, request.method, response.status_code,
+                                time.perf_counter() - started, size, g.pop('metrics_db_usage'))
+        return response
@@ -0,0 +1,144 @@
+"""Password hashing off the request path.
+
+Hashing is deliberately expensive, so it runs on a small bounded pool
+instead of inline in the view. hash() and verify() still wait for the result,
+so the request thread is blocked for as long as the hash takes; what the pool
+adds is a cap on how many hashes run at once. When more than max_queue hashes
+are already waiting, the caller gets HasherBusy right away and the route
+answers 503 instead of stalling every other request behind a burst of logins.
+
+Configuration (environment):
+    PASSWORD_HASH_METHOD  werkzeug method string, e.g. scrypt:32768:8:1 or
+                          pbkdf2:sha256:600000 (default: werkzeug's scrypt)
+    HASH_POOL             thread (default) or process. hashlib releases the
+                          GIL, so threads are enough unless the method is
+                          pure Python.
+    HASH_WORKERS          pool size (default: CPU count)
+    HASH_MAX_QUEUE        hashes allowed to wait for a worker (default 32)
+
+Stored hashes made with different parameters are upgraded transparently:
+after a successful login, needs_rehash() tells the caller to store a new
+hash, which is computed in the background.
+
+Run this file directly for a throughput and latency micro-benchmark.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+def method_prefix(method):
+    """The method as werkzeug writes it into a hash, with its defaults filled in"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args or (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    return method
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', workers=None, max_queue=32, use_processes=False):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=self.workers)
+        # Running plus waiting hashes; a semaphore keeps the bound without a lock around submit
+        self.slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self.method_prefix = method_prefix(method)
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method).result()
+
+    def verify(self, password_hash, password):
+        if not password_hash or not password:
+            return False
+        return self.run(check_password_hash, password_hash, password).result()
+
+    def needs_rehash(self, password_hash):
+        """True when password_hash was made with other parameters than the configured method"""
+        return password_hash.split('$', 1)[0] != self.method_prefix
+
+    def rehash_later(self, password, save):
+        """Hash password in the background and pass the result to save(); skipped when busy"""
+        try:
+            future = self.run(generate_password_hash, password, self.method)
+        except HasherBusy:
+            return
+        future.add_done_callback(lambda f: f.exception() is None and save(f.result()))
+
+def create_hasher():
+    return PasswordHasher(
+        method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=int(os.environ.get('HASH_WORKERS', 0)) or None,
+        max_queue=int(os.environ.get('HASH_MAX_QUEUE', 32)),
+        use_processes=os.environ.get('HASH_POOL', 'thread') == 'process'
+    )
+
+if __name__ == '__main__':
+    import sys
+    import json
+    import time
+
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    concurrency = 32
+    stored = generate_password_hash('password')
+    page = {'electricians': [{'name': f"Electrician {i}", 'rating': 4.5, 'description': 'x' * 200} for i in range(50)]}
+
+    def light_route_latencies(stop):
+        # Stand-in for a non-auth route: serialize a directory page, repeatedly
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            json.dumps(page)
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.005)
+        return sorted(latencies)
+
+    def run(label, verify):
+        stop = threading.Event()
+        result = {}
+        probe = threading.Thread(target=lambda: result.setdefault('lat', light_route_latencies(stop)))
+        probe.start()
+        counts = {'ok': 0, 'busy': 0}
+        lock = threading.Lock()
+
+        def login():
+            try:
+                verify(stored, 'password')
+                outcome = 'ok'
+            except HasherBusy:
+                outcome = 'busy'
+            with lock:
+                counts[outcome] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            for _ in range(logins):
+                clients.submit(login)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        probe.join()
+        lat = result['lat']
+        print(f"{label}: {counts['ok'] / elapsed:.1f} logins/s ({counts['busy']} shed with 503), "
+              f"non-auth p50 {lat[len(lat) // 2]:.2f} ms p95 {lat[int(len(lat) * 0.95)]:.2f} ms")
+
+    run('inline', check_password_hash)
+    hasher = PasswordHasher(max_queue=8)
+    run(f"pool ({hasher.workers} workers, queue 8)", hasher.verify)
@@ -0,0 +1,88 @@
+"""Keep an in-memory structure built from MongoDB, rebuilt off the request path.
+
+The search index and the leaderboards are built from a full read of the
+profiles and then kept current by this process's own writes; a periodic
+rebuild picks up writes made by other instances. A rebuild takes seconds on
+a large directory, so only the very first one (when there is nothing to
+serve yet) runs on a request. After that, a request that finds the
+structure older than its TTL starts one rebuild on a background thread and
+is answered from the current structure, as is every request until the new
+one is swapped in.
+
+Writes go through apply(), which updates the live structure and, while a
+rebuild is running, also queues the change. The queue is replayed onto the
+rebuilt structure after the swap, so a profile updated while the rebuild was
+reading the collection is not reverted. add() and remove() replace whole
+entries, so replaying a change the rebuild already saw is harmless.
+"""
+import time
+import threading
+
+class BackgroundRebuild:
+    def __init__(self, structure, load, ttl, label):
+        self.structure = structure  # has build(docs)
+        self.load = load            # returns the documents to build from
+        self.ttl = ttl
+        self.label = label
+        self.built_at = None
+        self.rebuilding = False
+        self.pending = None         # changes made during a rebuild, replayed after it
+        self.lock = threading.Lock()
+        self.first_build_lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self.built_at is not None
+
+    def get(self):
+        """The structure; blocks only until the first build is done"""
+        if self.built_at is None:
+            with self.first_build_lock:
+                if self.built_at is None:
+                    self.rebuild()
+        elif time.time() - self.built_at > self.ttl:
+            self.start()
+        return self.structure
+
+    def start(self):
+        """Start a background rebuild unless one is already running"""
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.run, name=f"rebuild-{self.label}", daemon=True).start()
+
+    def run(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            # The current structure keeps serving; the next request past the TTL retries
+            print(f"Background {self.label} rebuild failed: {e}")
+        finally:
+            with self.lock:
+                self.rebuilding = False
+
+    def rebuild(self):
+        started = time.time()
+        with self.lock:
+            self.pending = []
+        try:
+            self.structure.build(self.load())
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        # Under the lock, so no write lands between the replay and the switch to direct updates
+        with self.lock:
+            for operation in self.pending:
+                operation(self.structure)
+            self.pending = None
+            self.built_at = started
+
+    def apply(self, operation):
+        """Run operation(structure) now if built, and again after a rebuild in progress"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(operation)
+            if self.built_at is not None:
+                operation(self.structure)
@@ -0,0 +1,295 @@
+"""In-memory relevance search over electrician profiles.
+
+An inverted index over name, specialty, location/state and description with
+prefix matching (sorted vocabulary + bisect) and single-edit typo tolerance
+(symmetric-delete lookup). Results are ranked by text relevance blended with
+rating. The index is updated incrementally by the write routes and answers
+queries without touching MongoDB.
+
+Run this file directly to benchmark query latency on synthetic profiles:
+
+    python api/_search.py 100000
+"""
+import re
+import math
+import heapq
+import bisect
+import threading
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = {'a', 'an', 'and', 'am', 'are', 'at', 'for', 'from', 'i', 'in', 'is', 'my', 'of', 'on', 'or',
+             'the', 'to', 'we', 'with'}
+
+# Field weights: a hit in the name or specialty says more than one in the bio
+FIELD_WEIGHTS = {'name': 3.0, 'specialty': 2.5, 'location': 1.5, 'state': 1.5, 'description': 1.0}
+# Summed field weight at which a term counts as a full-strength match
+FULL_MATCH_WEIGHT = 3.0
+# How much an exact, prefix or one-typo term match counts towards relevance
+EXACT_MATCH, PREFIX_MATCH, FUZZY_MATCH = 1.0, 0.7, 0.5
+# Tokens shorter than this never get typo tolerance ("ac" must not match "dc")
+MIN_FUZZY_LENGTH = 4
+# Share of the score that comes from rating rather than text relevance
+RATING_WEIGHT = 0.2
+# Listing fields kept per profile so results are served straight from memory
+SUMMARY_FIELDS = ('name', 'specialty', 'state', 'location', 'description', 'image', 'image_media', 'rating',
+                  'reviews')
+
+def listing_summary(doc):
+    """The listing fields doc has; missing ones are left out, as public() leaves them out of listings"""
+    return {field: doc[field] for field in SUMMARY_FIELDS if field in doc}
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+
+def deletes(token):
+    """All variants of token with one character removed"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+def within_one_edit(a, b):
+    """True when a and b differ by one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]
+    if la > lb:
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+def term_scores(doc):
+    """Static per-term score of a profile: field relevance blended with rating, in [0, 1]"""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(doc.get(field)):
+            weights[token] = weights.get(token, 0) + weight
+    rating = min(max(float(doc.get('rating') or 0), 0), 5)
+    return {
+        term: (1 - RATING_WEIGHT) * min(weight / FULL_MATCH_WEIGHT, 1) + RATING_WEIGHT * rating / 5
+        for term, weight in weights.items()
+    }
+
+def scaled(ranked, quality):
+    """Walk a ranked posting best-first with every score multiplied by quality"""
+    for neg, doc_id in ranked:
+        yield neg * quality, doc_id
+
+class SearchIndex:
+    """Inverted index with score-ordered postings.
+
+    postings[term] maps doc_id -> static score for random access, and
+    ranked[term] holds the same entries as a sorted list of (-score, doc_id)
+    so queries can walk each term best-first and stop early (Fagin's
+    threshold algorithm) instead of scoring every matching profile.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}      # term -> {doc_id: score}
+        self.ranked = {}        # term -> [(-score, doc_id), ...] ascending
+        self.docs = {}          # doc_id -> listing summary
+        self.doc_terms = {}     # doc_id -> terms, for removal
+        self.vocabulary = []    # sorted terms, for prefix ranges
+        self.delete_map = {}    # one-deletion variant -> set of terms
+
+    def __len__(self):
+        return len(self.docs)
+
+    def build(self, docs):
+        """Replace the whole index; sorts each posting once instead of per insert"""
+        postings, docs_by_id, doc_terms = {}, {}, {}
+        for doc in docs:
+            doc_id = str(doc.get('id') or doc['_id'])
+            docs_by_id[doc_id] = listing_summary(doc)
+            scores = term_scores(doc)
+            doc_terms[doc_id] = tuple(scores)
+            for term, score in scores.items():
+                postings.setdefault(term, {})[doc_id] = score
+
+        delete_map = {}
+        for term in postings:
+            for variant in deletes(term) | {term}:
+                delete_map.setdefault(variant, set()).add(term)
+
+        ranked = {term: sorted((-score, doc_id) for doc_id, score in posting.items())
+                  for term, posting in postings.items()}
+        vocabulary = sorted(postings)
+        # Everything above runs outside the lock, so searches keep answering from the old index until the swap
+        with self.lock:
+            self.postings = postings
+            self.ranked = ranked
+            self.docs = docs_by_id
+            self.doc_terms = doc_terms
+            self.vocabulary = vocabulary
+            self.delete_map = delete_map
+
+    def add(self, doc):
+        """Insert or replace a profile. doc needs an 'id' or '_id' key."""
+        doc_id = str(doc.get('id') or doc['_id'])
+        scores = term_scores(doc)
+        with self.lock:
+            self.remove(doc_id)
+            self.docs[doc_id] = listing_summary(doc)
+            self.doc_terms[doc_id] = tuple(scores)
+            for term, score in scores.items():
+                if term not in self.postings:
+                    self.postings[term] = {}
+                    self.ranked[term] = []
+                    bisect.insort(self.vocabulary, term)
+                    for variant in deletes(term) | {term}:
+                        self.delete_map.setdefault(variant, set()).add(term)
+                self.postings[term][doc_id] = score
+                bisect.insort(self.ranked[term], (-score, doc_id))
+
+    def remove(self, doc_id):
+        doc_id = str(doc_id)
+        with self.lock:
+            self.docs.pop(doc_id, None)
+            for term in self.doc_terms.pop(doc_id, ()):
+                score = self.postings[term].pop(doc_id)
+                ranked = self.ranked[term]
+                del ranked[bisect.bisect_left(ranked, (-score, doc_id))]
+                if not ranked:
+                    del self.postings[term]
+                    del self.ranked[term]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+                    for variant in deletes(term) | {term}:
+                        terms = self.delete_map.get(variant)
+                        if terms is not None:
+                            terms.discard(term)
+                            if not terms:
+                                del self.delete_map[variant]
+
+    def expand(self, token):
+        """Map a query token to [(term, match quality), ...] over the vocabulary"""
+        matches = {}
+        if token in self.postings:
+            matches[token] = EXACT_MATCH
+        start = bisect.bisect_left(self.vocabulary, token)
+        for term in self.vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            matches.setdefault(term, PREFIX_MATCH)
+        if len(token) >= MIN_FUZZY_LENGTH:
+            for variant in deletes(token) | {token}:
+                for term in self.delete_map.get(variant, ()):
+                    if term not in matches and within_one_edit(token, term):
+                        matches[term] = FUZZY_MATCH
+        return list(matches.items())
+
+    def search(self, query, limit=20, offset=0, predicate=None):
+        """Return the summaries of the best offset:offset+limit matches for query.
+
+        A profile's score is the idf-weighted mean of its per-token scores,
+        scaled down by the square of the share of query tokens it matches.
+        predicate, if given, is called with a summary and filters candidates.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or limit <= 0:
+            return []
+        wanted = offset + limit
+
+        with self.lock:
+            total_docs = len(self.docs) or 1
+            expansions, idfs, streams = [], [], []
+            for token in tokens:
+                matches = self.expand(token)
+                expansions.append(matches)
+                df = max((len(self.postings[term]) for term, _ in matches), default=total_docs)
+                idfs.append(math.log(1 + total_docs / df))
+                streams.append(heapq.merge(*[scaled(self.ranked[term], quality) for term, quality in matches]))
+            idf_total = sum(idfs) or 1.0
+
+            def score(doc_id):
+                total, matched = 0.0, 0
+                for matches, idf in zip(expansions, idfs):
+                    best = max((q * self.postings[t].get(doc_id, 0) for t, q in matches), default=0)
+                    if best:
+                        total += idf * best
+                        matched += 1
+                return (total / idf_total) * (matched / len(tokens)) ** 2
+
+            top, seen = [], set()      # top is a min-heap of (score, doc_id)
+            frontier = [1.0] * len(streams)
+            live = list(range(len(streams)))
+            while live:
+                for i in list(live):
+                    entry = next(streams[i], None)
+                    if entry is None:
+                        frontier[i] = 0.0
+                        live.remove(i)
+                        continue
+                    frontier[i] = -entry[0]
+                    doc_id = entry[1]
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    if predicate and not predicate(self.docs[doc_id]):
+                        continue
+                    item = (score(doc_id), doc_id)
+                    if len(top) < wanted:
+                        heapq.heappush(top, item)
+                    elif item > top[0]:
+                        heapq.heapreplace(top, item)
+                # No unseen profile can beat the current k-th best once the frontier drops below it
+                threshold = sum(idf * f for idf, f in zip(idfs, frontier)) / idf_total
+                if len(top) >= wanted and top[0][0] >= threshold:
+                    break
+
+            results = []
+            for _, doc_id in sorted(top, reverse=True)[offset:]:
+                summary = dict(self.docs[doc_id])
+                summary['id'] = doc_id
+                results.append(summary)
+            return results
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import random
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(42)
+    first_names = ['Sarah', 'Michael', 'Chinedu', 'Aisha', 'Emeka', 'Tunde', 'Ngozi', 'Ibrahim', 'Femi', 'Zainab']
+    surnames = ['Johnson', 'Okafor', 'Bello', 'Adeyemi', 'Musa', 'Eze', 'Okonkwo', 'Abubakar', 'Balogun', 'Nwosu']
+    specialties = ['Solar Panel Installer', 'Inverter Technician', 'Residential Wiring', 'Commercial Systems',
+                   'Industrial Electrician', 'Generator Repair', 'Earthing and Surge Protection', 'LED Lighting']
+    states = ['Lagos', 'Kano', 'FCT - Abuja', 'Rivers', 'Oyo', 'Enugu', 'Kaduna', 'Delta', 'Ogun', 'Anambra']
+    words = ['experienced', 'certified', 'reliable', 'installation', 'maintenance', 'repair', 'homes', 'offices',
+             'factories', 'fast', 'affordable', 'wiring', 'panels', 'batteries', 'meters', 'rewiring']
+
+    profiles = []
+    for i in range(size):
+        state = random.choice(states)
+        profiles.append({
+            'id': str(i),
+            'name': f"{random.choice(first_names)} {random.choice(surnames)}",
+            'specialty': random.choice(specialties),
+            'state': state,
+            'location': f"{state}, Nigeria",
+            'description': ' '.join(random.sample(words, 8)),
+            'rating': round(random.uniform(0, 5), 1),
+        })
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.build(profiles)
+    print(f"Indexed {size} profiles in {time.perf_counter() - started:.1f}s")
+
+    queries = ['Solar Panel Installer', 'Inverter', 'invertor', 'wiring lagos', 'gen', 'earthing',
+               'Chinedu Okafor', 'industrial kano', 'led lighting', 'surge protection']
+    timings = []
+    for _ in range(20):
+        for q in queries:
+            started = time.perf_counter()
+            index.search(q, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{len(timings)} queries: p50 {timings[len(timings) // 2]:.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms, max {timings[-1]:.2f} ms")
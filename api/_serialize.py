@@ -0,0 +1,216 @@
+"""Public response shapes for electrician profiles, and fast JSON encoding.
+
+A profile document holds things no client should see (the password hash,
+rating_sum, session_version, the geo fields, signup_method), so responses
+are built from a whitelist instead of by deleting the private keys: a field
+added to the collection later stays private until it is listed here.
+
+- LISTING_FIELDS is what directory cards show and what a listing returns by
+  default; LISTING_OPTIONAL_FIELDS can be asked for on top. PROFILE_FIELDS
+  is what a profile page gets, and OWNER_FIELDS what /api/auth/me returns.
+- A listing request may narrow or widen that with ?fields=name,rating. id is
+  always included, and an unknown name is a 400 rather than silently dropped.
+- field_projection() turns a field list into a MongoDB inclusion
+  projection, so unrequested fields never leave the database.
+
+JSON goes through orjson when it is installed (several times faster than
+the standard library and returns bytes directly), with the standard library
+as the fallback. FastJSONProvider plugs that into Flask's jsonify, and
+stream_array() encodes a cursor into a chunked response body a bounded batch
+at a time, so exporting the whole directory never holds it in memory.
+
+Run this file directly to compare the old path (list(), serialize_doc,
+json.dumps) with the new one on synthetic profiles:
+
+    python api/_serialize.py 10000 100000
+"""
+import json
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LISTING_FIELDS = ('name', 'specialty', 'state', 'location', 'description', 'image', 'image_media', 'rating',
+                  'reviews')
+# Public, but only sent when asked for with ?fields=
+LISTING_OPTIONAL_FIELDS = ('phone', 'whatsapp', 'email', 'distance_km')
+# A profile page adds contact details, the gallery and the latest reviews
+PROFILE_FIELDS = LISTING_FIELDS + ('phone', 'whatsapp', 'email', 'gallery', 'gallery_media', 'reviewsList')
+# Fields computed by the route rather than read from the document
+COMPUTED_FIELDS = {'distance_km', 'reviewsList'}
+# The logged-in user's own profile, for the dashboard: what their profile page shows, without the reviews
+OWNER_FIELDS = tuple(name for name in PROFILE_FIELDS if name not in COMPUTED_FIELDS)
+# Streamed bodies are yielded in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+if orjson is not None:
+    # Datetimes go through default() so they keep Flask's HTTP-date format
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+def select_fields(value, default=LISTING_FIELDS, allowed=LISTING_FIELDS + LISTING_OPTIONAL_FIELDS):
+    """The fields named by a ?fields= value, in whitelist order; default when it is empty.
+
+    Raises ValueError with the message for a 400.
+    """
+    requested = {name.strip() for name in (value or '').split(',') if name.strip()}
+    requested.discard('id')
+    if not requested:
+        return tuple(default)
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}; expected any of: {', '.join(allowed)}")
+    return tuple(name for name in allowed if name in requested)
+
+def field_projection(fields, *extra):
+    """MongoDB inclusion projection for fields, plus extra fields the route needs itself"""
+    included = {name: 1 for name in fields if name not in COMPUTED_FIELDS}
+    included.update((name, 1) for name in extra if name != '_id')
+    return included
+
+def public(doc, fields):
+    """The whitelisted fields of doc, with id first; missing fields are left out"""
+    body = {'id': str(doc['_id']) if '_id' in doc else doc['id']}
+    for name in fields:
+        if name in doc:
+            body[name] = doc[name]
+    return body
+
+def default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    return DefaultJSONProvider.default(obj)
+
+def dumps(obj):
+    """Compact JSON bytes for obj"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False).encode()
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify through dumps(); calls with extra json.dumps arguments keep the standard library"""
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', default)
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+def stream_array(key, items, extra=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield {"key": [items...], **extra} as JSON in chunks of about chunk_size bytes.
+
+    items is consumed lazily (a cursor mapped through public(), typically), so
+    memory stays at one chunk plus the driver's current batch.
+    """
+    buffer = bytearray(b'{' + dumps(key) + b':[')
+    first = True
+    for item in items:
+        if not first:
+            buffer += b','
+        buffer += dumps(item)
+        first = False
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']'
+    for name, value in (extra or {}).items():
+        buffer += b',' + dumps(name) + b':' + dumps(value)
+    buffer += b'}\n'
+    yield bytes(buffer)
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import random
+    import tracemalloc
+
+    import bson
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    random.seed(42)
+    # The projection index.py used before the whitelist, and the old serializer
+    old_projection = {'password': 0, 'rating_sum': 0, 'reviews_data': 0, 'gallery': 0, 'gallery_media': 0}
+
+    def serialize_doc(doc):
+        doc['id'] = str(doc['_id'])
+        del doc['_id']
+        return doc
+
+    def profile(i):
+        reviews = random.randint(0, 200)
+        return {
+            '_id': ObjectId(),
+            'name': f"Electrician {i}",
+            'email': f"electrician{i}@example.com",
+            'password': 'scrypt:32768:8:1$' + 'x' * 80,
+            'phone': f"080{i:08d}",
+            'whatsapp': f"080{i:08d}",
+            'specialty': random.choice(['Solar Panel Installer', 'Inverter Technician', 'Residential Wiring']),
+            'state': random.choice(['Lagos', 'Kano', 'FCT - Abuja', 'Rivers', 'Oyo']),
+            'location': 'Ikeja',
+            'description': 'Certified electrician with ten years of residential and commercial experience. ' * 3,
+            'image': f"/assets/uploads/{i}.jpg",
+            'image_media': {'w320': f"/assets/uploads/{i}-320.webp", 'w640': f"/assets/uploads/{i}-640.webp"},
+            'rating': round(random.uniform(1, 5), 1),
+            'reviews': reviews,
+            'rating_sum': reviews * 4,
+            'signup_method': 'email',
+            'session_version': 1,
+            'geo': {'type': 'Point', 'coordinates': [3.35, 6.6]},
+            'geo_cell': 'lagos/ikeja',
+            'geo_precision': 'lga',
+            'gallery': [f"/assets/uploads/{i}-{n}.jpg" for n in range(3)],
+        }
+
+    def projected(doc, spec):
+        """BSON for doc as MongoDB would send it under spec"""
+        if any(spec.values()):
+            doc = {name: value for name, value in doc.items() if name == '_id' or spec.get(name)}
+        else:
+            doc = {name: value for name, value in doc.items() if name not in spec}
+        return bson.encode(doc)
+
+    def old_path(raw):
+        # list(cursor), then serialize_doc and jsonify (sorted keys) over the whole list
+        docs = [bson.decode(data) for data in raw]
+        body = json.dumps({'electricians': [serialize_doc(doc) for doc in docs], 'next_cursor': None},
+                          sort_keys=True, separators=(',', ':')) + '\n'
+        return len(body.encode())
+
+    def new_path(raw):
+        # cursor -> public() -> stream_array, consumed the way a WSGI server sends it
+        docs = (public(bson.decode(data), LISTING_FIELDS) for data in raw)
+        return sum(len(chunk) for chunk in stream_array('electricians', docs))
+
+    def measure(run, raw):
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = run(raw)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Throughput without tracemalloc's overhead
+        started = time.perf_counter()
+        run(raw)
+        untraced = time.perf_counter() - started
+        return size, peak, untraced or elapsed
+
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'json (install orjson for the fast path)'}")
+    for size in sizes:
+        docs = [profile(i) for i in range(size)]
+        # Both paths start from the bytes the driver would receive
+        old_raw = [projected(doc, old_projection) for doc in docs]
+        new_raw = [projected(doc, field_projection(LISTING_FIELDS)) for doc in docs]
+        del docs
+        for label, run, raw in (('old', old_path, old_raw), ('new', new_path, new_raw)):
+            body, peak, seconds = measure(run, raw)
+            print(f"{size:>7} profiles, {label}: body {body / 1e6:6.1f} MB, peak memory {peak / 1e6:7.1f} MB, "
+                  f"{size / seconds:>9,.0f} profiles/s, {body / 1e6 / seconds:6.1f} MB/s")
@@ -0,0 +1,252 @@
+"""Static file serving for local runs of api/index.py.
+
+Deployments serve the site from Vercel's CDN; this is what `python
+api/index.py` uses instead of send_from_directory:
+
+- file metadata (size, mtime, ETag, content type, precompressed siblings) is
+  kept in memory and re-checked with one stat() at most every
+  revalidate_interval seconds, so a hit normally touches the disk only to
+  read the body; missing paths are cached the same way, in an LRU of at
+  most max_entries paths so requests for random URLs cannot grow it;
+- responses carry ETag and Last-Modified, and If-None-Match /
+  If-Modified-Since get a 304;
+- a single byte range (Range, honouring If-Range) gets a 206, so gallery
+  videos can be seeked without downloading the whole file; several ranges
+  get the whole file and an unsatisfiable one gets a 416;
+- a .br or .gz sibling written by build_static.py is sent with its
+  Content-Encoding when the client accepts it and it is not older than
+  the file;
+- bodies go through the server's wsgi.file_wrapper when it has one
+  (gunicorn sends it with sendfile), otherwise they are read in blocks;
+  either way the file is never read into memory whole.
+
+Dotfiles and server-side files (.py, .db, .env) are never served, even
+though public/ contains some.
+"""
+import os
+import re
+import time
+import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date, is_resource_modified, parse_range_header
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response
+
+BLOCK_SIZE = 64 * 1024
+# Paths whose metadata (or absence) is remembered, least recently used evicted first
+MAX_ENTRIES = 4096
+# build_static.py names fingerprinted files name.<10 hex digits>.ext; they never change
+FINGERPRINTED_RE = re.compile(r'\.[0-9a-f]{10}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+HIDDEN_EXTENSIONS = {'.py', '.pyc', '.db', '.env', '.log'}
+# (Content-Encoding, file suffix), best first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+# Servers whose file_wrapper stops at Content-Length; others (wsgiref) send to the end of the file,
+# so byte ranges are only handed to these
+RANGE_FILE_WRAPPER_SERVERS = ('gunicorn',)
+
+def accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    return accepted
+
+def hidden(rel):
+    parts = rel.split('/')
+    return any(part.startswith('.') for part in parts) or os.path.splitext(parts[-1])[1].lower() in HIDDEN_EXTENSIONS
+
+def read_blocks(f, start, length):
+    """Yield length bytes of f from start, then close it"""
+    try:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+class StaticFiles:
+    def __init__(self, root, fallback='index.html', revalidate_interval=1.0, max_entries=MAX_ENTRIES):
+        self.root = os.path.abspath(root)
+        self.fallback = fallback
+        self.revalidate_interval = revalidate_interval
+        self.max_entries = max_entries
+        # relative path -> (monotonic time of the last stat(), metadata dict or None when missing)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'stat_calls': 0, 'not_modified': 0, 'partial': 0, 'precompressed': 0,
+                      'file_wrapper': 0}
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def stat(self, path):
+        self.count('stat_calls')
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def lookup(self, rel):
+        """Metadata for rel, or None when it does not exist or must not be served"""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.entries.get(rel)
+            if cached is not None:
+                self.entries.move_to_end(rel)
+        if cached is not None and now - cached[0] < self.revalidate_interval:
+            return cached[1]
+
+        path = safe_join(self.root, rel)
+        if path is None:
+            entry = None
+        else:
+            st = self.stat(path)
+            entry = cached[1] if cached is not None else None
+            if st is None or not os.path.isfile(path):
+                entry = None
+            elif entry is None or entry['mtime_ns'] != st.st_mtime_ns or entry['size'] != st.st_size:
+                entry = self.describe(path, st)
+        with self.lock:
+            self.entries[rel] = (now, entry)
+            self.entries.move_to_end(rel)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def describe(self, path, st):
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        variants = {}
+        for encoding, suffix in PRECOMPRESSED:
+            variant = self.stat(path + suffix)
+            # A sibling older than the file is left over from an earlier build
+            if variant is not None and variant.st_mtime_ns >= st.st_mtime_ns:
+                variants[encoding] = (path + suffix, variant.st_size)
+        return {
+            'path': path,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'etag': f"{st.st_mtime_ns:x}-{st.st_size:x}",
+            'last_modified': datetime.fromtimestamp(int(st.st_mtime), timezone.utc),
+            'content_type': content_type,
+            'cache_control': IMMUTABLE if FINGERPRINTED_RE.search(path) else REVALIDATE,
+            'variants': variants
+        }
+
+    def resolve(self, rel):
+        if hidden(rel):
+            return None
+        entry = self.lookup(rel)
+        if entry is None and self.fallback and not os.path.splitext(rel)[1]:
+            # Extension-less paths are page routes; missing assets stay 404s
+            entry = self.lookup(self.fallback)
+        return entry
+
+    def serve(self, rel, environ, headers):
+        """Response for rel (relative to root) given the request's WSGI environ and headers"""
+        self.count('requests')
+        entry = self.resolve(rel.lstrip('/'))
+        if entry is None:
+            return Response('Not Found', 404, mimetype='text/plain')
+
+        encoding, path, size, etag = None, entry['path'], entry['size'], entry['etag']
+        byte_range = headers.get('Range')
+        if entry['variants'] and not byte_range:
+            accepted = accepted_encodings(headers.get('Accept-Encoding', ''))
+            for candidate, _ in PRECOMPRESSED:
+                if candidate in entry['variants'] and candidate in accepted:
+                    encoding = candidate
+                    path, size = entry['variants'][candidate]
+                    etag = f"{etag}-{candidate}"
+                    break
+
+        response = Response(content_type=entry['content_type'], direct_passthrough=True)
+        response.set_etag(etag)
+        response.headers['Last-Modified'] = http_date(entry['last_modified'])
+        response.headers['Cache-Control'] = entry['cache_control']
+        response.headers['Accept-Ranges'] = 'bytes'
+        if entry['variants']:
+            response.vary.add('Accept-Encoding')
+
+        if not is_resource_modified(environ, etag=etag, last_modified=entry['last_modified']):
+            self.count('not_modified')
+            response.status_code = 304
+            return response
+
+        start, length = 0, size
+        if byte_range and self.if_range_matches(headers.get('If-Range'), entry):
+            parsed = parse_range_header(byte_range)
+            span = parsed.range_for_length(size) if parsed else None
+            if span is not None:
+                start, length = span[0], span[1] - span[0]
+                response.status_code = 206
+                response.headers['Content-Range'] = f"bytes {span[0]}-{span[1] - 1}/{size}"
+                self.count('partial')
+            elif parsed is not None and len(parsed.ranges) == 1:
+                response.status_code = 416
+                response.headers['Content-Range'] = f"bytes */{size}"
+                return response
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            self.count('precompressed')
+        response.headers['Content-Length'] = str(length)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return response
+
+        f = open(path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if length != size and not environ.get('SERVER_SOFTWARE', '').startswith(RANGE_FILE_WRAPPER_SERVERS):
+            file_wrapper = None
+        if file_wrapper is not None:
+            # The server sends Content-Length bytes from the current position, with sendfile where it can
+            f.seek(start)
+            response.response = file_wrapper(f, BLOCK_SIZE)
+            self.count('file_wrapper')
+        else:
+            response.response = read_blocks(f, start, length)
+        return response
+
+    @staticmethod
+    def if_range_matches(if_range, entry):
+        """Range applies when there is no If-Range, or it names the current version"""
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range.strip('"') == entry['etag']
+        return if_range == http_date(entry['last_modified'])
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['cached_paths'] = len(self.entries)
+        return stats
+
+def install(app, root, uploads_root=None, uploads_prefix='assets/uploads/'):
+    """Serve root at / on app; uploads_prefix comes from uploads_root, which runtime uploads write to"""
+    from flask import request
+
+    site = StaticFiles(root)
+    uploads = StaticFiles(uploads_root, fallback=None) if uploads_root else None
+
+    @app.route('/', defaults={'path': 'index.html'})
+    @app.route('/<path:path>')
+    def serve_static(path):
+        if uploads is not None and path.startswith(uploads_prefix):
+            return uploads.serve(path[len(uploads_prefix):], request.environ, request.headers)
+        return site.serve(path, request.environ, request.headers)
+
+    return site
@@ -0,0 +1,270 @@
+"""Storage backends for uploaded media.
+
+Everything that reads or writes upload bytes (the upload routes, resumable
+uploads, the media workers and the orphan collector) goes through one of
+these, addressing files by key: the path under the upload root, such as
+'<sha256>.jpg' or 'variants/<sha256>-thumb.webp'. Profiles store the URL
+that url(key) returns.
+
+- LocalStorage keeps files in public/assets/uploads, as before, with URLs
+  like assets/uploads/<key>. It needs a writable disk, which serverless
+  functions do not have.
+- S3Storage keeps them in an S3-compatible bucket (AWS S3, MinIO, R2...)
+  under a key prefix, with URLs on the bucket or a CDN in front of it
+  (S3_PUBLIC_URL). boto3 (in requirements.txt) is only imported once the
+  bucket is first used.
+
+S3Storage also supports direct uploads: presign_upload() returns a
+presigned POST that the browser sends straight to the bucket, limited to one
+key, one content type and a size range, so upload bytes never pass through
+the API. The bucket needs a CORS rule allowing POST from the site's origin.
+Direct uploads cannot be content-addressed (the server never sees the bytes)
+and get random keys instead.
+
+Select the backend with STORAGE_BACKEND=local|s3; S3 takes S3_BUCKET,
+S3_PREFIX (default uploads/), S3_ENDPOINT_URL (for MinIO and other
+non-AWS services), S3_REGION and S3_PUBLIC_URL, with credentials from the
+usual AWS_* variables.
+"""
+import os
+import shutil
+import importlib.util
+import mimetypes
+import tempfile
+import functools
+import contextlib
+
+from _uploads import store_stream
+
+UPLOAD_URL_PREFIX = 'assets/uploads/'
+# Keys never change content: content-addressed uploads, random direct-upload keys and their variants
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+def content_type_for(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+class LocalStorage:
+    direct_uploads = False
+
+    def __init__(self, root, url_prefix=UPLOAD_URL_PREFIX, quarantine_dir=None):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.quarantine_dir = quarantine_dir
+
+    @property
+    def scratch_dir(self):
+        """Where work files go, so finished ones are renamed into place rather than copied"""
+        os.makedirs(self.root, exist_ok=True)
+        return self.root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def url(self, key):
+        return self.url_prefix + key
+
+    def key_for(self, url):
+        """The key behind url, or None when url is not stored here"""
+        if isinstance(url, str) and url.startswith(self.url_prefix):
+            return url[len(self.url_prefix):]
+        return None
+
+    def save_stream(self, stream, ext, max_bytes):
+        """Store a file object under its content hash; returns the key"""
+        return store_stream(stream, ext, self.root, max_bytes)
+
+    def save_file(self, path, key):
+        """Move the local file at path to key"""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    def size(self, key):
+        """Size of key in bytes, or None when it does not exist"""
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    @contextlib.contextmanager
+    def local_path(self, key):
+        """A local file with key's bytes, for tools that need a path"""
+        yield self.path(key)
+
+    def move(self, key, target_key):
+        os.replace(self.path(key), self.path(target_key))
+
+    def delete(self, key):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(key))
+
+    def quarantine(self, key, target):
+        """Move key to target, a path under the quarantine folder"""
+        target = os.path.join(self.quarantine_dir, target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(self.path(key), target)
+
+    def quarantine_folders(self):
+        if not self.quarantine_dir or not os.path.isdir(self.quarantine_dir):
+            return []
+        return [entry.name for entry in os.scandir(self.quarantine_dir) if entry.is_dir()]
+
+    def purge_quarantine(self, folder):
+        shutil.rmtree(os.path.join(self.quarantine_dir, folder), ignore_errors=True)
+
+    def list_files(self):
+        """(key, size, mtime) for every upload, not counting variants or work files"""
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                yield entry.name, stat.st_size, stat.st_mtime
+
+class S3Storage:
+    direct_uploads = True
+    scratch_dir = None
+    QUARANTINE_PREFIX = 'quarantine/'
+
+    def __init__(self, bucket, prefix='uploads/', endpoint_url=None, region=None, public_url=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        if public_url is None:
+            public_url = f"{endpoint_url.rstrip('/')}/{bucket}" if endpoint_url else \
+                f"https://{bucket}.s3.{region or 'us-east-1'}.amazonaws.com"
+        self.url_prefix = public_url.rstrip('/') + '/' + prefix
+
+    @functools.cached_property
+    def client(self):
+        import boto3
+        from botocore.config import Config
+        # Path-style addressing for MinIO and other endpoints without per-bucket hostnames
+        config = Config(signature_version='s3v4',
+                        s3={'addressing_style': 'path' if self.endpoint_url else 'auto'})
+        return boto3.client('s3', endpoint_url=self.endpoint_url, region_name=self.region, config=config)
+
+    def object_key(self, key):
+        return self.prefix + key
+
+    def url(self, key):
+        return self.url_prefix + key
+
+    def key_for(self, url):
+        if isinstance(url, str) and url.startswith(self.url_prefix):
+            return url[len(self.url_prefix):]
+        return None
+
+    def save_stream(self, stream, ext, max_bytes):
+        # Spooled to local temp space first: the key is the content hash, known only at the end
+        with tempfile.TemporaryDirectory(prefix='sparkconnect-upload-') as scratch:
+            key = store_stream(stream, ext, scratch, max_bytes)
+            if not self.exists(key):
+                self.save_file(os.path.join(scratch, key), key)
+        return key
+
+    def save_file(self, path, key):
+        # upload_file switches to a multipart upload for large files
+        self.client.upload_file(path, self.bucket, self.object_key(key),
+                                ExtraArgs={'ContentType': content_type_for(key), 'CacheControl': IMMUTABLE})
+        os.remove(path)
+
+    def size(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    @contextlib.contextmanager
+    def local_path(self, key):
+        fd, path = tempfile.mkstemp(prefix='sparkconnect-media-', suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), path)
+            yield path
+        finally:
+            os.remove(path)
+
+    def copy(self, object_key, target_object_key):
+        self.client.copy_object(Bucket=self.bucket, Key=target_object_key,
+                                CopySource={'Bucket': self.bucket, 'Key': object_key})
+
+    def move(self, key, target_key):
+        # S3 has no rename: copy, then delete the original
+        self.copy(self.object_key(key), self.object_key(target_key))
+        self.delete(key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def quarantine(self, key, target):
+        self.copy(self.object_key(key), self.QUARANTINE_PREFIX + target)
+        self.delete(key)
+
+    def list_objects(self, prefix, delimiter=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        options = {'Bucket': self.bucket, 'Prefix': prefix}
+        if delimiter:
+            options['Delimiter'] = delimiter
+        return paginator.paginate(**options)
+
+    def quarantine_folders(self):
+        folders = []
+        for page in self.list_objects(self.QUARANTINE_PREFIX, '/'):
+            for common in page.get('CommonPrefixes', []):
+                folders.append(common['Prefix'][len(self.QUARANTINE_PREFIX):].rstrip('/'))
+        return folders
+
+    def purge_quarantine(self, folder):
+        for page in self.list_objects(f"{self.QUARANTINE_PREFIX}{folder}/"):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects})
+
+    def list_files(self):
+        for page in self.list_objects(self.prefix, '/'):
+            for obj in page.get('Contents', []):
+                key = obj['Key'][len(self.prefix):]
+                if key and not key.startswith('.'):
+                    yield key, obj['Size'], obj['LastModified'].timestamp()
+
+    def presign_upload(self, key, max_bytes, expires_in):
+        """Presigned POST (url and form fields) for one browser upload of at most max_bytes to key"""
+        content_type = content_type_for(key)
+        fields = {'Content-Type': content_type, 'Cache-Control': IMMUTABLE}
+        return self.client.generate_presigned_post(
+            self.bucket,
+            self.object_key(key),
+            Fields=fields,
+            Conditions=[{'Content-Type': content_type}, {'Cache-Control': IMMUTABLE},
+                        ['content-length-range', 1, max_bytes]],
+            ExpiresIn=expires_in
+        )
+
+def create_storage(local_root):
+    """The backend named by STORAGE_BACKEND; local files live in local_root"""
+    if os.environ.get('STORAGE_BACKEND', 'local') == 's3':
+        # Checked up front so a missing package fails the deploy, not the first upload
+        if importlib.util.find_spec('boto3') is None:
+            raise RuntimeError('STORAGE_BACKEND=s3 needs boto3 (in requirements.txt)')
+        return S3Storage(
+            os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', 'uploads/'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            region=os.environ.get('S3_REGION'),
+            public_url=os.environ.get('S3_PUBLIC_URL')
+        )
+    # Quarantined uploads are kept outside public/ so they are never served
+    quarantine_dir = os.environ.get('UPLOAD_QUARANTINE_DIR',
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'quarantine'))
+    return LocalStorage(local_root, quarantine_dir=quarantine_dir)
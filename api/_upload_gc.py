@@ -0,0 +1,329 @@
+"""Reference index for uploaded files, and the collector for orphaned ones.
+
+Removing a gallery item, changing a profile picture or deleting an account
+only changes the user document; the file stays in storage. The
+upload_refs collection tracks who uses each file, one document per upload
+URL:
+
+    {_id: 'assets/uploads/<sha256>.jpg', refs: ['<user id>:gallery', ...],
+     size: 123456, created_at: ..., released_at: ..., lease_until: ...}
+
+refs names each (user, field) using the file. Uploads are content-addressed,
+so several users can share a file and it is only garbage once the last of
+them lets go. released_at is set while refs is empty: at upload time (so a
+file uploaded but not yet saved to a profile gets the grace period too) and
+when the last reference is released. It is unset again by the next
+reference.
+
+collect() reads only documents with released_at older than the grace period,
+through a partial index on released_at, so a run costs time in proportion to
+what was released since the last one, not to the number of files. Each
+candidate is:
+
+1. claimed with a lease (lease_until, LEASE_SECONDS ahead), so two
+   collectors never take the same file and one that dies mid-run leaves the
+   file to be retried as soon as the lease runs out;
+2. moved out of the way, with its variants and poster from the media
+   collection, to .collecting-<name> next to it;
+3. checked again: the record is deleted only if it is still unreferenced.
+   A file referenced again in the meantime is moved back;
+4. deleted, or moved into the storage backend's quarantine under a folder
+   named for the date (see _storage.py). Quarantine folders older than
+   quarantine_days are purged by the next run.
+
+Files from before the index existed are picked up by a one-off rebuild,
+which reads every profile and lists the stored uploads once:
+
+    python api/_upload_gc.py rebuild
+    python api/_upload_gc.py collect [--dry-run] [--delete] [--grace SECONDS]
+"""
+import os
+import time
+import threading
+
+from pymongo import ReturnDocument
+
+# Uploads not saved to a profile within this long are orphans
+DEFAULT_GRACE_SECONDS = 24 * 3600
+# A claimed file whose collector died is retried after this long
+LEASE_SECONDS = 600
+DEFAULT_BATCH_SIZE = 200
+STAGING_PREFIX = '.collecting-'
+REFERENCE_FIELDS = ('image', 'gallery')
+
+def reference_key(user_id, field):
+    return f"{user_id}:{field}"
+
+class UploadReferences:
+    def __init__(self, get_db, storage, quarantine=True, grace_seconds=DEFAULT_GRACE_SECONDS,
+                 quarantine_days=30, batch_size=DEFAULT_BATCH_SIZE):
+        self.get_db = get_db
+        self.storage = storage
+        # False deletes collected files outright
+        self.quarantine = quarantine
+        self.grace_seconds = grace_seconds
+        self.quarantine_days = quarantine_days
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.last_run = None
+
+    def upload_urls(self, values):
+        """The upload URLs among values (a URL, a list of them, or anything else a profile field holds)"""
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, (list, tuple, set)):
+            return set()
+        return {value for value in values if self.storage.key_for(value)}
+
+    def uploaded(self, key, size=None):
+        """Track a file just stored under key; it is an orphan until something references it.
+
+        Direct uploads are tracked when they are presigned, before any bytes
+        arrive, so an abandoned one is collected like any other orphan.
+        """
+        url = self.storage.url(key)
+        now = time.time()
+        refs = self.get_db().upload_refs
+        if size is None:
+            size = self.storage.size(key) or 0
+        # Re-uploading an unreferenced file restarts its grace period
+        if refs.update_one({'_id': url, 'refs': {'$size': 0}},
+                           {'$set': {'released_at': now, 'size': size}}).matched_count:
+            return
+        refs.update_one({'_id': url}, {'$setOnInsert': {'refs': [], 'size': size, 'created_at': now,
+                                                        'released_at': now}}, upsert=True)
+
+    def reference(self, urls, user_id, field):
+        """Record that user_id's field uses each upload URL among urls"""
+        refs = self.get_db().upload_refs
+        key = reference_key(user_id, field)
+        for url in self.upload_urls(urls):
+            refs.update_one({'_id': url}, {'$addToSet': {'refs': key}, '$unset': {'released_at': '', 'lease_until': ''},
+                                           '$setOnInsert': {'created_at': time.time()}}, upsert=True)
+
+    def release(self, urls, user_id, field):
+        """Record that user_id's field no longer uses urls; a file left unreferenced starts its grace period"""
+        refs = self.get_db().upload_refs
+        key = reference_key(user_id, field)
+        for url in self.upload_urls(urls):
+            refs.update_one({'_id': url}, {'$pull': {'refs': key}})
+            # Separate from the $pull so a reference added in between is never overwritten
+            refs.update_one({'_id': url, 'refs': {'$size': 0}, 'released_at': {'$exists': False}},
+                            {'$set': {'released_at': time.time()}})
+
+    def release_user(self, user):
+        """Release everything a deleted user document referenced"""
+        for field in REFERENCE_FIELDS:
+            self.release(user.get(field), str(user['_id']), field)
+
+    def files_for(self, url):
+        """Storage keys of url's file, variants and poster"""
+        keys = [self.storage.key_for(url)]
+        media = self.get_db().media.find_one({'_id': url}, {'variants': 1, 'poster': 1}) or {}
+        derived = [media.get('poster')]
+        for variant in (media.get('variants') or {}).values():
+            derived.extend(value for value in variant.values() if isinstance(value, str))
+        keys.extend(sorted({self.storage.key_for(item) for item in derived if self.storage.key_for(item)}))
+        return keys
+
+    @staticmethod
+    def staging_key(key):
+        folder, _, name = key.rpartition('/')
+        return f"{folder}/{STAGING_PREFIX}{name}" if folder else STAGING_PREFIX + name
+
+    def stage(self, keys):
+        """Move the files that exist out of the way; returns [(key, size)] of those moved"""
+        staged = []
+        for key in keys:
+            staging = self.staging_key(key)
+            size = self.storage.size(staging)
+            # Not already staged by a collector that died before finishing
+            if size is None:
+                size = self.storage.size(key)
+                if size is None:
+                    continue
+                self.storage.move(key, staging)
+            staged.append((key, size))
+        return staged
+
+    def unstage(self, staged):
+        for key, _ in staged:
+            self.storage.move(self.staging_key(key), key)
+
+    def dispose(self, staged, day):
+        for key, _ in staged:
+            staging = self.staging_key(key)
+            if not self.quarantine:
+                self.storage.delete(staging)
+                continue
+            self.storage.quarantine(staging, f"{day}/{key}")
+
+    def due(self, now):
+        """Filter for unreferenced records past their grace period and not leased to a running collector"""
+        return {'released_at': {'$lte': now - self.grace_seconds}, 'refs': {'$size': 0},
+                '$or': [{'lease_until': {'$exists': False}}, {'lease_until': {'$lte': now}}]}
+
+    def claim(self, now):
+        """The next due unreferenced record, leased to this collector; None when there is none"""
+        return self.get_db().upload_refs.find_one_and_update(
+            self.due(now),
+            {'$set': {'lease_until': now + LEASE_SECONDS}},
+            sort=[('released_at', 1)],
+            return_document=ReturnDocument.BEFORE
+        )
+
+    def collect(self, limit=None, dry_run=False):
+        """Delete or quarantine up to limit orphaned uploads; returns a report"""
+        db = self.get_db()
+        limit = limit or self.batch_size
+        now = time.time()
+        day = time.strftime('%Y-%m-%d', time.gmtime(now))
+        report = {'mode': 'dry-run' if dry_run else 'quarantine' if self.quarantine else 'delete',
+                  'collected': 0, 'restored': 0, 'missing': 0, 'files': 0, 'reclaimed_bytes': 0, 'urls': []}
+
+        if dry_run:
+            due = db.upload_refs.find(self.due(now), {'size': 1}).sort('released_at', 1).limit(limit)
+            for record in due:
+                report['collected'] += 1
+                report['reclaimed_bytes'] += record.get('size') or 0
+                report['urls'].append(record['_id'])
+            return report
+
+        while report['collected'] + report['restored'] < limit:
+            record = self.claim(now)
+            if record is None:
+                break
+            url = record['_id']
+            keys = self.files_for(url)
+            staged = self.stage(keys)
+            # Referenced again since the claim: put everything back
+            if not db.upload_refs.delete_one({'_id': url, 'refs': {'$size': 0}}).deleted_count:
+                self.unstage(staged)
+                report['restored'] += 1
+                continue
+            db.media.delete_one({'_id': url})
+            self.dispose(staged, day)
+            if not staged or staged[0][0] != keys[0]:
+                report['missing'] += 1
+            report['collected'] += 1
+            report['files'] += len(staged)
+            report['reclaimed_bytes'] += sum(size for _, size in staged)
+            report['urls'].append(url)
+
+        report['purged_quarantine_days'] = self.purge_quarantine(now)
+        with self.lock:
+            self.last_run = {'at': now, **{k: v for k, v in report.items() if k != 'urls'}}
+        return report
+
+    def purge_quarantine(self, now=None):
+        """Remove dated quarantine folders older than quarantine_days; returns how many"""
+        if not self.quarantine:
+            return 0
+        cutoff = time.strftime('%Y-%m-%d', time.gmtime((now or time.time()) - self.quarantine_days * 86400))
+        purged = 0
+        for folder in self.storage.quarantine_folders():
+            if len(folder) == 10 and folder < cutoff:
+                self.storage.purge_quarantine(folder)
+                purged += 1
+        return purged
+
+    def rebuild(self):
+        """Recreate the index from every profile and every stored upload; returns counts"""
+        db = self.get_db()
+        refs = {}
+        for user in db.users.find({}, {field: 1 for field in REFERENCE_FIELDS}):
+            for field in REFERENCE_FIELDS:
+                for url in self.upload_urls(user.get(field)):
+                    refs.setdefault(url, set()).add(reference_key(user['_id'], field))
+
+        now = time.time()
+        files = 0
+        for key, size, modified in self.storage.list_files():
+            files += 1
+            url = self.storage.url(key)
+            keys = sorted(refs.pop(url, ()))
+            db.upload_refs.update_one({'_id': url}, {'$set': {'refs': keys, 'size': size},
+                                                     '$setOnInsert': {'created_at': modified}}, upsert=True)
+            if keys:
+                db.upload_refs.update_one({'_id': url}, {'$unset': {'released_at': '', 'lease_until': ''}})
+            else:
+                # An orphan found now gets the full grace period from now; one already waiting keeps its place
+                db.upload_refs.update_one({'_id': url, 'released_at': {'$exists': False}},
+                                          {'$set': {'released_at': now}})
+
+        # Referenced by a profile but not stored: tracked, so releasing them later cleans up the record
+        for url, keys in refs.items():
+            db.upload_refs.update_one({'_id': url}, {'$set': {'refs': sorted(keys), 'size': 0},
+                                                     '$unset': {'released_at': ''}}, upsert=True)
+        return {'files': files, 'missing_files': len(refs)}
+
+    def snapshot(self):
+        with self.lock:
+            last_run = self.last_run
+        stats = {'grace_seconds': self.grace_seconds, 'quarantine': self.quarantine,
+                 'last_run': last_run}
+        try:
+            refs = self.get_db().upload_refs
+            stats['tracked'] = refs.estimated_document_count()
+            stats['unreferenced'] = refs.count_documents({'released_at': {'$exists': True}})
+            stats['due'] = refs.count_documents(self.due(time.time()))
+        except Exception:
+            stats['tracked'] = None
+        return stats
+
+def create_upload_references(get_db, storage):
+    return UploadReferences(
+        get_db,
+        storage,
+        # UPLOAD_GC_MODE=delete removes orphans instead of quarantining them
+        quarantine=os.environ.get('UPLOAD_GC_MODE', 'quarantine') != 'delete',
+        grace_seconds=int(os.environ.get('UPLOAD_GC_GRACE', DEFAULT_GRACE_SECONDS)),
+        quarantine_days=int(os.environ.get('UPLOAD_QUARANTINE_DAYS', 30)),
+        batch_size=int(os.environ.get('UPLOAD_GC_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    )
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+    from _storage import create_storage
+
+    parser = argparse.ArgumentParser(description='Track uploads and collect the ones no profile uses')
+    parser.add_argument('command', choices=['rebuild', 'collect'])
+    parser.add_argument('--dry-run', action='store_true', help='report what would be collected')
+    parser.add_argument('--delete', action='store_true', help='delete instead of quarantining')
+    parser.add_argument('--grace', type=int, help='seconds an unreferenced upload is kept')
+    parser.add_argument('--limit', type=int, default=0, help='stop after this many files (default: all due)')
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'public', '.env'))
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    database = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+    storage = create_storage(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'assets', 'uploads'))
+
+    uploads = create_upload_references(lambda: database, storage)
+    if args.delete:
+        uploads.quarantine = False
+    if args.grace is not None:
+        uploads.grace_seconds = args.grace
+
+    if args.command == 'rebuild':
+        counts = uploads.rebuild()
+        print(f"Indexed {counts['files']} files; {counts['missing_files']} referenced uploads are missing from storage")
+        sys.exit(0)
+
+    total = {'collected': 0, 'restored': 0, 'files': 0, 'reclaimed_bytes': 0}
+    while True:
+        report = uploads.collect(min(args.limit - total['collected'], uploads.batch_size) if args.limit else None,
+                                 dry_run=args.dry_run)
+        for url in report['urls']:
+            print(f"[{report['mode'].upper()}] {url}")
+        for key in total:
+            total[key] += report.get(key, 0)
+        if args.dry_run or not report['collected'] + report['restored'] or \
+                (args.limit and total['collected'] >= args.limit):
+            break
+    print(f"{report['mode']}: {total['collected']} uploads ({total['files']} files), "
+          f"{total['reclaimed_bytes'] / 1e6:.1f} MB reclaimed, {total['restored']} referenced again")
@@ -0,0 +1,185 @@
+"""Content-addressed upload storage.
+
+store_stream() copies a file object to disk in CHUNK_SIZE pieces while
+hashing it, stopping as soon as max_bytes is passed. For form uploads the
+file object is Werkzeug's spooled copy of the request body (kept in memory
+up to 500 KB, in a temp file beyond that), so the body is read in full
+before the view runs and the per-request cap is MAX_CONTENT_LENGTH.
+Resumable chunks are read from the request stream itself. Files are stored
+as <sha256>.<ext>: uploading the same image twice, by anyone, costs no
+extra space and returns the same URL.
+
+Large media (videos) use resumable uploads: the client starts an upload,
+sends it in Content-Range chunks, and after a dropped connection asks for
+the current offset and continues from there. Any instance can take any
+chunk: each chunk is stored as its own object under partial/ in the storage
+backend, and the upload's offset and list of chunks live in the
+partial_uploads collection. A chunk only counts once a conditional update
+moves the offset past it, so two requests racing for the same range cannot
+both land. The request that stores the last chunk joins the chunks in temp
+space, hashes them and saves the result under its content address.
+"""
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import contextlib
+from pymongo import ReturnDocument
+
+CHUNK_SIZE = 64 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+class UploadError(Exception):
+    """A resumable upload request that does not fit the upload's state"""
+
+def commit(temp_path, digest, ext, upload_dir):
+    """Move a finished temp file to its content address; returns the stored filename"""
+    name = f"{digest}.{ext}"
+    final_path = os.path.join(upload_dir, name)
+    os.makedirs(upload_dir, exist_ok=True)
+    if os.path.exists(final_path):
+        # Same bytes already stored: the duplicate is free
+        os.remove(temp_path)
+    else:
+        shutil.move(temp_path, final_path)
+    return name
+
+def store_stream(stream, ext, upload_dir, max_bytes):
+    """Stream a file object to upload_dir under its content hash; returns the filename"""
+    digest = hashlib.sha256()
+    size = 0
+    # Created on first upload rather than at import, which may run on a read-only filesystem
+    os.makedirs(upload_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=upload_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return commit(temp_path, digest.hexdigest(), ext, upload_dir)
+
+class ResumableUploads:
+    # Partial uploads untouched for this long are discarded
+    EXPIRE_AFTER = 24 * 3600
+    PARTS_PREFIX = 'partial/'
+
+    def __init__(self, storage, get_db, max_bytes):
+        # Chunks and finished files go to a storage backend (see _storage.py)
+        self.storage = storage
+        self.get_db = get_db
+        self.max_bytes = max_bytes
+
+    def start(self, ext, size):
+        if size > self.max_bytes:
+            raise UploadTooLarge()
+        self.expire_stale()
+        upload_id = uuid.uuid4().hex
+        self.get_db().partial_uploads.insert_one(
+            {'_id': upload_id, 'ext': ext, 'size': size, 'offset': 0, 'parts': [], 'updated_at': time.time()})
+        return upload_id
+
+    def status(self, upload_id):
+        """Return (meta, bytes received so far)"""
+        meta = self.get_db().partial_uploads.find_one({'_id': upload_id})
+        if meta is None:
+            raise UploadError('Unknown upload')
+        return meta, meta['offset']
+
+    def append(self, upload_id, start, stream):
+        """Store a chunk that begins at byte start.
+
+        Returns (offset, filename); filename is set once the last byte has
+        arrived and the file has been moved to its content address.
+        """
+        meta, offset = self.status(upload_id)
+        if offset >= meta['size']:
+            # Every byte is stored but the request that sent the last one did not finish
+            return offset, self.finish(meta)
+        if start != offset:
+            raise UploadError(f"Expected a chunk starting at byte {offset}")
+        part_key, length = self.store_part(upload_id, start, stream, meta['size'] - start)
+        if part_key is None:
+            return offset, None
+        meta = self.get_db().partial_uploads.find_one_and_update(
+            {'_id': upload_id, 'offset': start},
+            {'$set': {'offset': start + length, 'updated_at': time.time()},
+             '$push': {'parts': {'start': start, 'key': part_key}}},
+            return_document=ReturnDocument.AFTER
+        )
+        if meta is None:
+            # Another request stored this range first, or the upload expired meanwhile
+            self.storage.delete(part_key)
+            raise UploadError('Chunk already received')
+        if meta['offset'] < meta['size']:
+            return meta['offset'], None
+        return meta['offset'], self.finish(meta)
+
+    def store_part(self, upload_id, start, stream, remaining):
+        """Save the chunk in stream to its own key; returns (key, length), key None when empty"""
+        fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=self.storage.scratch_dir)
+        length = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    length += len(chunk)
+                    if length > remaining:
+                        raise UploadError('Chunk runs past the declared size')
+                    out.write(chunk)
+            if not length:
+                os.remove(temp_path)
+                return None, 0
+            # Random suffix: a request that loses the race deletes only its own copy
+            part_key = f"{self.PARTS_PREFIX}{upload_id}-{start}-{uuid.uuid4().hex[:8]}"
+            self.storage.save_file(temp_path, part_key)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+        return part_key, length
+
+    def finish(self, meta):
+        """Join the chunks under their content address and drop the partial upload"""
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=self.storage.scratch_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for part in sorted(meta['parts'], key=lambda part: part['start']):
+                    with self.storage.local_path(part['key']) as path, open(path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                            digest.update(chunk)
+                            out.write(chunk)
+            name = f"{digest.hexdigest()}.{meta['ext']}"
+            if self.storage.exists(name):
+                os.remove(temp_path)
+            else:
+                self.storage.save_file(temp_path, name)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+        self.discard(meta)
+        return name
+
+    def discard(self, meta):
+        for part in meta['parts']:
+            self.storage.delete(part['key'])
+        self.get_db().partial_uploads.delete_one({'_id': meta['_id']})
+
+    def expire_stale(self):
+        cutoff = time.time() - self.EXPIRE_AFTER
+        # updated_at moves with every chunk, so it marks the last activity
+        for meta in self.get_db().partial_uploads.find({'updated_at': {'$lt': cutoff}}):
+            try:
+                self.discard(meta)
+            except Exception as e:
+                print(f"Could not discard partial upload {meta['_id']}: {e}")
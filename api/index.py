@@ -1,63 +1,426 @@
 import os
+import re
+import sys
+import hmac
 import json
+import time
+import uuid
+import heapq
+import base64
+import hashlib
+import functools
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, session, send_from_directory
-from flask_mail import Mail, Message
+from flask import Flask, Response, request, jsonify, session, g, copy_current_request_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
-from itsdangerous import URLSafeTimedSerializer
-import requests
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
-from dotenv import load_dotenv
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 
-# Try to load .env from public folder for local development
-load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'public', '.env'))
+# Helper modules sit next to this file; the leading underscore keeps Vercel
+# from deploying them as functions of their own
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _indexes import ensure_indexes
+from _search import SearchIndex, SUMMARY_FIELDS
+from _leaderboard import Leaderboards
+from _rebuild import BackgroundRebuild
+from _cache import create_cache, MemoryBackend
+from _http import install as install_http_middleware, strong_etag
+from _passwords import create_hasher, HasherBusy
+from _uploads import ResumableUploads, UploadTooLarge, UploadError
+from _storage import create_storage
+from _media import MediaPipeline, record_media, lookup_media, media_key
+from _geo import geo_fields, cells_within
+from _metrics import Metrics, install as install_metrics
+from _google_keys import GoogleKeyCache, GOOGLE_CERTS_URL
+from _mail import create_mail_queue
+from _upload_gc import create_upload_references
+from _static import install as install_static
+from _serialize import (FastJSONProvider, LISTING_FIELDS, PROFILE_FIELDS, OWNER_FIELDS, select_fields, field_projection,
+                        public, stream_array)
+
+# Load .env from the public folder for local development; deployments set real env vars
+ENV_FILE = os.path.join(os.path.dirname(__file__), '..', 'public', '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
 
 app = Flask(__name__)
+# orjson-backed jsonify when orjson is installed; see api/_serialize.py
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'super_secret_key_change_this_later')
 
+# Per-route latency, size and MongoDB usage, served at /api/metrics. Installed first
+# so its timing wraps every other request hook.
+metrics = Metrics()
+install_metrics(app, metrics)
+
 # Resolve paths relative to this file
 API_DIR = os.path.dirname(os.path.abspath(__file__))
 BASE_DIR = os.path.join(API_DIR, '..', 'public')
 
 # MongoDB Configuration
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+# pymongo imports certifi itself, so this costs nothing extra
 import certifi
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where(), connect=False, serverSelectionTimeoutMS=5000)
+client = MongoClient(MONGO_URI, tlsCAFile=certifi.where(), connect=False, serverSelectionTimeoutMS=5000,
+                     event_listeners=[metrics.command_listener])
 # Explicitly get the 'sparkconnect' database if the URI doesn't specify one
 db = client.get_database('sparkconnect' if 'mongodb+srv' in MONGO_URI else None)
 
 # Configure CORS
 CORS(app, supports_credentials=True)
+# ETag/304, gzip/brotli and Cache-Control on API responses
+install_http_middleware(app)
+
+# Token signing is set up on first use; most cold starts never need it
+@functools.lru_cache(maxsize=None)
+def get_serializer():
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(app.secret_key)
+
+# Directory listing configuration
+NON_ELECTRICIAN_ROLES = ['Visitor', 'Administrator']
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SORT_FIELDS = {'rating': 'rating', 'reviews': 'reviews', 'newest': '_id'}
+# Full-directory exports are read from MongoDB in batches of this many profiles
+EXPORT_BATCH_SIZE = 500
+# Gallery mutations return the updated gallery from the write itself
+GALLERY_PROJECTION = {'gallery': 1}
+# Deleting an account reads back the fields that can reference uploads
+UPLOAD_REFERENCE_PROJECTION = {'image': 1, 'gallery': 1}
+# Nearby search: radius in km, and the share of the score that comes from rating
+NEARBY_DEFAULT_RADIUS_KM = 50
+NEARBY_MAX_RADIUS_KM = 1000
+NEARBY_RATING_WEIGHT = 0.3
+# Coordinates are rounded to this many decimals (about 1 km) before searching, so nearby callers share cache entries
+NEARBY_COORD_DECIMALS = 2
+# Upper bound on sub-operations in one /api/batch request
+MAX_BATCH_OPS = 20
+
+# Search index: built lazily from MongoDB, kept current by this process's writes and
+# rebuilt in the background after SEARCH_INDEX_TTL seconds to pick up writes made by other
+# instances; see api/_rebuild.py
+SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL', 300))
+# (rating_sum rides along for the leaderboards' Bayesian scores)
+SEARCH_PROJECTION = {**{field: 1 for field in SUMMARY_FIELDS}, 'rating_sum': 1}
+search_index = SearchIndex()
+search_rebuild = BackgroundRebuild(
+    search_index,
+    lambda: db.users.find({'specialty': {'$nin': NON_ELECTRICIAN_ROLES}}, SEARCH_PROJECTION),
+    SEARCH_INDEX_TTL,
+    'search index'
+)
+
+# Leaderboards by state and specialty, maintained and rebuilt the same way; see api/_leaderboard.py
+LEADERBOARD_TTL = int(os.environ.get('LEADERBOARD_TTL', SEARCH_INDEX_TTL))
+LEADERBOARD_DEFAULT_SIZE = 10
+# Leaderboard entries carry their Bayesian score as well
+LEADERBOARD_FIELDS = LISTING_FIELDS + ('score',)
+leaderboards = Leaderboards(int(os.environ.get('LEADERBOARD_PRIOR_WEIGHT', 5)))
+leaderboards_rebuild = BackgroundRebuild(
+    leaderboards,
+    lambda: db.users.find({'specialty': {'$nin': NON_ELECTRICIAN_ROLES}, 'reviews': {'$gt': 0}}, SEARCH_PROJECTION),
+    LEADERBOARD_TTL,
+    'leaderboards'
+)
+
+# Session identity. Claims are signed into the session cookie so authorization and
+# header rendering need no database read; the version stamp lets update_user retire them.
+ADMIN_EMAIL = 'admin@sparkconnect.com'
+CURRENT_USER_PROJECTION = {'password': 0, 'rating_sum': 0, 'reviews_data': 0}
+CLAIMS_PROJECTION = {'name': 1, 'email': 1, 'image': 1, 'specialty': 1, 'session_version': 1}
+# Other instances' updates are only seen in MongoDB: claims are re-checked against the stored
+# session_version once they are this many seconds old
+CLAIMS_MAX_AGE = int(os.environ.get('CLAIMS_MAX_AGE', 60))
+# Latest session_version this process has written or read, per user id. Claims older than
+# CLAIMS_MAX_AGE are re-checked anyway, so entries only need to live that long; the LRU bounds it.
+claims_versions = MemoryBackend(int(os.environ.get('CLAIMS_VERSIONS_MAX', 10000)))
+
+# Google's token signing keys, cached for their max-age; see api/_google_keys.py
+google_keys = GoogleKeyCache(os.environ.get('GOOGLE_CERTS_URL', GOOGLE_CERTS_URL))
 
-mail = Mail(app)
-serializer = URLSafeTimedSerializer(app.secret_key)
+# Password hashing runs on a bounded pool; see api/_passwords.py for the settings
+password_hasher = create_hasher()
+
+# Response cache for directory reads: CACHE_BACKEND is memory (default), redis or none. Memory
+# invalidations stay in this process, so multi-instance deployments want redis; see api/_cache.py
+response_cache = create_cache(
+    os.environ.get('CACHE_BACKEND', 'memory'),
+    redis_url=os.environ.get('REDIS_URL'),
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 1024)),
+    ttl=int(os.environ.get('CACHE_TTL', 30)),
+    stale_ttl=int(os.environ.get('CACHE_STALE_TTL', 300))
+)
 
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'assets', 'uploads')
+# Local files in UPLOAD_FOLDER, or an S3-compatible bucket with STORAGE_BACKEND=s3; see api/_storage.py
+storage = create_storage(UPLOAD_FOLDER)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'webm'}
+# Single-request uploads; larger media goes through the resumable /api/uploads routes
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+MAX_RESUMABLE_BYTES = int(os.environ.get('MAX_RESUMABLE_BYTES', 500 * 1024 * 1024))
+RESUMABLE_CHUNK_BYTES = 5 * 1024 * 1024
+# Werkzeug rejects bigger bodies with 413 before reading them; the slack covers multipart framing
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_UPLOAD_BYTES, RESUMABLE_CHUNK_BYTES) + 64 * 1024
+# Direct-to-storage uploads: how long a presigned form stays valid
+DIRECT_UPLOAD_EXPIRES = int(os.environ.get('DIRECT_UPLOAD_EXPIRES', 900))
 
-if not os.path.exists(UPLOAD_FOLDER):
-    try:
-        os.makedirs(UPLOAD_FOLDER)
-    except:
-        pass # Might fail on read-only serverless environments
+def media_ready(url, entry):
+    """Called by a media worker once url's variants exist"""
+    user_ids = record_media(db, url, entry)
+    for user_id in user_ids:
+        invalidate_cache(f"user:{user_id}")
+    # Directory cards and search results carry image_media
+    for user in db.users.find({'_id': {'$in': user_ids}, 'image': url}, SEARCH_PROJECTION):
+        index_profile(user)
+        invalidate_cache('directory')
+
+# Resized WebP/AVIF variants and video posters are made off the request path;
+# MEDIA_WORKERS=0 turns the workers off (backfill with python api/_media.py)
+media_pipeline = MediaPipeline(
+    storage,
+    media_ready,
+    workers=int(os.environ.get('MEDIA_WORKERS', 2)),
+    max_queue=int(os.environ.get('MEDIA_MAX_QUEUE', 256))
+)
 
 def get_db():
     return db
 
+# Email is queued in the outbox collection and sent by a background worker;
+# see api/_mail.py for the SMTP settings
+mail_queue = create_mail_queue(get_db)
+# Which profiles use each upload, so files nobody uses can be collected; see api/_upload_gc.py
+upload_refs = create_upload_references(get_db, storage)
+# Chunks are kept in storage and progress in MongoDB, so any instance can take the next chunk
+resumable_uploads = ResumableUploads(storage, get_db, MAX_RESUMABLE_BYTES)
+# Password reset links: how long they stay valid, and the site they point at. Links are only
+# built on a request Host (with its port, if any) listed in TRUSTED_HOSTS when PUBLIC_URL is unset, since the Host header
+# is client-controlled; with neither set, no reset mail is sent.
+PASSWORD_RESET_MAX_AGE = int(os.environ.get('PASSWORD_RESET_MAX_AGE', 3600))
+PUBLIC_URL = os.environ.get('PUBLIC_URL')
+TRUSTED_HOSTS = {host.strip().lower() for host in os.environ.get('TRUSTED_HOSTS', '').split(',') if host.strip()}
+
+# Indexes are created by a deploy step (python api/_indexes.py), not on cold starts: creating them
+# here costs a round trip per index on every new instance. ENSURE_INDEXES=1 creates them once per
+# process instead, for local runs against a fresh database.
+indexes_ready = os.environ.get('ENSURE_INDEXES', '0') != '1'
+# Whether the unique email index exists, so register can rely on DuplicateKeyError alone.
+# EMAIL_INDEX_READY=1 trusts the deploy step; otherwise the first registration in a process checks once.
+email_index_ready = True if os.environ.get('EMAIL_INDEX_READY') == '1' else None
+
+@app.before_request
+def ensure_indexes_once():
+    global indexes_ready, email_index_ready
+    if not indexes_ready:
+        try:
+            failed = ensure_indexes(db)
+            email_index_ready = 'users_email_unique' not in failed
+            indexes_ready = True
+        except Exception as e:
+            print(f"Index bootstrap error: {e}")
+
+def unique_email_index():
+    """Whether users_email_unique exists; looked up once per process, then trusted"""
+    global email_index_ready
+    if email_index_ready is None:
+        try:
+            email_index_ready = 'users_email_unique' in db.users.index_information()
+        except Exception:
+            return False
+    return email_index_ready
+
+def cached(tags, per_user=False, key_args=None):
+    """Serve a GET route through the response cache.
+
+    tags is called with the view's URL arguments and returns the cache tags
+    whose invalidation must evict the response. per_user routes are keyed on
+    the session user and bypass the cache for anonymous callers. key_args,
+    when given, maps the query items to the ones the key is built from, for
+    views that normalize their parameters the same way.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if response_cache is None or (per_user and 'user_id' not in session):
+                return view(**kwargs)
+
+            items = request.args.items(multi=True)
+            key = request.path + '?' + urlencode(sorted(key_args(items) if key_args else items))
+            if per_user:
+                key += '#' + session['user_id']
+
+            def compute():
+                response = app.make_response(view(**kwargs))
+                body = response.get_data()
+                # Hash once here so cache hits don't re-hash the body for the ETag
+                entry = {'body': body.decode(), 'etag': strong_etag(body), 'status': response.status_code, 'mimetype': response.mimetype}
+                return entry, response.status_code == 200
+
+            entry = response_cache.get_or_compute(key, tags(**kwargs), compute, refresh=copy_current_request_context(compute))
+            response = Response(entry['body'], entry['status'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            return response
+        return wrapper
+    return decorator
+
+def invalidate_cache(*tags):
+    if response_cache is not None:
+        response_cache.invalidate(*tags)
+
+def session_claims(user):
+    return {
+        'role': 'admin' if user.get('email') == ADMIN_EMAIL else 'user',
+        'name': user.get('name'),
+        'email': user.get('email'),
+        'image': user.get('image'),
+        'specialty': user.get('specialty'),
+        'v': user.get('session_version', 0),
+        'checked_at': int(time.time())
+    }
+
+def set_session_user(user):
+    """Log user in and sign their display and role claims into the session"""
+    session['user_id'] = str(user['_id'])
+    session['claims'] = session_claims(user)
+
+def clear_session_user():
+    session.pop('user_id', None)
+    session.pop('claims', None)
+
+def load_current_user():
+    """The logged-in user's profile, read at most once per request and never with the password hash"""
+    if 'current_user' not in g:
+        g.current_user = None
+        if 'user_id' in session:
+            try:
+                g.current_user = db.users.find_one({'_id': ObjectId(session['user_id'])}, CURRENT_USER_PROJECTION)
+            except Exception:
+                pass
+    return g.current_user
+
+def claims_current(user_id, claims):
+    """Whether claims still carry the stored session_version; None when the user is gone"""
+    try:
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'session_version': 1})
+    except Exception:
+        return None
+    if user is None:
+        return None
+    version = user.get('session_version', 0)
+    note_version(user_id, version)
+    return version == claims['v']
+
+def known_version(user_id, default):
+    """The newest session_version this process has seen for user_id, or default"""
+    version = claims_versions.get(user_id)
+    return default if version is None else version
+
+def note_version(user_id, version):
+    claims_versions.set(user_id, max(version, known_version(user_id, version)), CLAIMS_MAX_AGE)
+
+def current_claims():
+    """Session claims, reloaded from MongoDB when missing, older than a known update, or due a re-check"""
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    claims = session.get('claims')
+    stale = claims is None or claims['v'] < known_version(user_id, claims['v'])
+    if not stale and time.time() - claims.get('checked_at', 0) > CLAIMS_MAX_AGE:
+        current = claims_current(user_id, claims)
+        if current is None:
+            return None
+        if current:
+            claims = session['claims'] = {**claims, 'checked_at': int(time.time())}
+        stale = not current
+    if stale:
+        user = load_current_user()
+        if not user:
+            return None
+        set_session_user(user)
+        claims = session['claims']
+    return claims
+
+def admin_error():
+    """Return an error response unless the session belongs to the administrator.
+
+    Decided from the signed claims alone. The role follows the email, and changing the email
+    bumps session_version, so a demotion applies at once on this instance and within
+    CLAIMS_MAX_AGE on the others.
+    """
+    claims = current_claims()
+    if claims is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if claims['role'] != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    return None
+
+def hasher_busy_response():
+    response = jsonify({'error': 'Server busy, please try again'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 def serialize_doc(doc):
     """Helper to convert MongoDB ObjectId to string id"""
     if doc:
         doc['id'] = str(doc['_id'])
         del doc['_id']
-        if 'reviews_data' in doc:
-            doc['reviewsList'] = doc['reviews_data']
     return doc
 
+def latest_reviews(query, limit):
+    """Newest-first reviews from the reviews collection, served by the (electrician_id, _id) index"""
+    reviews = []
+    for review in db.reviews.find(query, {'electrician_id': 0}).sort('_id', -1).limit(limit):
+        reviews.append(serialize_doc(review))
+    return reviews
+
+def encode_cursor(doc, sort_field):
+    """Encode the keyset position of the last document on a page as an opaque token"""
+    position = {'id': str(doc['_id'])}
+    if sort_field != '_id':
+        position['v'] = doc.get(sort_field, 0)
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+def cursor_clause(sort_field, position):
+    """Build the keyset filter that continues a descending (sort_field, _id) scan after position"""
+    last_id = ObjectId(position['id'])
+    if sort_field == '_id':
+        return {'_id': {'$lt': last_id}}
+    value = position['v']
+    return {'$or': [
+        {sort_field: {'$lt': value}},
+        {sort_field: value, '_id': {'$lt': last_id}}
+    ]}
+
+def get_search_index():
+    return search_rebuild.get()
+
+def get_leaderboards():
+    return leaderboards_rebuild.get()
+
+def index_profile(doc):
+    """Reflect a created or updated profile in the search index and leaderboards, where built"""
+    if not doc:
+        return
+    if doc.get('specialty') in NON_ELECTRICIAN_ROLES:
+        unindex_profile(doc['_id'])
+        return
+    for rebuild in (search_rebuild, leaderboards_rebuild):
+        rebuild.apply(lambda structure: structure.add(doc))
+
+def unindex_profile(user_id):
+    for rebuild in (search_rebuild, leaderboards_rebuild):
+        rebuild.apply(lambda structure: structure.remove(user_id))
+
 def init_db():
     """Seed data if collections are empty"""
     try:
@@ -68,21 +431,23 @@ def init_db():
                     "name": "Sarah Johnson", "specialty": "Residential Wiring", "rating": 4.8, "reviews": 120,
                     "location": "Lagos", "state": "Lagos", "image": "assets/images/profile1.jpg", 
                     "description": "Expert in residential wiring and lighting installations.", "email": "sarah@example.com",
-                    "password": generate_password_hash("password"), "signup_method": "email", "gallery": [], "reviews_data": []
+                    "password": generate_password_hash("password"), "signup_method": "email", "gallery": []
                 },
                 {
                     "name": "Michael Chen", "specialty": "Commercial Systems", "rating": 4.9, "reviews": 150,
                     "location": "Abuja", "state": "FCT - Abuja", "image": "assets/images/profile2.jpg",
                     "description": "Specializes in commercial electrical systems.", "email": "michael@example.com",
-                    "password": generate_password_hash("password"), "signup_method": "email", "gallery": [], "reviews_data": []
+                    "password": generate_password_hash("password"), "signup_method": "email", "gallery": []
                 },
                 {
                     "name": "Admin", "specialty": "Administrator", "rating": 0, "reviews": 0,
                     "location": "Nigeria", "state": "FCT - Abuja", "image": "assets/images/profile_placeholder.jpg",
                     "description": "SparkConnect Administrator", "email": "admin@sparkconnect.com",
-                    "password": generate_password_hash("admin123"), "signup_method": "email", "gallery": [], "reviews_data": []
+                    "password": generate_password_hash("admin123"), "signup_method": "email", "gallery": []
                 }
             ]
+            for user in defaults:
+                user.update(geo_fields(user['state'], user['location']))
             users_col.insert_many(defaults)
             print("Seeded database with default users.")
     except Exception as e:
@@ -116,13 +481,13 @@ def register():
         return jsonify({'error': 'Missing required fields'}), 400
     
     users_col = db.users
-    if users_col.find_one({'email': email}):
+    if not unique_email_index() and users_col.find_one({'email': email}):
         return jsonify({'error': 'Email already exists'}), 409
-        
+
     try:
         new_user = {
             'email': email,
-            'password': generate_password_hash(password),
+            'password': password_hasher.hash(password),
             'name': name,
             'specialty': specialty,
             'state': state,
@@ -133,13 +498,33 @@ def register():
             'reviews': reviews,
             'signup_method': 'email',
             'gallery': [],
-            'reviews_data': []
+            **geo_fields(state, location)
         }
+        # The unique email index rejects duplicates without a read beforehand
         users_col.insert_one(new_user)
+        upload_refs.reference(image, new_user['_id'], 'image')
+        index_profile(new_user)
+        invalidate_cache('directory')
         return jsonify({'message': 'User created successfully'}), 201
+    except DuplicateKeyError:
+        return jsonify({'error': 'Email already exists'}), 409
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def login_body(user, message):
+    return {
+        'message': message,
+        'user': {
+            'id': str(user['_id']),
+            'name': user['name'],
+            'email': user['email'],
+            'specialty': user.get('specialty'),
+            'image': user.get('image')
+        }
+    }
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.json
@@ -150,85 +535,71 @@ def login():
         users_col = db.users
         user = users_col.find_one({'$or': [{'email': email}, {'name': email}]})
         
-        if user and check_password_hash(user['password'], password):
-            session['user_id'] = str(user['_id'])
-            return jsonify({
-                'message': 'Logged in',
-                'user': {
-                    'id': str(user['_id']),
-                    'name': user['name'],
-                    'email': user['email'],
-                    'specialty': user.get('specialty'),
-                    'image': user.get('image')
-                }
-            })
+        if user and password_hasher.verify(user.get('password'), password):
+            if password_hasher.needs_rehash(user['password']):
+                # Upgrade to the configured hash parameters without delaying the login;
+                # matching on the old hash avoids clobbering a concurrent password change
+                stale_hash = user['password']
+                password_hasher.rehash_later(password, lambda new_hash: users_col.update_one(
+                    {'_id': user['_id'], 'password': stale_hash}, {'$set': {'password': new_hash}}))
+            set_session_user(user)
+            return jsonify(login_body(user, 'Logged in'))
         
         return jsonify({'error': 'Invalid credentials'}), 401
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         return jsonify({'error': f"Database connection error: {str(e)}"}), 500
 
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
-    session.pop('user_id', None)
+    clear_session_user()
     return jsonify({'message': 'Logged out'})
 
+def verify_google_token(token):
+    """Claims of a valid Google ID token; raises ValueError for an invalid one"""
+    return google_keys.verify(token, os.environ.get('GOOGLE_CLIENT_ID'))
+
+def google_signup(idinfo):
+    """New account for a first-time Google sign-in"""
+    # Note: No password for Google users
+    return {
+        'email': idinfo['email'].lower(),
+        'name': idinfo.get('name', 'Google User'),
+        'image': idinfo.get('picture', 'assets/images/profile_placeholder.jpg'),
+        'specialty': 'Visitor', # Default role
+        'state': 'Not Specified',
+        'location': 'Nigeria',
+        'description': 'Joined via Google',
+        'signup_method': 'google',
+        'rating': 0,
+        'reviews': 0,
+        'gallery': []
+    }
+
 @app.route('/api/auth/google', methods=['POST'])
 def google_auth():
     data = request.json
     token = data.get('idToken')
-    client_id = os.environ.get('GOOGLE_CLIENT_ID')
 
     if not token:
         return jsonify({'error': 'Missing ID Token'}), 400
 
     try:
         # Verify the ID token
-        idinfo = id_token.verify_oauth2_token(token, google_requests.Request(), client_id)
-
-        # ID token is valid. Get the user's Google ID and email.
-        email = idinfo['email'].lower()
-        name = idinfo.get('name', 'Google User')
-        picture = idinfo.get('picture', 'assets/images/profile_placeholder.jpg')
+        idinfo = verify_google_token(token)
 
         users_col = db.users
-        user = users_col.find_one({'email': email})
+        user = users_col.find_one({'email': idinfo['email'].lower()})
 
         if not user:
             # Create new user if they don't exist
-            new_user = {
-                'email': email,
-                'name': name,
-                'image': picture,
-                'specialty': 'Visitor', # Default role
-                'state': 'Not Specified',
-                'location': 'Nigeria',
-                'description': 'Joined via Google',
-                'signup_method': 'google',
-                'rating': 0,
-                'reviews': 0,
-                'gallery': [],
-                'reviews_data': []
-            }
-            # Note: No password for Google users
-            result = users_col.insert_one(new_user)
-            user_id = str(result.inserted_id)
-            user = new_user
-            user['_id'] = result.inserted_id
-        else:
-            user_id = str(user['_id'])
-
-        session['user_id'] = user_id
-        return jsonify({
-            'message': 'Logged in with Google',
-            'user': {
-                'id': user_id,
-                'name': user['name'],
-                'email': user['email'],
-                'specialty': user.get('specialty'),
-                'image': user.get('image')
-            }
-        })
+            user = google_signup(idinfo)
+            user['_id'] = users_col.insert_one(user).inserted_id
+
+        set_session_user(user)
+        return jsonify(login_body(user, 'Logged in with Google'))
 
     except ValueError:
         # Invalid token
@@ -237,126 +608,715 @@ def google_auth():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/me', methods=['GET'])
+@cached(lambda: [f"user:{session['user_id']}"], per_user=True)
 def get_current_user():
+    """The logged-in user's own profile, through the same whitelist as profile pages"""
     if 'user_id' not in session:
         return jsonify(None), 200
-    
     try:
-        user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-        if user:
-            return jsonify(serialize_doc(user))
-    except:
-        pass
+        user = db.users.find_one({'_id': ObjectId(session['user_id'])}, field_projection(OWNER_FIELDS))
+    except Exception:
+        user = None
+    if user:
+        return jsonify(public(user, OWNER_FIELDS))
     return jsonify(None), 200
 
-@app.route('/api/user/update', methods=['PUT'])
-def update_user():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    data = request.json
+@app.route('/api/auth/session', methods=['GET'])
+def get_session_claims():
+    """Identity for page headers and role checks, answered from the signed session alone"""
+    claims = current_claims()
+    if claims is None:
+        return jsonify(None), 200
+    return jsonify(session_body(session['user_id'], claims))
+
+def session_body(user_id, claims):
+    return {
+        'id': user_id,
+        'name': claims['name'],
+        'email': claims['email'],
+        'image': claims['image'],
+        'specialty': claims['specialty'],
+        'role': claims['role']
+    }
+
+def reset_fingerprint(user):
+    """Changes with the password hash, so a reset link works only once"""
+    return hashlib.sha256(user['password'].encode()).hexdigest()[:16]
+
+def reset_link_site():
+    """Base URL for reset links: PUBLIC_URL, else the request host if it is trusted, else None"""
+    if PUBLIC_URL:
+        return PUBLIC_URL.rstrip('/')
+    if request.host.lower() in TRUSTED_HOSTS:
+        return request.host_url.rstrip('/')
+    return None
+
+@app.route('/api/auth/forgot-password', methods=['POST'])
+def forgot_password():
+    """Queue a reset link. The answer is the same whether or not the account exists."""
+    email = ((request.json or {}).get('email') or '').strip().lower()
+    if not email:
+        return jsonify({'error': 'Missing email'}), 400
+    site = reset_link_site()
+    if site is None:
+        return jsonify({'error': 'Password reset is not available on this host'}), 503
+
+    try:
+        user = db.users.find_one({'email': email}, {'name': 1, 'email': 1, 'password': 1})
+        # Google accounts have no password to reset
+        if user and user.get('password'):
+            token = get_serializer().dumps({'id': str(user['_id']), 'f': reset_fingerprint(user)}, salt='password-reset')
+            link = f"{site}/reset-password.html?token={token}"
+            mail_queue.enqueue(
+                user['email'],
+                'Reset your SparkConnect password',
+                f"Hi {user.get('name') or 'there'},\n\n"
+                f"Someone asked to reset the password for your SparkConnect account. "
+                f"To choose a new one, open this link within {PASSWORD_RESET_MAX_AGE // 60} minutes:\n\n"
+                f"{link}\n\nIf it wasn't you, ignore this email; your password stays the same.\n"
+            )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': 'If that email has an account, a reset link is on its way'}), 202
+
+@app.route('/api/auth/reset-password', methods=['POST'])
+def reset_password():
+    data = request.json or {}
+    password = data.get('password')
+    if not password:
+        return jsonify({'error': 'Missing password'}), 400
+
+    invalid = jsonify({'error': 'This reset link is invalid or has expired'}), 400
+    try:
+        claims = get_serializer().loads(data.get('token') or '', salt='password-reset', max_age=PASSWORD_RESET_MAX_AGE)
+        user_id = ObjectId(claims['id'])
+    except Exception:
+        return invalid
+    user = db.users.find_one({'_id': user_id}, {'password': 1})
+    if not user or not user.get('password') or reset_fingerprint(user) != claims['f']:
+        return invalid
+
+    try:
+        new_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return hasher_busy_response()
+    # Matching on the old hash keeps the link single-use even when two resets race
+    result = db.users.update_one({'_id': user_id, 'password': user['password']}, {'$set': {'password': new_hash}})
+    if not result.modified_count:
+        return invalid
+    return jsonify({'message': 'Password updated'})
+
+def update_profile(user_id, data):
     fields = ['name', 'specialty', 'location', 'state', 'phone', 'whatsapp', 'description', 'image', 'email']
     updates = {}
     
     for field in fields:
         if field in data:
             updates[field] = data[field]
+    # The stored image, state and location: the old image's reference is released, and a
+    # partial update geocodes against the half that was not sent
+    moved = 'state' in updates or 'location' in updates
+    previous_fields = {'image': 1} if 'image' in updates else {}
+    if moved:
+        previous_fields.update(state=1, location=1)
+    previous = db.users.find_one({'_id': ObjectId(user_id)}, previous_fields) if previous_fields else None
+    if moved:
+        merged = {**(previous or {}), **updates}
+        updates.update(geo_fields(merged.get('state'), merged.get('location')))
+    if isinstance(updates.get('image'), str):
+        updates['image_media'] = lookup_media(db, [updates['image']]).get(media_key(updates['image']))
             
     if updates:
-        db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$set': updates})
+        try:
+            # Bumping session_version retires claims signed into this user's other sessions
+            user = db.users.find_one_and_update(
+                {'_id': ObjectId(user_id)},
+                {'$set': updates, '$inc': {'session_version': 1}},
+                projection={**SEARCH_PROJECTION, **CLAIMS_PROJECTION},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return {'error': 'Email already exists'}, 409
+        if user:
+            note_version(user_id, user['session_version'])
+            set_session_user(user)
+        if 'image' in updates and previous and previous.get('image') != updates['image']:
+            upload_refs.reference(updates['image'], user_id, 'image')
+            upload_refs.release(previous.get('image'), user_id, 'image')
+        index_profile(user)
+        invalidate_cache('directory', f"user:{user_id}")
     
-    return jsonify({'message': 'Profile updated'})
+    return {'message': 'Profile updated'}, 200
+
+@app.route('/api/user/update', methods=['PUT'])
+def update_user():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    body, status = update_profile(session['user_id'], request.json or {})
+    return jsonify(body), status
+
+def listing_query(args):
+    """Parse directory query parameters into (filter, sort, limit, sort_field, fields).
+
+    Raises ValueError with the message for a 400. Shared with the async app
+    (api/_asgi.py) so both serve the same pages.
+    """
+    try:
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('Invalid limit')
+
+    sort = args.get('sort', 'rating')
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort, expected one of: {', '.join(SORT_FIELDS)}")
+    sort_field = SORT_FIELDS[sort]
+
+    specialty_filter = {'$nin': NON_ELECTRICIAN_ROLES}
+    specialties = [s.strip() for s in args.get('specialty', '').split(',') if s.strip()]
+    if specialties:
+        # Anchored prefix match so "Solar" finds "Solar Panel Installer" and can still use an index
+        specialty_filter['$in'] = [re.compile('^' + re.escape(s), re.IGNORECASE) for s in specialties]
+    clauses = [{'specialty': specialty_filter}]
+
+    state = args.get('state')
+    if state:
+        clauses.append({'state': state})
+
+    min_rating = args.get('min_rating')
+    if min_rating:
+        try:
+            clauses.append({'rating': {'$gte': float(min_rating)}})
+        except ValueError:
+            raise ValueError('Invalid min_rating')
+
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            clauses.append(cursor_clause(sort_field, decode_cursor(cursor)))
+        except Exception:
+            raise ValueError('Invalid cursor')
+
+    fields = select_fields(args.get('fields'))
+    sort_spec = [(sort_field, -1)] if sort_field == '_id' else [(sort_field, -1), ('_id', -1)]
+    return {'$and': clauses}, sort_spec, limit, sort_field, fields
+
+def listing_projection(fields, sort_field):
+    """Inclusion projection for a listing; the sort field rides along for the next cursor"""
+    return field_projection(fields, sort_field)
+
+def listing_page(docs, limit, sort_field, fields=LISTING_FIELDS):
+    """Response body for up to limit + 1 documents read with listing_query"""
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return {
+        'electricians': [public(u, fields) for u in docs],
+        'next_cursor': next_cursor
+    }
 
 @app.route('/api/electricians', methods=['GET'])
+@cached(lambda: ['directory'])
 def get_electricians():
-    users = db.users.find({'specialty': {'$nin': ['Visitor', 'Administrator']}})
-    result = []
-    for u in users:
-        result.append(serialize_doc(u))
-    return jsonify(result)
+    try:
+        query, sort_spec, limit, sort_field, fields = listing_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Fetch one extra document to know whether another page exists
+    docs = list(db.users.find(query, listing_projection(fields, sort_field)).sort(sort_spec).limit(limit + 1))
+    return jsonify(listing_page(docs, limit, sort_field, fields))
 
-@app.route('/api/electricians/<string:id>/review', methods=['POST'])
-def add_review(id):
-    data = request.json
+@app.route('/api/electricians/export', methods=['GET'])
+def export_electricians():
+    """Every profile matching the directory filters, in one streamed response.
+
+    Takes the same parameters as /api/electricians except limit and cursor.
+    The cursor is encoded a batch at a time as the client reads, so memory
+    does not grow with the directory.
+    """
+    args = request.args.copy()
+    args.pop('cursor', None)
+    try:
+        query, sort_spec, _, sort_field, fields = listing_query(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cursor = db.users.find(query, listing_projection(fields, sort_field)).sort(sort_spec).batch_size(EXPORT_BATCH_SIZE)
+    electricians = (public(doc, fields) for doc in cursor)
+    return Response(stream_array('electricians', electricians, {'next_cursor': None}), mimetype='application/json')
+
+@app.route('/api/electricians/search', methods=['GET'])
+def search_electricians():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing q'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('cursor', 0)), 0)
+        min_rating = float(request.args.get('min_rating') or 0)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, cursor or min_rating'}), 400
+    try:
+        # The index holds listing summaries, so contact fields cannot be asked for here
+        fields = select_fields(request.args.get('fields'), allowed=LISTING_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    state = request.args.get('state')
+    specialties = tuple(s.strip().lower() for s in request.args.get('specialty', '').split(',') if s.strip())
+
+    def matches_filters(summary):
+        if state and summary.get('state') != state:
+            return False
+        if specialties and not (summary.get('specialty') or '').lower().startswith(specialties):
+            return False
+        return (summary.get('rating') or 0) >= min_rating
+
+    filtered = state or specialties or min_rating
+    # Ask for one extra result to know whether another page exists
+    results = get_search_index().search(query, limit + 1, offset, matches_filters if filtered else None)
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = str(offset + limit)
+    return jsonify({'electricians': [public(r, fields) for r in results], 'next_cursor': next_cursor})
+
+def nearby_coordinate(value):
+    return round(float(value), NEARBY_COORD_DECIMALS)
+
+def nearby_key_args(items):
+    """Query items with lat/lng rounded as nearby_electricians rounds them"""
+    normalized = []
+    for name, value in items:
+        if name in ('lat', 'lng'):
+            try:
+                value = str(nearby_coordinate(value))
+            except ValueError:
+                pass
+        normalized.append((name, value))
+    return normalized
+
+@app.route('/api/electricians/nearby', methods=['GET'])
+@cached(lambda: ['directory'], key_args=nearby_key_args)
+def nearby_electricians():
+    """Electricians within radius km of lat/lng, ranked by distance blended with rating.
+
+    Profiles sit on gazetteer points (see api/_geo.py), so this walks the points
+    nearest first and reads each one's best-rated profiles from the
+    (geo_cell, rating) index. It stops once no unread point could place a
+    profile in the top limit, even at a perfect rating.
+    """
+    try:
+        lat = nearby_coordinate(request.args['lat'])
+        lng = nearby_coordinate(request.args['lng'])
+        radius = float(request.args.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'lat and lng are required; radius and limit must be numbers'}), 400
+    try:
+        fields = select_fields(request.args.get('fields'), LISTING_FIELDS + ('distance_km',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+        return jsonify({'error': f"Invalid coordinates or radius (max {NEARBY_MAX_RADIUS_KM} km)"}), 400
+
+    specialty_filter = {'$nin': NON_ELECTRICIAN_ROLES}
+    specialties = [s.strip() for s in request.args.get('specialty', '').split(',') if s.strip()]
+    if specialties:
+        specialty_filter['$in'] = [re.compile('^' + re.escape(s), re.IGNORECASE) for s in specialties]
+
+    def score(distance, rating):
+        return (1 - NEARBY_RATING_WEIGHT) * (1 - distance / radius) + NEARBY_RATING_WEIGHT * min(rating or 0, 5) / 5
+
+    top = []    # min-heap of (score, id, doc)
+    for distance, cell in cells_within(lat, lng, radius):
+        if len(top) >= limit and top[0][0] >= score(distance, 5):
+            break
+        cursor = db.users.find({'geo_cell': cell, 'specialty': specialty_filter}, field_projection(fields, 'rating'))
+        for doc in cursor.sort([('rating', -1), ('_id', -1)]).limit(limit):
+            item = (score(distance, doc.get('rating')), str(doc['_id']), doc)
+            if len(top) < limit:
+                heapq.heappush(top, item)
+            elif item[:2] > top[0][:2]:
+                heapq.heapreplace(top, item)
+            else:
+                # The rest of this point is rated lower still
+                break
+            doc['distance_km'] = round(distance, 1)
+
+    electricians = [public(doc, fields) for _, _, doc in sorted(top, key=lambda item: item[:2], reverse=True)]
+    return jsonify({'electricians': electricians, 'next_cursor': None})
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Top electricians overall, in a state, in a specialty or both, by Bayesian-averaged rating"""
+    try:
+        limit = min(max(int(request.args.get('limit', LEADERBOARD_DEFAULT_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    try:
+        fields = select_fields(request.args.get('fields'), LEADERBOARD_FIELDS, LEADERBOARD_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    boards = get_leaderboards()
+    top = boards.top(request.args.get('state'), request.args.get('specialty'), limit)
+    return jsonify({
+        'electricians': [public(summary, fields) for summary in top],
+        'prior': {'mean': round(boards.prior_mean, 2), 'weight': boards.prior_weight}
+    })
+
+@app.route('/api/electricians/<string:id>', methods=['GET'])
+@cached(lambda id: [f"user:{id}"])
+def get_electrician(id):
+    try:
+        projection, review_count = profile_projection(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        user = db.users.find_one({'_id': ObjectId(id)}, projection)
+    except Exception:
+        return jsonify({'error': 'Invalid ID'}), 400
+    if not user:
+        return jsonify({'error': 'Electrician not found'}), 404
+    if review_count:
+        user['reviewsList'] = latest_reviews({'electrician_id': user['_id']}, review_count)
+    return jsonify(profile_body(user))
+
+def profile_projection(args):
+    """(projection, review count) for a profile read; raises ValueError for a 400"""
+    try:
+        review_count = min(max(int(args.get('reviews', 0)), 0), MAX_PAGE_SIZE)
+        gallery_count = min(max(int(args.get('gallery', 0)), 0), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('Invalid reviews or gallery count')
+
+    # Embed only the first gallery items that were asked for
+    projection = field_projection([field for field in PROFILE_FIELDS if not field.startswith('gallery')])
+    if gallery_count:
+        projection.update({'gallery': {'$slice': gallery_count}, 'gallery_media': 1})
+    return projection, review_count
+
+def profile_body(user):
+    # Only the variants of the gallery items being returned
+    media = user.pop('gallery_media', None) or {}
+    user['gallery_media'] = {}
+    for item in user.get('gallery', []):
+        if isinstance(item, str) and media_key(item) in media:
+            user['gallery_media'][media_key(item)] = media[media_key(item)]
+    return public(user, PROFILE_FIELDS)
+
+def create_review(id, data):
     rating = data.get('rating')
     name = data.get('name')
     comment = data.get('comment')
     
     if not rating or not name:
-        return jsonify({'error': 'Missing rating or name'}), 400
-        
+        return {'error': 'Missing rating or name'}, 400
+    if not isinstance(rating, int) or isinstance(rating, bool) or not 1 <= rating <= 5:
+        return {'error': 'Rating must be a whole number from 1 to 5'}, 400
+
     try:
-        user = db.users.find_one({'_id': ObjectId(id)})
-        if not user:
-            return jsonify({'error': 'Electrician not found'}), 404
-            
-        new_review = {
-            'rating': rating,
-            'name': name,
-            'comment': comment,
-            'date': data.get('date') or datetime.now().isoformat()
-        }
-        
-        reviews_list = user.get('reviews_data', [])
-        reviews_list.append(new_review)
-        
-        total_rating = sum(r['rating'] for r in reviews_list)
-        new_avg = round(total_rating / len(reviews_list), 1)
-        new_count = len(reviews_list)
-        
-        db.users.update_one(
-            {'_id': ObjectId(id)},
+        electrician_id = ObjectId(id)
+    except Exception:
+        return {'error': 'Invalid ID'}, 400
+
+    # One atomic update keeps the running sum, count and average consistent under
+    # concurrent reviews. Profiles from before rating_sum existed start from rating * reviews.
+    rating_sum = {'$ifNull': ['$rating_sum', {'$multiply': [{'$ifNull': ['$rating', 0]}, {'$ifNull': ['$reviews', 0]}]}]}
+    user = db.users.find_one_and_update(
+        {'_id': electrician_id},
+        [
             {'$set': {
-                'reviews_data': reviews_list,
-                'rating': new_avg,
-                'reviews': new_count
-            }}
-        )
-        
-        return jsonify({'message': 'Review added', 'rating': new_avg, 'reviews': new_count})
-    except:
-        return jsonify({'error': 'Invalid ID'}), 400
+                'rating_sum': {'$add': [rating_sum, rating]},
+                'reviews': {'$add': [{'$ifNull': ['$reviews', 0]}, 1]}
+            }},
+            {'$set': {'rating': {'$round': [{'$divide': ['$rating_sum', '$reviews']}, 1]}}}
+        ],
+        projection=SEARCH_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        return {'error': 'Electrician not found'}, 404
+
+    db.reviews.insert_one({
+        'electrician_id': electrician_id,
+        'rating': rating,
+        'name': name,
+        'comment': comment,
+        'date': data.get('date') or datetime.now().isoformat()
+    })
+    index_profile(user)
+    invalidate_cache('directory', f"user:{id}")
+
+    return {'message': 'Review added', 'rating': user['rating'], 'reviews': user['reviews']}, 200
+
+@app.route('/api/electricians/<string:id>/review', methods=['POST'])
+def add_review(id):
+    body, status = create_review(id, request.json or {})
+    return jsonify(body), status
+
+@app.route('/api/electricians/<string:id>/reviews', methods=['GET'])
+@cached(lambda id: [f"user:{id}"])
+def get_reviews(id):
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        query = {'electrician_id': ObjectId(id)}
+        cursor = request.args.get('cursor')
+        if cursor:
+            query['_id'] = {'$lt': ObjectId(cursor)}
+    except Exception:
+        return jsonify({'error': 'Invalid ID, limit or cursor'}), 400
 
+    reviews = latest_reviews(query, limit + 1)
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = reviews[-1]['id']
+    return jsonify({'reviews': reviews, 'next_cursor': next_cursor})
+
+# Every upload route needs a logged-in user: uploads cost storage, and each one is tracked in upload_refs
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        import time
-        filename = f"{int(time.time())}_{filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        return jsonify({'url': f"assets/uploads/{filename}"})
+        ext = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+        try:
+            # Werkzeug has already spooled the form to file.stream; MAX_CONTENT_LENGTH capped it
+            filename = storage.save_stream(file.stream, ext, MAX_UPLOAD_BYTES)
+        except UploadTooLarge:
+            return upload_too_large(limit=MAX_UPLOAD_BYTES)
+        upload_refs.uploaded(filename)
+        media_pipeline.submit(filename)
+        return jsonify({'url': storage.url(filename)})
     return jsonify({'error': 'Invalid file type'}), 400
 
-@app.route('/api/user/gallery', methods=['POST'])
-def add_to_gallery():
+@app.route('/api/uploads', methods=['POST'])
+def start_resumable_upload():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
-    data = request.json
+    data = request.json or {}
+    filename = data.get('filename', '')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Missing size'}), 400
+    if size <= 0 or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type or size'}), 400
+    try:
+        upload_id = resumable_uploads.start(filename.rsplit('.', 1)[1].lower(), size)
+    except UploadTooLarge:
+        return upload_too_large(limit=MAX_RESUMABLE_BYTES)
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'chunk_size': RESUMABLE_CHUNK_BYTES}), 201
+
+@app.route('/api/uploads/<string:upload_id>', methods=['GET'])
+def resumable_upload_status(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        meta, offset = resumable_uploads.status(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({'offset': offset, 'size': meta['size']})
+
+@app.route('/api/uploads/<string:upload_id>', methods=['PUT'])
+def resumable_upload_chunk(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Content-Range: bytes <start>-<end>/<total>
+    match = re.match(r'bytes (\d+)-(\d+)/(\d+)$', request.headers.get('Content-Range', ''))
+    if not match:
+        return jsonify({'error': 'Missing or invalid Content-Range'}), 400
+    try:
+        offset, filename = resumable_uploads.append(upload_id, int(match.group(1)), request.stream)
+    except UploadError as e:
+        # 409 tells the client to ask for the offset and resume from there
+        return jsonify({'error': str(e)}), 409
+    if filename:
+        upload_refs.uploaded(filename)
+        media_pipeline.submit(filename)
+        return jsonify({'offset': offset, 'url': storage.url(filename)})
+    return jsonify({'offset': offset})
+
+@app.route('/api/uploads/direct', methods=['POST'])
+def start_direct_upload():
+    """Presigned form for sending a file straight to storage, bypassing this worker.
+
+    Body: {"filename": "clip.mp4", "size": 12345678}. The client POSTs the
+    file to upload.url with upload.fields as form fields (the file last), then
+    confirms with POST /api/uploads/direct/complete and the token. Answers 501
+    when the storage backend cannot take direct uploads; clients then fall
+    back to /api/upload and the resumable routes.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not storage.direct_uploads:
+        return jsonify({'error': 'Direct uploads are not available'}), 501
+    data = request.json or {}
+    filename = data.get('filename', '')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Missing size'}), 400
+    if size <= 0 or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type or size'}), 400
+    if size > MAX_RESUMABLE_BYTES:
+        return upload_too_large(limit=MAX_RESUMABLE_BYTES)
+
+    key = f"{uuid.uuid4().hex}.{filename.rsplit('.', 1)[1].lower()}"
+    # Tracked from now on, so an upload that is never completed is collected as an orphan
+    upload_refs.uploaded(key, size=0)
+    return jsonify({
+        'upload': storage.presign_upload(key, size, DIRECT_UPLOAD_EXPIRES),
+        'token': get_serializer().dumps({'key': key, 'size': size, 'user': session['user_id']}, salt='direct-upload'),
+        'url': storage.url(key),
+        'expires_in': DIRECT_UPLOAD_EXPIRES
+    }), 201
+
+@app.route('/api/uploads/direct/complete', methods=['POST'])
+def complete_direct_upload():
+    """Completion callback for a direct upload: checks the stored object and starts its media processing"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        # Twice the form's lifetime, so a large file sent just before the form expired can still finish
+        claims = get_serializer().loads((request.json or {}).get('token') or '', salt='direct-upload',
+                                        max_age=DIRECT_UPLOAD_EXPIRES * 2)
+        key, expected = claims['key'], claims['size']
+        # Only the user the form was issued to can complete it
+        if claims['user'] != session['user_id']:
+            raise ValueError(claims['user'])
+    except Exception:
+        return jsonify({'error': 'Invalid or expired upload token'}), 400
+    size = storage.size(key)
+    if size != expected:
+        # 409: not there yet, or a different size than was declared
+        return jsonify({'error': 'Upload not found in storage, or incomplete'}), 409
+    upload_refs.uploaded(key, size)
+    media_pipeline.submit(key)
+    return jsonify({'url': storage.url(key), 'size': size})
+
+@app.errorhandler(413)
+def upload_too_large(error=None, limit=MAX_UPLOAD_BYTES):
+    """limit is the cap that was exceeded; Werkzeug's own 413 comes from a form upload or chunk body"""
+    return jsonify({'error': f"File too large (max {limit // (1024 * 1024)} MB)", 'max_bytes': limit}), 413
+
+def add_gallery_items(user_id, data):
     new_item = data.get('url')
     if not new_item:
-        return jsonify({'error': 'Missing url'}), 400
-    if isinstance(new_item, list):
-        db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$push': {'gallery': {'$each': new_item}}})
-    else:
-        db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$push': {'gallery': new_item}})
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-    return jsonify({'gallery': user.get('gallery', [])})
+        return {'error': 'Missing url'}, 400
+    items = new_item if isinstance(new_item, list) else [new_item]
+    user = db.users.find_one_and_update(
+        {'_id': ObjectId(user_id)},
+        {'$push': {'gallery': {'$each': items}}},
+        projection=GALLERY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        return {'error': 'User not found'}, 404
+    upload_refs.reference(items, user_id, 'gallery')
+    # Variants finished before the push are copied over now; later ones are copied by the
+    # media worker, which looks for the URL in galleries. Looking up after the push means
+    # one of the two always sees the other's write.
+    media = lookup_media(db, [item for item in items if isinstance(item, str)])
+    if media:
+        db.users.update_one(
+            {'_id': user['_id']},
+            {'$set': {f"gallery_media.{key}": entry for key, entry in media.items()}}
+        )
+    invalidate_cache(f"user:{user_id}")
+    return {'gallery': user.get('gallery', [])}, 200
+
+def remove_gallery_item(user_id, data):
+    item_to_remove = data.get('url')
+    update = {'$pull': {'gallery': item_to_remove}}
+    if isinstance(item_to_remove, str):
+        update['$unset'] = {f"gallery_media.{media_key(item_to_remove)}": ''}
+    user = db.users.find_one_and_update(
+        {'_id': ObjectId(user_id)},
+        update,
+        projection=GALLERY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        return {'error': 'User not found'}, 404
+    # $pull removed every copy, so the gallery no longer uses the file at all
+    upload_refs.release(item_to_remove, user_id, 'gallery')
+    invalidate_cache(f"user:{user_id}")
+    return {'gallery': user.get('gallery', [])}, 200
+
+@app.route('/api/user/gallery', methods=['POST'])
+def add_to_gallery():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    body, status = add_gallery_items(session['user_id'], request.json or {})
+    return jsonify(body), status
 
 @app.route('/api/user/gallery', methods=['DELETE'])
 def remove_from_gallery():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
-    data = request.json
-    item_to_remove = data.get('url')
-    db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$pull': {'gallery': item_to_remove}})
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-    return jsonify({'gallery': user.get('gallery', [])})
+    body, status = remove_gallery_item(session['user_id'], request.json or {})
+    return jsonify(body), status
+
+# op name -> (handler, whether it acts on the logged-in user)
+BATCH_OPERATIONS = {
+    'profile.update': (update_profile, True),
+    'gallery.add': (add_gallery_items, True),
+    'gallery.remove': (remove_gallery_item, True),
+    'review.add': (create_review, False)
+}
+
+def run_batch_op(op):
+    if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+        return {'error': f"Unknown op, expected one of: {', '.join(BATCH_OPERATIONS)}"}, 400
+    handler, for_user = BATCH_OPERATIONS[op['op']]
+    data = op.get('data') or {}
+    if not isinstance(data, dict):
+        return {'error': 'data must be an object'}, 400
+    if not for_user:
+        return handler(str(op.get('id', '')), data)
+    if 'user_id' not in session:
+        return {'error': 'Unauthorized'}, 401
+    return handler(session['user_id'], data)
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Run an ordered list of write operations in one request.
+
+    Body: {"ops": [{"op": "gallery.add", "data": {"url": ...}},
+                   {"op": "profile.update", "data": {...}},
+                   {"op": "review.add", "id": "<electrician id>", "data": {...}}],
+           "stop_on_error": false}
+    Each op gets the status and body its standalone route would have returned.
+    Ops are not a transaction: earlier ones stay applied when a later one fails.
+    """
+    data = request.json or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'Missing ops'}), 400
+    if len(ops) > MAX_BATCH_OPS:
+        return jsonify({'error': f"At most {MAX_BATCH_OPS} ops per batch"}), 400
+
+    results = []
+    failed = False
+    for op in ops:
+        if failed and data.get('stop_on_error'):
+            results.append({'status': 424, 'body': {'error': 'Skipped after an earlier op failed'}})
+            continue
+        try:
+            body, status = run_batch_op(op)
+        except Exception as e:
+            body, status = {'error': str(e)}, 500
+        failed = failed or status >= 400
+        results.append({'status': status, 'body': body})
+    return jsonify({'results': results})
 
 @app.route('/api/user/delete', methods=['DELETE'])
 def delete_current_user():
@@ -364,27 +1324,95 @@ def delete_current_user():
         return jsonify({'error': 'Unauthorized'}), 401
     try:
         user_id = session['user_id']
-        db.users.delete_one({'_id': ObjectId(user_id)})
-        session.pop('user_id', None)
+        user = db.users.find_one_and_delete({'_id': ObjectId(user_id)}, projection=UPLOAD_REFERENCE_PROJECTION)
+        if user:
+            upload_refs.release_user(user)
+        db.reviews.delete_many({'electrician_id': ObjectId(user_id)})
+        unindex_profile(user_id)
+        invalidate_cache('directory', f"user:{user_id}")
+        clear_session_user()
         return jsonify({'message': 'Account deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/users/<string:user_id>', methods=['DELETE'])
 def admin_delete_user(user_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    current_user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-    if not current_user or current_user['email'] != 'admin@sparkconnect.com':
-        return jsonify({'error': 'Admin access required'}), 403
+    error = admin_error()
+    if error:
+        return error
     if user_id == session['user_id']:
         return jsonify({'error': 'Cannot delete your own account'}), 400
     try:
-        db.users.delete_one({'_id': ObjectId(user_id)})
+        user = db.users.find_one_and_delete({'_id': ObjectId(user_id)}, projection=UPLOAD_REFERENCE_PROJECTION)
+        if user:
+            upload_refs.release_user(user)
+        db.reviews.delete_many({'electrician_id': ObjectId(user_id)})
+        unindex_profile(user_id)
+        invalidate_cache('directory', f"user:{user_id}")
         return jsonify({'message': 'User deleted successfully'})
     except:
         return jsonify({'error': 'Invalid ID'}), 400
 
+@app.route('/api/admin/cache', methods=['GET'])
+def cache_stats():
+    error = admin_error()
+    if error:
+        return error
+    if response_cache is None:
+        return jsonify({'enabled': False, 'google_keys': google_keys.snapshot(),
+                        'leaderboards': leaderboards.snapshot()})
+    return jsonify({'enabled': True, **response_cache.snapshot(), 'google_keys': google_keys.snapshot(),
+                    'leaderboards': leaderboards.snapshot()})
+
+@app.route('/api/admin/media', methods=['GET'])
+def media_queue_stats():
+    error = admin_error()
+    if error:
+        return error
+    return jsonify(media_pipeline.snapshot())
+
+@app.route('/api/admin/uploads', methods=['GET'])
+def upload_gc_stats():
+    error = admin_error()
+    if error:
+        return error
+    return jsonify(upload_refs.snapshot())
+
+@app.route('/api/admin/uploads/collect', methods=['POST'])
+def collect_orphaned_uploads():
+    """Delete or quarantine one batch of uploads no profile has used for the grace period.
+
+    Body (optional): {"limit": 200, "dry_run": true}. Schedule this, or run
+    python api/_upload_gc.py collect, to keep storage from growing.
+    """
+    error = admin_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        limit = min(max(int(data.get('limit') or upload_refs.batch_size), 1), upload_refs.batch_size)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit'}), 400
+    return jsonify(upload_refs.collect(limit, dry_run=bool(data.get('dry_run'))))
+
+@app.route('/api/admin/mail', methods=['GET'])
+def mail_queue_stats():
+    error = admin_error()
+    if error:
+        return error
+    return jsonify(mail_queue.snapshot())
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Scrapers cannot log in, so METRICS_TOKEN also grants access as a bearer token
+    token = os.environ.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization, f"Bearer {token}")):
+        error = admin_error()
+        if error:
+            return error
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/debug/config', methods=['GET'])
 def debug_config():
     uri = os.environ.get('MONGO_URI', 'NOT SET')
@@ -408,17 +1436,15 @@ def debug_config():
 # Local testing execution block
 if __name__ == '__main__':
     init_db()
+    # A local server is long-lived, so it creates its own indexes unless told not to
+    if 'ENSURE_INDEXES' not in os.environ:
+        indexes_ready = False
     
-    # In local testing, index.py can serve static files
-    @app.route('/')
-    def serve_index():
-        return send_from_directory(BASE_DIR, 'index.html')
-
-    @app.route('/<path:path>')
-    def serve_static(path):
-        full_path = os.path.join(BASE_DIR, path)
-        if os.path.exists(full_path):
-            return send_from_directory(BASE_DIR, path)
-        return send_from_directory(BASE_DIR, 'index.html')
+    # In local testing, index.py serves the site too: the output of build_static.py when
+    # there is one, else public/ as it is. Local uploads always come from public/, where they are
+    # written; uploads in a bucket are served by the bucket.
+    DIST_DIR = os.path.join(API_DIR, '..', 'dist')
+    install_static(app, os.environ.get('STATIC_ROOT') or (DIST_DIR if os.path.isdir(DIST_DIR) else BASE_DIR),
+                   uploads_root=getattr(storage, 'root', None))
 
     app.run(debug=True, host='0.0.0.0', port=5000)
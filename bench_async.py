@@ -0,0 +1,211 @@
+"""Sync (Flask/WSGI) vs async (ASGI/motor) API under I/O-bound load.
+
+Boots each app in turn against the same scratch database on the local
+mongod and drives listing and login traffic from many concurrent clients:
+
+    python bench_async.py --concurrency 256 --latency-ms 20 --output async.json
+
+The sync app runs on a fixed pool of --sync-threads request threads, the
+way a gunicorn/Vercel worker would, so it serves at most that many requests
+at once. The async app runs on one uvicorn event loop.
+
+MongoDB on localhost answers in well under a millisecond, which hides the
+difference this is meant to show, so both apps reach it through a TCP proxy
+that delays every chunk by --latency-ms (roughly a hosted cluster in
+another region). The response cache is off and stored passwords use a
+cheap hash, so every request pays for its database round trips and little
+else. Reuses load_test.py's seeding, traffic and reporting; needs the async
+app's packages (pip install -r requirements-async.txt).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from load_test import PASSWORD, seed, run_clients, summarize, print_table, git_commit
+
+ROUTES = 'listing=3,login=1'
+# Cheap enough that login is dominated by its database read, not by hashing
+BENCH_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--profiles', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=15, help='seconds of measured traffic per mode')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--latency-ms', type=float, default=20, help='delay added to each MongoDB message')
+    parser.add_argument('--sync-threads', type=int, default=8, help='request threads for the sync app')
+    parser.add_argument('--mix', default=ROUTES, help=f"listing/login weights (default {ROUTES})")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write both runs to this JSON file')
+    return parser.parse_args()
+
+class LatencyProxy:
+    """TCP proxy that holds every chunk for delay seconds before passing it on"""
+    def __init__(self, target_host, target_port, delay):
+        self.target = (target_host, target_port)
+        self.delay = delay
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            server = self.loop.run_until_complete(asyncio.start_server(self.connect, '127.0.0.1', 0))
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self.port
+
+    async def connect(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(*self.target)
+        await asyncio.gather(self.pipe(client_reader, server_writer), self.pipe(server_reader, client_writer),
+                             return_exceptions=True)
+
+    async def pipe(self, reader, writer):
+        try:
+            while chunk := await reader.read(65536):
+                await asyncio.sleep(self.delay)
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            writer.close()
+
+def serve_sync(index, threads):
+    """index.app on a werkzeug server with a fixed pool of request threads"""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledServer(BaseWSGIServer):
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.finish_pooled, request, client_address)
+
+        def finish_pooled(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledServer('127.0.0.1', 0, index.app, handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+def serve_async(asgi_module):
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    config = uvicorn.Config(asgi_module.app, log_level='warning', access_log=False, backlog=4096)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        thread.join(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", stop
+
+def measure(label, base_url, ids, args, mix):
+    samples = {}
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + args.warmup
+
+    def record(name, started, finished, status):
+        if started < measure_from:
+            return
+        with lock:
+            samples.setdefault(name, []).append(((finished - started) * 1000, status))
+
+    print(f"\n{label}: {args.concurrency} clients for {args.warmup:g}s warm-up + {args.duration:g}s...")
+    run_clients(base_url, ids, args, mix, measure_from + args.duration, record)
+    routes, total = summarize(samples, args.duration)
+    print_table(routes, total)
+    return {'routes': routes, 'total': total}
+
+def bench_async():
+    args = parse_args()
+    mix = {}
+    for part in args.mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('listing', 'login'):
+            sys.exit(f"Only listing and login are compared, not {name}")
+        mix[name.strip()] = float(weight or 1)
+
+    os.environ['CACHE_BACKEND'] = 'none'
+    os.environ['MEDIA_WORKERS'] = '0'
+    os.environ['PASSWORD_HASH_METHOD'] = BENCH_HASH_METHOD
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+    import index
+    import _asgi
+    from pymongo import MongoClient
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from werkzeug.security import generate_password_hash
+
+    database = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)['sparkconnect_loadtest']
+    print(f"Seeding {args.profiles} profiles ({args.mongo_uri})...")
+    ids = seed(index, database, args.profiles, random.Random(args.seed))
+    database.users.update_many({}, {'$set': {'password': generate_password_hash(PASSWORD, BENCH_HASH_METHOD)}})
+
+    address = args.mongo_uri.split('://', 1)[1].split('/', 1)[0]
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '27017')
+    proxy_port = LatencyProxy(host, int(port), args.latency_ms / 1000).start()
+    # directConnection keeps the drivers on the proxy instead of the member addresses it reports
+    proxied_uri = f"mongodb://127.0.0.1:{proxy_port}/?directConnection=true"
+    index.db = MongoClient(proxied_uri, maxPoolSize=args.sync_threads * 2)['sparkconnect_loadtest']
+    _asgi.db = AsyncIOMotorClient(proxied_uri, maxPoolSize=args.concurrency)['sparkconnect_loadtest']
+
+    results = {}
+    base_url, stop = serve_sync(index, args.sync_threads)
+    results['sync'] = measure(f"sync (Flask, {args.sync_threads} threads)", base_url, ids, args, mix)
+    stop()
+    base_url, stop = serve_async(_asgi)
+    results['async'] = measure('async (Starlette + motor, one event loop)', base_url, ids, args, mix)
+    stop()
+
+    print(f"\nasync vs sync at {args.concurrency} clients, {args.latency_ms:g} ms per MongoDB message:")
+    for name in list(mix) + ['total']:
+        sync = results['sync']['total'] if name == 'total' else results['sync']['routes'].get(name)
+        other = results['async']['total'] if name == 'total' else results['async']['routes'].get(name)
+        if sync and other and sync['rps'] and sync['p95_ms']:
+            print(f"  {name:<8} rps {other['rps'] / sync['rps']:.1f}x, p95 {other['p95_ms'] / sync['p95_ms']:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'config': {
+                    'profiles': args.profiles,
+                    'concurrency': args.concurrency,
+                    'duration_s': args.duration,
+                    'latency_ms': args.latency_ms,
+                    'sync_threads': args.sync_threads,
+                    'mix': mix,
+                },
+                **results
+            }, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    bench_async()
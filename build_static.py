@@ -0,0 +1,508 @@
+"""Build public/ into a deployable static site.
+
+    python build_static.py [--out dist] [--no-images]
+
+- HTML, CSS and JS are minified. The minifiers are deliberately
+  conservative: comments and redundant whitespace go, but JS keeps its line
+  breaks so automatic semicolon insertion is never affected.
+- CSS, JS and images are renamed to name.<hash>.ext (first 10 hex digits of
+  their SHA-256), and every reference to them in HTML, CSS and JS is
+  rewritten. Only the HTML pages keep their names, so they are the only
+  files a deploy has to revalidate.
+- Images are scaled down to the width they are shown at (IMAGE_WIDTHS) and
+  get a WebP copy. Photos without transparency fall back to JPEG rather
+  than PNG. CSS backgrounds serve the WebP through image-set(); browsers
+  without image-set keep the plain url() fallback in front of it.
+- Text files get .gz and .br siblings (.br needs the brotli package) for
+  servers that send precompressed files.
+- vercel.json gets immutable Cache-Control for fingerprinted files and
+  revalidation for everything else.
+- User uploads (assets/uploads) are copied unchanged, since their URLs live
+  in the database.
+
+A report lists each page's transfer size before and after: the page plus
+every stylesheet, script and image it references, directly or through
+another file, with uncompressed originals against the smallest built
+variant.
+
+Pillow and brotli are optional. Without them images are only fingerprinted
+and .br files are skipped, so the build also runs where only the standard
+library is available.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'public')
+VERCEL_CONFIG = os.path.join(ROOT, 'vercel.json')
+
+# Only these are part of the site; scripts, databases and configs in public/ are not
+SITE_EXTENSIONS = {'.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.ico'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+TEXT_EXTENSIONS = {'.html', '.css', '.js', '.svg'}
+# Browsers ask for these by fixed URL, so they keep their names
+FIXED_NAMES = {'.ico'}
+# Copied as they are: upload URLs are stored in MongoDB
+VERBATIM_DIRS = {os.path.join('assets', 'uploads')}
+SKIP_DIRS = {'public', '__pycache__', 'node_modules'}
+
+# Widest an image is ever displayed, in CSS pixels times two for high-density screens
+MAX_IMAGE_WIDTH = 1600
+IMAGE_WIDTHS = {
+    'assets/logo.png': 128,     # 32px high in the nav bar
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+HASH_LENGTH = 10
+# Precompressed siblings are only written when they save at least this much
+MIN_COMPRESSION_SAVING = 0.05
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+FINGERPRINTED_SOURCE = r'/(.*)\.([0-9a-f]{10})\.(css|js|png|jpg|jpeg|gif|webp|svg)'
+
+# A relative or root-relative path to a site file, inside quotes, url() or an attribute
+REFERENCE_RE = re.compile(r'''(?<=["'(=])((?:\.{1,2}/|/)?(?:[\w\-]+/)*[\w\-.]+\.(?:css|js|png|jpe?g|gif|webp|svg|ico))(?=[?#"')\s])''')
+BACKGROUND_RE = re.compile(r'''background-image\s*:\s*url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+def fingerprinted(rel, data, ext=None):
+    stem, original_ext = os.path.splitext(rel)
+    return f"{stem}.{content_hash(data)}{ext or original_ext}"
+
+# --- Minifiers ---------------------------------------------------------------
+
+CSS_TIGHT = '{};,>'
+
+def minify_css(source):
+    """Drop comments and whitespace that CSS syntax does not need; strings are kept as written"""
+    out, i, n = [], 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '"\'':
+            end = i + 1
+            while end < n and source[end] != c:
+                end += 2 if source[end] == '\\' else 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        elif c.isspace():
+            while i < n and source[i].isspace():
+                i += 1
+            # Spaces around block, declaration and list punctuation, or after a colon, mean nothing
+            prev, following = out[-1][-1:] if out else '', source[i:i + 1]
+            if prev and prev not in CSS_TIGHT + ':(' and following and following not in CSS_TIGHT + ')':
+                out.append(' ')
+        else:
+            if c == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+JS_WORD_RE = re.compile(r'[\w$]')
+# After one of these a '/' starts a regular expression rather than a division
+JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw',
+                     'yield', 'await'}
+# A line break after an opener, or before a closer or a member access, never ends a statement
+JS_OPENERS = set('{([,;')
+JS_CLOSERS = set('})].')
+
+def is_word(c):
+    return bool(c) and JS_WORD_RE.match(c) is not None
+
+def minify_js(source):
+    """Strip comments, indentation, blank lines and the spaces punctuation makes redundant.
+
+    Line breaks between statements stay, so code relying on automatic
+    semicolon insertion keeps working. Strings, template literals and
+    regular expressions are copied as they are.
+    """
+    out = []            # emitted chunks; code is emitted a character at a time
+    templates = []      # brace depth inside each open ${...} substitution
+    in_template = False
+    i, n = 0, len(source)
+
+    def last():
+        return out[-1][-1] if out else ''
+
+    def starts_regex():
+        tail = ''.join(out[-16:]).rstrip()
+        if not tail or tail[-1] in JS_REGEX_AFTER:
+            return True
+        word = re.search(r'[\w$]+$', tail)
+        return word is not None and word.group() in JS_REGEX_KEYWORDS
+
+    while i < n:
+        c = source[i]
+        if in_template:
+            if c == '\\':
+                out.append(source[i:i + 2])
+                i += 2
+            elif c == '`':
+                out.append(c)
+                in_template = False
+                i += 1
+            elif source.startswith('${', i):
+                out.append('${')
+                templates.append(0)
+                in_template = False
+                i += 2
+            else:
+                out.append(c)
+                i += 1
+        elif c in '"\'':
+            end = i + 1
+            while end < n and source[end] not in (c, '\n'):
+                end += 2 if source[end] == '\\' else 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif c == '`':
+            out.append(c)
+            in_template = True
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            # Stands in for the whitespace it occupied; a multi-line comment still ends a line
+            source = source[:i] + ('\n' if '\n' in source[i:end] else ' ') + source[end:]
+            n = len(source)
+        elif c == '/' and starts_regex():
+            end, in_class = i + 1, False
+            while end < n and (source[end] != '/' or in_class) and source[end] != '\n':
+                if source[end] == '\\':
+                    end += 1
+                elif source[end] == '[':
+                    in_class = True
+                elif source[end] == ']':
+                    in_class = False
+                end += 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif c.isspace():
+            start = i
+            while i < n and source[i].isspace():
+                i += 1
+            prev, following = last(), source[i:i + 1]
+            if not prev or prev == '\n':
+                continue
+            if '\n' in source[start:i]:
+                if prev not in JS_OPENERS and following not in JS_CLOSERS:
+                    out.append('\n')
+            elif (is_word(prev) and is_word(following) or prev + following in ('++', '--', '+-', '-+', '//')
+                  or prev.isdigit() and following == '.'):
+                out.append(' ')
+        else:
+            if templates and c == '{':
+                templates[-1] += 1
+            elif templates and c == '}':
+                if templates[-1] == 0:
+                    templates.pop()
+                    in_template = True
+                else:
+                    templates[-1] -= 1
+            out.append(c)
+            i += 1
+    return ''.join(out).strip()
+
+HTML_TOKEN_RE = re.compile(r'(<!--.*?-->|<(script|style|pre|textarea)\b[^>]*>.*?</\2\s*>|<[^>]+>)',
+                           re.DOTALL | re.IGNORECASE)
+HTML_RAW_RE = re.compile(r'(<(\w+)\b[^>]*>)(.*?)(</\2\s*>)', re.DOTALL)
+# Inline scripts with some other type (JSON, templates) are not JavaScript
+SCRIPT_TYPE_RE = re.compile(r'type=["\']?(?!text/javascript|module)', re.IGNORECASE)
+
+def collapse_whitespace(match):
+    return '\n' if '\n' in match.group() else ' '
+
+def minify_tag(tag):
+    """Collapse whitespace between attributes; quoted values are left alone"""
+    tag = re.sub(r'''("[^"]*"|'[^']*')|\s+''', lambda m: m.group(1) or collapse_whitespace(m), tag)
+    return re.sub(r'\s+(/?>)$', r'\1', tag)
+
+def minify_html(source):
+    out, pos = [], 0
+    for match in HTML_TOKEN_RE.finditer(source):
+        out.append(collapse_text(source[pos:match.start()]))
+        token, raw = match.group(1), (match.group(2) or '').lower()
+        pos = match.end()
+        if token.startswith('<!--'):
+            if token.startswith('<!--[if'):
+                out.append(token)
+        elif raw in ('script', 'style'):
+            opening, _, content, closing = HTML_RAW_RE.match(token).groups()
+            if raw == 'style':
+                content = minify_css(content)
+            elif 'src=' not in opening and SCRIPT_TYPE_RE.search(opening) is None:
+                content = minify_js(content)
+            out.append(minify_tag(opening) + content + closing)
+        elif raw:
+            out.append(token)
+        else:
+            out.append(minify_tag(token))
+    out.append(collapse_text(source[pos:]))
+    return ''.join(out).strip() + '\n'
+
+def collapse_text(text):
+    return re.sub(r'\s+', collapse_whitespace, text)
+
+# --- Images ------------------------------------------------------------------
+
+def build_image(rel, data, no_images):
+    """Returns [(output rel, bytes), ...]: the fallback first, then the WebP if one was made"""
+    try:
+        if no_images:
+            raise ImportError
+        from PIL import Image
+    except ImportError:
+        return [(fingerprinted(rel, data), data)]
+
+    import io
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    width = IMAGE_WIDTHS.get(rel, MAX_IMAGE_WIDTH)
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+    fallback, ext = io.BytesIO(), os.path.splitext(rel)[1]
+    if has_alpha:
+        image.save(fallback, 'PNG', optimize=True)
+        ext = '.png'
+    else:
+        image.convert('RGB').save(fallback, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        ext = '.jpg'
+    fallback = fallback.getvalue()
+    if len(fallback) >= len(data) and ext == os.path.splitext(rel)[1]:
+        fallback = data
+    webp = io.BytesIO()
+    image.save(webp, 'WEBP', quality=WEBP_QUALITY, method=6)
+    webp = webp.getvalue()
+    return [(fingerprinted(rel, fallback, ext), fallback), (fingerprinted(rel, webp, '.webp'), webp)]
+
+# --- References --------------------------------------------------------------
+
+def resolve(ref, from_rel):
+    """Site-relative path a reference in from_rel points at"""
+    if ref.startswith('/'):
+        return os.path.normpath(ref.lstrip('/')).replace(os.sep, '/')
+    # Paths in scripts resolve against the page running them, and every page is at the root
+    base = '' if from_rel.endswith('.js') else os.path.dirname(from_rel)
+    return os.path.normpath(os.path.join(base, ref)).replace(os.sep, '/')
+
+def renamed(ref, target):
+    """ref with its file name swapped for target's, keeping its relative form"""
+    return ref[:len(ref) - len(os.path.basename(ref))] + os.path.basename(target)
+
+def rewrite_references(text, from_rel, manifest, webp):
+    """Point references at fingerprinted files; CSS backgrounds also get their WebP via image-set()"""
+    def background(match):
+        quote, ref = match.group(1), match.group(2)
+        target = resolve(ref, from_rel)
+        if target not in webp:
+            return match.group(0)
+        fallback, modern = renamed(ref, manifest[target]), renamed(ref, webp[target])
+        fallback_type = 'image/png' if fallback.endswith('.png') else 'image/jpeg'
+        return (f"background-image: url({quote}{fallback}{quote}); background-image: image-set("
+                f"url({quote}{modern}{quote}) type('image/webp'), url({quote}{fallback}{quote}) type('{fallback_type}'))")
+
+    def reference(match):
+        ref = match.group(1)
+        target = resolve(ref, from_rel)
+        return renamed(ref, manifest[target]) if target in manifest else ref
+
+    text = BACKGROUND_RE.sub(background, text)
+    return REFERENCE_RE.sub(reference, text)
+
+def references(text, from_rel, files):
+    return {resolve(ref, from_rel) for ref in REFERENCE_RE.findall(text)} & files
+
+# --- Build -------------------------------------------------------------------
+
+def site_files(source_dir):
+    """Site-relative paths of the files to build, and of the directories copied verbatim"""
+    files, verbatim = [], []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        rel_dir = os.path.relpath(dirpath, source_dir)
+        rel_dir = '' if rel_dir == '.' else rel_dir
+        if rel_dir in VERBATIM_DIRS:
+            verbatim.append(rel_dir)
+            dirnames[:] = []
+            continue
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in SITE_EXTENSIONS and not name.startswith('.'):
+                files.append(os.path.join(rel_dir, name).replace(os.sep, '/'))
+    return sorted(files), verbatim
+
+def write(out_dir, rel, data):
+    path = os.path.join(out_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def precompress(out_dir, rel, data):
+    """Write .gz and .br siblings that are worth sending; returns {encoding: size}"""
+    sizes = {}
+    variants = [('gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING):
+            write(out_dir, f"{rel}.{suffix}", compressed)
+            sizes[suffix] = len(compressed)
+    return sizes
+
+def build(source_dir, out_dir, no_images=False):
+    """Build the site into out_dir; returns the data the report needs"""
+    files, verbatim = site_files(source_dir)
+    sources = {}
+    for rel in files:
+        with open(os.path.join(source_dir, rel), 'rb') as f:
+            sources[rel] = f.read()
+
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    manifest, webp, built = {}, {}, {}
+
+    def emit(out_rel, data):
+        write(out_dir, out_rel, data)
+        built[out_rel] = {'size': len(data)}
+        if os.path.splitext(out_rel)[1] in TEXT_EXTENSIONS:
+            built[out_rel].update(precompress(out_dir, out_rel, data))
+
+    # Leaves first, so every file's references are final before it is hashed
+    for rel in files:
+        ext = os.path.splitext(rel)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            outputs = build_image(rel, sources[rel], no_images)
+            manifest[rel] = outputs[0][0]
+            if len(outputs) > 1:
+                webp[rel] = outputs[1][0]
+            for out_rel, data in outputs:
+                emit(out_rel, data)
+        elif ext in FIXED_NAMES:
+            emit(rel, sources[rel])
+        elif ext not in ('.html', '.css', '.js'):
+            manifest[rel] = fingerprinted(rel, sources[rel])
+            emit(manifest[rel], sources[rel])
+
+    for ext, minify in (('.css', minify_css), ('.js', minify_js)):
+        for rel in files:
+            if rel.endswith(ext):
+                text = rewrite_references(sources[rel].decode('utf8'), rel, manifest, webp)
+                data = minify(text).encode('utf8')
+                manifest[rel] = fingerprinted(rel, data)
+                emit(manifest[rel], data)
+
+    for rel in files:
+        if rel.endswith('.html'):
+            text = rewrite_references(sources[rel].decode('utf8'), rel, manifest, webp)
+            emit(rel, minify_html(text).encode('utf8'))
+
+    for rel_dir in verbatim:
+        shutil.copytree(os.path.join(source_dir, rel_dir), os.path.join(out_dir, rel_dir))
+
+    with open(os.path.join(out_dir, 'asset-manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return {'sources': sources, 'manifest': manifest, 'webp': webp, 'built': built}
+
+def update_vercel_config(path, out_dir):
+    """Serve the build output, with immutable caching for fingerprinted files"""
+    with open(path) as f:
+        config = json.load(f)
+    # The deploy build must not rewrite the config it was started from
+    config['buildCommand'] = f"python3 {os.path.basename(__file__)} --out {out_dir} --no-vercel"
+    config['outputDirectory'] = out_dir
+    # The static rewrite into public/ is replaced by serving the output directory itself
+    config['rewrites'] = [r for r in config.get('rewrites', []) if not r['destination'].startswith('public/')]
+    config['headers'] = [
+        {'source': FINGERPRINTED_SOURCE, 'headers': [{'key': 'Cache-Control', 'value': IMMUTABLE}]},
+        {'source': '/(.*)\\.html', 'headers': [{'key': 'Cache-Control', 'value': REVALIDATE}]},
+        {'source': '/', 'headers': [{'key': 'Cache-Control', 'value': REVALIDATE}]}
+    ]
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+        f.write('\n')
+
+# --- Report ------------------------------------------------------------------
+
+def page_transfer(page, contents, files, best_size):
+    """Bytes a first visit to page transfers: the page and everything it loads, transitively"""
+    seen, pending = set(), [page]
+    while pending:
+        rel = pending.pop()
+        if rel in seen:
+            continue
+        seen.add(rel)
+        if os.path.splitext(rel)[1] in ('.html', '.css', '.js'):
+            pending.extend(references(contents(rel), rel, files))
+    return sum(best_size(rel) for rel in seen)
+
+def report(result):
+    sources, manifest, webp, built = result['sources'], result['manifest'], result['webp'], result['built']
+    original_files = set(sources)
+    reverse = {out_rel: rel for rel, out_rel in manifest.items()}
+    reverse.update({out_rel: rel for rel, out_rel in webp.items()})
+
+    def built_size(out_rel):
+        sizes = built[out_rel]
+        return min(sizes.get('br', sizes['size']), sizes.get('gz', sizes['size']), sizes['size'])
+
+    def built_contents(rel):
+        return sources[rel].decode('utf8', errors='replace')
+
+    def after_size(rel):
+        # Browsers that understand image-set() fetch the WebP instead of the fallback
+        return built_size(webp.get(rel) or manifest.get(rel, rel))
+
+    print(f"{'page':<38} {'before':>10} {'after':>10} {'saved':>7}")
+    total_before = total_after = 0
+    for page in sorted(rel for rel in sources if rel.endswith('.html')):
+        before = page_transfer(page, built_contents, original_files, lambda rel: len(sources[rel]))
+        after = page_transfer(page, built_contents, original_files, after_size)
+        total_before += before
+        total_after += after
+        print(f"{page:<38} {before / 1024:>8.1f}KB {after / 1024:>8.1f}KB {1 - after / before:>7.0%}")
+    print(f"{'TOTAL':<38} {total_before / 1024:>8.1f}KB {total_after / 1024:>8.1f}KB "
+          f"{1 - total_after / max(total_before, 1):>7.0%}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build public/ into a minified, fingerprinted static site')
+    parser.add_argument('--out', default='dist', help='output directory, relative to the repository root')
+    parser.add_argument('--no-images', action='store_true', help='fingerprint images without resizing or WebP')
+    parser.add_argument('--no-vercel', action='store_true', help='leave vercel.json alone')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    out_dir = os.path.join(ROOT, args.out)
+    result = build(SOURCE_DIR, out_dir, args.no_images)
+    if not args.no_vercel:
+        update_vercel_config(VERCEL_CONFIG, args.out)
+    if brotli is None:
+        print('brotli is not installed: skipped .br files')
+    print(f"Built {len(result['built'])} files into {args.out}/\n")
+    report(result)
+
+if __name__ == '__main__':
+    main()
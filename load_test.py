@@ -0,0 +1,302 @@
+"""Load test for the SparkConnect API.
+
+Boots api/index.py on a local port against a scratch database, seeds it, and
+drives a weighted mix of login, listing, search, profile, review and upload
+traffic from concurrent clients over real HTTP. Reports per-route
+p50/p95/p99 latency and requests/sec, and writes them to JSON so runs can be
+diffed between commits:
+
+    python load_test.py --profiles 10000 --concurrency 16 --duration 30 --output bench.json
+    python load_test.py --compare bench.json          # run again and show the change
+
+By default the scratch database lives on the local mongod
+(mongodb://localhost:27017, database sparkconnect_loadtest). --in-process
+uses mongomock instead, which needs no server but says nothing about MongoDB
+cost and cannot run the review route; numbers from the two modes are not
+comparable.
+
+Clients share the server's process, so absolute throughput is a lower bound;
+the harness is meant for comparing commits on the same machine.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+DEFAULT_MIX = 'listing=45,search=10,profile=25,login=8,review=8,upload=4'
+PASSWORD = 'password'
+SPECIALTIES = ['Residential Wiring', 'Commercial Systems', 'Solar Panel Installer', 'Industrial Electrician',
+               'Inverter Technician', 'Generator Repair']
+SEARCH_TERMS = ['solar', 'inverter', 'wiring lagos', 'generator', 'commercial', 'industrial kano', 'chinedu']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--in-process', action='store_true', help='use mongomock instead of a mongod')
+    parser.add_argument('--profiles', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of measured traffic')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of unmeasured traffic first')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"route=weight,... (default {DEFAULT_MIX})")
+    parser.add_argument('--cache', default='memory', choices=['memory', 'none'], help='CACHE_BACKEND for the run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='print the change against an earlier JSON result')
+    return parser.parse_args()
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def boot_app(args, upload_dir):
+    """Import api/index.py configured for the run and point it at the scratch database"""
+    os.environ['CACHE_BACKEND'] = args.cache
+    # Derivative generation would compete with the clients for CPU
+    os.environ['MEDIA_WORKERS'] = '0'
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+    import index
+
+    if args.in_process:
+        import mongomock
+        database = mongomock.MongoClient()['sparkconnect_loadtest']
+    else:
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)['sparkconnect_loadtest']
+    index.db = database
+    index.storage.root = upload_dir
+    return index
+
+def seed(index, database, profiles, rng):
+    """Fresh users and reviews; every account shares one password hash so seeding stays fast"""
+    from _geo import PLACES, geo_fields
+
+    database.users.drop()
+    database.reviews.drop()
+    password_hash = index.generate_password_hash(PASSWORD)
+    states = list(PLACES)
+    docs = []
+    for i in range(profiles):
+        state = rng.choice(states)
+        place = rng.choice(PLACES[state])[0]
+        docs.append({
+            'name': f"Electrician {i}",
+            'email': f"loadtest{i}@example.com",
+            'password': password_hash,
+            'specialty': rng.choice(SPECIALTIES),
+            'state': state,
+            'location': f"{place}, {state}",
+            'description': 'Experienced electrical professional for homes, offices and solar installations.',
+            'image': 'assets/images/profile_placeholder.jpg',
+            'rating': round(rng.uniform(3, 5), 1),
+            'reviews': 0,
+            'signup_method': 'email',
+            'gallery': [f"assets/uploads/work{i}-{n}.jpg" for n in range(rng.randint(0, 8))],
+            **geo_fields(state, f"{place}, {state}")
+        })
+        if len(docs) == 5000:
+            database.users.insert_many(docs)
+            docs = []
+    if docs:
+        database.users.insert_many(docs)
+    index.ensure_indexes(database)
+    return [str(doc['_id']) for doc in database.users.find({}, {'_id': 1})]
+
+class Traffic:
+    """One client's view of the API: a requests.Session plus the operations in the mix"""
+    def __init__(self, base_url, ids, profiles, rng):
+        import requests
+        self.http = requests.Session()
+        self.base_url = base_url
+        self.ids = ids
+        self.profiles = profiles
+        self.rng = rng
+        self.cursor = None
+
+    def listing(self):
+        params = {'limit': 20}
+        roll = self.rng.random()
+        if roll < 0.3 and self.cursor:
+            params['cursor'] = self.cursor
+        elif roll < 0.6:
+            params['state'] = self.rng.choice(['Lagos', 'FCT - Abuja', 'Rivers', 'Kano', 'Oyo'])
+        res = self.http.get(f"{self.base_url}/api/electricians", params=params)
+        if res.ok:
+            self.cursor = res.json().get('next_cursor')
+        return res
+
+    def search(self):
+        return self.http.get(f"{self.base_url}/api/electricians/search",
+                             params={'q': self.rng.choice(SEARCH_TERMS), 'limit': 20})
+
+    def profile(self):
+        return self.http.get(f"{self.base_url}/api/electricians/{self.rng.choice(self.ids)}",
+                             params={'reviews': 20, 'gallery': 24})
+
+    def login(self):
+        email = f"loadtest{self.rng.randrange(self.profiles)}@example.com"
+        return self.http.post(f"{self.base_url}/api/auth/login", json={'email': email, 'password': PASSWORD})
+
+    def review(self):
+        return self.http.post(f"{self.base_url}/api/electricians/{self.rng.choice(self.ids)}/review",
+                              json={'rating': self.rng.randint(1, 5), 'name': 'Load Test', 'comment': 'Good work'})
+
+    def upload(self):
+        # Uploads need a session; the login is not timed as part of the upload
+        if not self.http.cookies:
+            self.login()
+        # Fresh bytes each time so content addressing cannot short-circuit the write
+        body = os.urandom(self.rng.randint(50, 400) * 1024)
+        return self.http.post(f"{self.base_url}/api/upload", files={'file': ('photo.jpg', body, 'image/jpeg')})
+
+def run_clients(base_url, ids, args, mix, deadline, record):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def client(worker):
+        rng = random.Random(args.seed * 1000 + worker)
+        traffic = Traffic(base_url, ids, args.profiles, rng)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(traffic, name)().status_code
+            except Exception:
+                status = 0
+            record(name, started, time.perf_counter(), status)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def summarize(samples, elapsed):
+    routes = {}
+    for name in sorted(samples):
+        latencies = sorted(ms for ms, _ in samples[name])
+        errors = sum(1 for _, status in samples[name] if not 200 <= status < 400)
+        routes[name] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+        }
+    everything = sorted(ms for route in samples.values() for ms, _ in route)
+    total = {
+        'requests': len(everything),
+        'errors': sum(r['errors'] for r in routes.values()),
+        'rps': round(len(everything) / elapsed, 1),
+        'p50_ms': round(percentile(everything, 50), 2) if everything else None,
+        'p95_ms': round(percentile(everything, 95), 2) if everything else None,
+        'p99_ms': round(percentile(everything, 99), 2) if everything else None,
+    }
+    return routes, total
+
+def print_table(routes, total):
+    print(f"{'route':<10} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, r in list(routes.items()) + [('TOTAL', total)]:
+        print(f"{name:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+
+def print_comparison(previous, routes):
+    print(f"\nChange against {previous.get('commit') or 'previous run'}:")
+    for name, r in routes.items():
+        before = previous['routes'].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if before[key]:
+                changes.append(f"{key} {(r[key] - before[key]) / before[key]:+.0%}")
+        print(f"  {name:<10} {', '.join(changes)}")
+
+def load_test():
+    args = parse_args()
+    mix = {}
+    for part in args.mix.split(','):
+        name, _, weight = part.partition('=')
+        if not hasattr(Traffic, name.strip()):
+            sys.exit(f"Unknown route in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+
+    if args.in_process and mix.pop('review', None):
+        # mongomock cannot run the review route's $round aggregation update
+        print("Skipping review traffic: not supported by the in-process database")
+
+    upload_dir = tempfile.mkdtemp(prefix='sparkconnect-loadtest-')
+    index = boot_app(args, upload_dir)
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.profiles} profiles ({'mongomock' if args.in_process else args.mongo_uri})...")
+    ids = seed(index, index.db, args.profiles, rng)
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, index.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    samples = {}
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + args.warmup
+
+    def record(name, started, finished, status):
+        if started < measure_from:
+            return
+        with lock:
+            samples.setdefault(name, []).append(((finished - started) * 1000, status))
+
+    print(f"Driving {args.concurrency} clients for {args.warmup:g}s warm-up + {args.duration:g}s...")
+    run_clients(base_url, ids, args, mix, measure_from + args.duration, record)
+    server.shutdown()
+    shutil.rmtree(upload_dir, ignore_errors=True)
+
+    routes, total = summarize(samples, args.duration)
+    print_table(routes, total)
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'database': 'mongomock' if args.in_process else 'mongod',
+            'profiles': args.profiles,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'mix': mix,
+            'cache': args.cache,
+            'seed': args.seed,
+        },
+        'routes': routes,
+        'total': total,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), routes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    load_test()
@@ -0,0 +1,35 @@
+import os
+import sys
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from _geo import geo_fields
+
+def migrate_geo():
+    """Resolve state/location text to gazetteer coordinates for every profile.
+
+    Safe to re-run, e.g. after adding places to api/_geo.py: each profile's
+    geo fields are recomputed from its current state and location.
+    """
+    load_dotenv('public/.env')
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+
+    counts = {'place': 0, 'state': 0, None: 0}
+    batch = []
+    for user in db.users.find({}, {'state': 1, 'location': 1}):
+        fields = geo_fields(user.get('state'), user.get('location'))
+        counts[fields['geo_precision']] += 1
+        batch.append(UpdateOne({'_id': user['_id']}, {'$set': fields}))
+        if len(batch) == 1000:
+            db.users.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        db.users.bulk_write(batch, ordered=False)
+
+    print(f"Placed {counts['place']} profiles by town, {counts['state']} by state; {counts[None]} unresolved.")
+
+if __name__ == "__main__":
+    migrate_geo()
@@ -0,0 +1,82 @@
+import os
+import hashlib
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+def review_id(user, position, review):
+    """Deterministic ObjectId for the position-th embedded review of user.
+
+    Laid out like a generated id (timestamp, 5 bytes of per-user entropy, counter)
+    so reviews still page newest-first, but the same review always gets the
+    same id and a re-run upserts instead of inserting a copy.
+    """
+    try:
+        created = datetime.fromisoformat(review.get('date'))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        created = user['_id'].generation_time
+    timestamp = int(created.timestamp()).to_bytes(4, 'big')
+    entropy = hashlib.sha256(user['_id'].binary).digest()[:5]
+    return ObjectId(timestamp + entropy + position.to_bytes(3, 'big'))
+
+def rating_value(rating):
+    """Embedded ratings were sometimes stored as strings; the collection holds numbers"""
+    try:
+        value = float(rating)
+    except (TypeError, ValueError):
+        return 0
+    return int(value) if value.is_integer() else value
+
+def migrate_reviews():
+    """Move embedded reviews_data arrays into the reviews collection.
+
+    Safe to re-run, including after a crash part way through a user: reviews
+    are upserted under deterministic ids, and reviews_data is only unset once
+    they are all stored. rating, reviews and rating_sum are then recomputed
+    from the reviews collection, so reviews already posted through the API
+    are counted alongside the migrated ones.
+    """
+    load_dotenv('public/.env')
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+
+    migrated_users = 0
+    migrated_reviews = 0
+    for user in db.users.find({'reviews_data': {'$exists': True}}, {'reviews_data': 1}):
+        reviews = user.get('reviews_data') or []
+        if reviews:
+            db.reviews.bulk_write([UpdateOne(
+                {'_id': review_id(user, position, r)},
+                {'$setOnInsert': {
+                    'electrician_id': user['_id'],
+                    'rating': rating_value(r.get('rating')),
+                    'name': r.get('name'),
+                    'comment': r.get('comment'),
+                    'date': r.get('date')
+                }},
+                upsert=True
+            ) for position, r in enumerate(reviews)], ordered=False)
+            migrated_reviews += len(reviews)
+
+        totals = next(db.reviews.aggregate([
+            {'$match': {'electrician_id': user['_id']}},
+            {'$group': {'_id': None, 'sum': {'$sum': '$rating'}, 'count': {'$sum': 1}}}
+        ]), None)
+        update = {'$unset': {'reviews_data': ''}}
+        if totals and totals['count']:
+            update['$set'] = {
+                'rating_sum': float(totals['sum']),
+                'reviews': totals['count'],
+                'rating': round(totals['sum'] / totals['count'], 1)
+            }
+        db.users.update_one({'_id': user['_id']}, update)
+        migrated_users += 1
+
+    print(f"Migrated {migrated_reviews} reviews from {migrated_users} users.")
+
+if __name__ == "__main__":
+    migrate_reviews()
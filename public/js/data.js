@@ -37,10 +37,58 @@ window.DataManager = {
     // No init needed
     init: function() { console.log("DataManager init (no-op in API mode)"); },
 
-    getAllElectricians: async function() {
+    // Fetch one page of the directory. params: limit, cursor, state, specialty, min_rating, sort
+    getElectricians: async function(params = {}, route = '') {
+        const query = new URLSearchParams();
+        Object.entries(params).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') query.set(key, value);
+        });
+        const path = route ? `/api/electricians/${route}` : '/api/electricians';
         try {
-            const res = await networkRequest(`${API_BASE_URL}/api/electricians`, { credentials: 'include' });
+            const res = await networkRequest(`${API_BASE_URL}${path}?${query.toString()}`, { credentials: 'include' });
             if (res.ok) return await res.json();
+            return { electricians: [], next_cursor: null };
+        } catch(e) {
+            console.error("Failed to fetch electricians", e);
+            return { electricians: [], next_cursor: null };
+        }
+    },
+
+    // Relevance-ranked search; accepts the same filters and paging params as getElectricians
+    searchElectricians: async function(q, params = {}) {
+        return this.getElectricians({ ...params, q }, 'search');
+    },
+
+    // Ranked by distance blended with rating. params: radius (km), limit, specialty
+    getNearbyElectricians: async function(lat, lng, params = {}) {
+        return this.getElectricians({ ...params, lat, lng }, 'nearby');
+    },
+
+    // Best rated by Bayesian-averaged score. params: state, specialty (prefix), limit
+    getLeaderboard: async function(params = {}) {
+        const query = new URLSearchParams();
+        Object.entries(params).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') query.set(key, value);
+        });
+        try {
+            const res = await networkRequest(`${API_BASE_URL}/api/leaderboard?${query.toString()}`, { credentials: 'include' });
+            if (res.ok) return (await res.json()).electricians;
+            return [];
+        } catch(e) {
+            console.error("Failed to fetch leaderboard", e);
+            return [];
+        }
+    },
+
+    getAllElectricians: async function(params = {}) {
+        // The whole directory in one streamed response; prefer getElectricians() for anything user-facing
+        const query = new URLSearchParams();
+        Object.entries(params).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') query.set(key, value);
+        });
+        try {
+            const res = await networkRequest(`${API_BASE_URL}/api/electricians/export?${query.toString()}`, { credentials: 'include' });
+            if (res.ok) return (await res.json()).electricians;
             return [];
         } catch(e) {
             console.error("Failed to fetch electricians", e);
@@ -48,11 +96,19 @@ window.DataManager = {
         }
     },
 
-    getElectricianById: async function(id) {
-        // We fetch all for now as we don't have a specific ID endpoint, or filter client side
-        // Optimization: Add specific endpoint later if list grows
-        const all = await this.getAllElectricians();
-        return all.find(e => e.id == id);
+    // options.reviews / options.gallery embed the latest N reviews and first N gallery items
+    getElectricianById: async function(id, options = {}) {
+        const query = new URLSearchParams();
+        if (options.reviews) query.set('reviews', options.reviews);
+        if (options.gallery) query.set('gallery', options.gallery);
+        try {
+            const res = await networkRequest(`${API_BASE_URL}/api/electricians/${encodeURIComponent(id)}?${query.toString()}`, { credentials: 'include' });
+            if (res.ok) return await res.json();
+            return null;
+        } catch(e) {
+            console.error("Failed to fetch electrician", e);
+            return null;
+        }
     },
 
     signup: async function(data) {
@@ -159,6 +215,31 @@ window.DataManager = {
         window.location.href = 'index.html';
     },
 
+    // Both resolve to the server's message; the reset link itself arrives by email
+    requestPasswordReset: async function(email) {
+        const res = await networkRequest(`${API_BASE_URL}/api/auth/forgot-password`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ email }),
+            credentials: 'include'
+        });
+        const result = await res.json();
+        if (!res.ok) throw new Error(result.error || 'Could not request a reset link');
+        return result.message;
+    },
+
+    resetPassword: async function(token, password) {
+        const res = await networkRequest(`${API_BASE_URL}/api/auth/reset-password`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ token, password }),
+            credentials: 'include'
+        });
+        const result = await res.json();
+        if (!res.ok) throw new Error(result.error || 'Could not reset the password');
+        return result.message;
+    },
+
     getCurrentUser: async function() {
         try {
             const res = await networkRequest(`${API_BASE_URL}/api/auth/me`, { credentials: 'include' });
@@ -172,6 +253,18 @@ window.DataManager = {
         }
     },
 
+    // Lightweight identity (name, image, specialty, role) for headers and permission checks.
+    // Answered from the signed session cookie; use getCurrentUser() for the full profile.
+    getSessionUser: async function() {
+        try {
+            const res = await networkRequest(`${API_BASE_URL}/api/auth/session`, { credentials: 'include' });
+            if (res.ok) return await res.json();
+            return null;
+        } catch(e) {
+            return null;
+        }
+    },
+
     updateElectrician: async function(updates) {
          const res = await networkRequest(`${API_BASE_URL}/api/user/update`, {
             method: 'PUT',
@@ -182,6 +275,18 @@ window.DataManager = {
         return res.ok;
     },
     
+    // Run several writes in one round trip; resolves to [{status, body}] in op order
+    batch: async function(ops, stopOnError = false) {
+        const res = await networkRequest(`${API_BASE_URL}/api/batch`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ ops, stop_on_error: stopOnError }),
+            credentials: 'include'
+        });
+        if (!res.ok) throw new Error('Batch request failed');
+        return (await res.json()).results;
+    },
+    
     deleteElectrician: async function(id) {
          // Fallback/simulation
          console.warn("Delete account not connected to API yet");
@@ -225,15 +330,26 @@ window.DataManager = {
     },
 
     isAdmin: async function() {
-        // Basic check based on current user
-        const user = await this.getCurrentUser();
-        return user && user.email === 'admin@sparkconnect.com';
+        const user = await this.getSessionUser();
+        return !!user && user.role === 'admin';
     }
 };
 
 // MediaStore deprecated in favor of API uploads, but keeping stub if needed for logic transition
 const MediaStore = {
+    // Files above this size go through resumable chunked uploads
+    RESUMABLE_THRESHOLD: 8 * 1024 * 1024,
+    // Whether the server's storage takes direct uploads; unknown until the first try
+    directUploads: null,
+
     saveMedia: async function(file) {
+        if (this.directUploads !== false) {
+            const url = await this.saveMediaDirect(file);
+            if (url) return url;
+        }
+        if (file.size > this.RESUMABLE_THRESHOLD) {
+            return this.saveMediaResumable(file);
+        }
         const formData = new FormData();
         formData.append('file', file);
         
@@ -250,8 +366,94 @@ const MediaStore = {
             throw new Error("Upload failed");
         }
     },
+    // Straight to the storage bucket with a presigned form, then confirmed with the API.
+    // Returns null when the server stores uploads itself.
+    saveMediaDirect: async function(file) {
+        const startRes = await networkRequest(`${API_BASE_URL}/api/uploads/direct`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size }),
+            credentials: 'include'
+        });
+        if (startRes.status === 501) {
+            this.directUploads = false;
+            return null;
+        }
+        if (!startRes.ok) throw new Error("Upload failed");
+        this.directUploads = true;
+        const { upload, token } = await startRes.json();
+
+        const form = new FormData();
+        Object.entries(upload.fields).forEach(([key, value]) => form.append(key, value));
+        form.append('file', file);
+        const res = await fetch(upload.url, { method: 'POST', body: form });
+        if (!res.ok) throw new Error("Upload failed");
+
+        const doneRes = await networkRequest(`${API_BASE_URL}/api/uploads/direct/complete`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ token }),
+            credentials: 'include'
+        });
+        if (!doneRes.ok) throw new Error("Upload failed");
+        return (await doneRes.json()).url;
+    },
+    saveMediaResumable: async function(file, retries = 5) {
+        const startRes = await networkRequest(`${API_BASE_URL}/api/uploads`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size }),
+            credentials: 'include'
+        });
+        if (!startRes.ok) throw new Error("Upload failed");
+        const { upload_id, chunk_size } = await startRes.json();
+        const uploadUrl = `${API_BASE_URL}/api/uploads/${upload_id}`;
+
+        let offset = 0;
+        while (true) {
+            const end = Math.min(offset + chunk_size, file.size);
+            let failure;
+            try {
+                const res = await networkRequest(uploadUrl, {
+                    method: 'PUT',
+                    headers: { 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` },
+                    body: file.slice(offset, end),
+                    credentials: 'include'
+                });
+                if (res.ok) {
+                    const data = await res.json();
+                    if (data.url) return data.url;
+                    offset = data.offset;
+                    continue;
+                }
+                failure = new Error(res.status === 409 ? "Upload out of sync" : "Upload failed");
+            } catch (e) {
+                failure = e;
+            }
+            // Every failed attempt spends a retry, resyncs after a 409 included
+            if (--retries < 0) throw failure;
+            // Dropped connection or out-of-sync chunk: ask the server where to resume
+            const statusRes = await networkRequest(uploadUrl, { credentials: 'include' });
+            if (!statusRes.ok) throw new Error("Upload failed");
+            offset = (await statusRes.json()).offset;
+        }
+    },
     getMedia: async function(url) {
         // Just return the url directly as it's now a server path
         return url;
+    },
+    // <source> tags for a <picture>, from the resized variants the server made for an upload
+    pictureSources: function(media, sizes, base = '') {
+        if (!media || !media.srcset) return '';
+        return ['avif', 'webp']
+            .filter((fmt) => media.srcset[fmt])
+            .map((fmt) => {
+                const srcset = media.srcset[fmt]
+                    .split(', ')
+                    .map((entry) => (base ? `${base}/${entry}` : entry))
+                    .join(', ');
+                return `<source type="image/${fmt}" srcset="${srcset}" sizes="${sizes}">`;
+            })
+            .join('');
     }
 };
@@ -5,7 +5,7 @@ const NavManager = {
     const nav = document.querySelector("nav") || document.createElement("nav");
     nav.className = "navbar";
 
-    const currentUser = await DataManager.getCurrentUser();
+    const currentUser = await DataManager.getSessionUser();
 
     let avatarHtml = "";
     if (currentUser) {
@@ -0,0 +1,62 @@
+import os
+import sys
+import statistics
+import subprocess
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api')
+# Median cumulative import time of api/index.py, in milliseconds. Raise it deliberately,
+# in the same commit as the dependency that needs it.
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 450))
+RUNS = 7
+# Only the routes that use these may import them
+LAZY_MODULES = ['google.oauth2', 'google.auth', 'flask_mail', 'requests', 'dotenv', 'boto3']
+
+def import_profile():
+    """Import index in a fresh interpreter under -X importtime; returns {module: (self_us, cumulative_us)}"""
+    env = dict(os.environ, ENSURE_INDEXES='0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'],
+                            cwd=API_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(1)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+def verify_cold_start():
+    profiles = [import_profile() for _ in range(RUNS)]
+    total_ms = statistics.median(p['index'][1] for p in profiles) / 1000
+    ok = True
+
+    print(f"api/index.py import: {total_ms:.1f} ms (median of {RUNS}, budget {IMPORT_BUDGET_MS:.0f} ms)")
+    if total_ms > IMPORT_BUDGET_MS:
+        print(f"[FAIL] import time over budget by {total_ms - IMPORT_BUDGET_MS:.1f} ms")
+        ok = False
+    else:
+        print("[OK] import time within budget")
+
+    eager = [name for name in LAZY_MODULES if name in profiles[0]]
+    if eager:
+        print(f"[FAIL] imported at module level: {', '.join(eager)}")
+        ok = False
+    else:
+        print(f"[OK] not imported at startup: {', '.join(LAZY_MODULES)}")
+
+    # Heaviest top-level imports, to point at the culprit when the budget is blown
+    top_level = {}
+    for name in profiles[0]:
+        if '.' not in name and name != 'index':
+            top_level[name] = statistics.median(p.get(name, (0, 0))[1] for p in profiles) / 1000
+    print("Heaviest imports:")
+    for name, ms in sorted(top_level.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<20} {ms:7.1f} ms")
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_cold_start()
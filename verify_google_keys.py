@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import threading
+import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import _google_keys
+from _google_keys import GoogleKeyCache
+
+AUDIENCE = 'test-client.apps.googleusercontent.com'
+
+def make_key(kid):
+    """A signer for test tokens and the self-signed certificate a key server would publish for it"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    return crypt.RSASigner.from_string(private_pem, key_id=kid), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+class KeyServer:
+    """Stand-in for Google's certificate endpoint: serves certs with a chosen Cache-Control"""
+    def __init__(self):
+        self.certs = {}
+        self.cache_control = 'public, max-age=3600'
+        self.age = None
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(server.certs).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', server.cache_control)
+                if server.age is not None:
+                    self.send_header('Age', str(server.age))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/oauth2/v1/certs"
+
+def token(signer, **overrides):
+    now = int(time.time())
+    claims = {'iss': 'https://accounts.google.com', 'aud': AUDIENCE, 'sub': '1234567890',
+              'email': 'tester@example.com', 'name': 'Test User', 'iat': now, 'exp': now + 3600}
+    claims.update(overrides)
+    return jwt.encode(signer, claims).decode()
+
+def rejected(cache, value):
+    try:
+        cache.verify(value, AUDIENCE)
+    except ValueError:
+        return True
+    return False
+
+def verify_google_keys():
+    ok = True
+
+    def check(condition, label):
+        nonlocal ok
+        print(f"{'[OK]' if condition else '[FAIL]'} {label}")
+        ok = ok and condition
+
+    print("Generating test keys and starting a local key server...")
+    signer, cert = make_key('key-1')
+    forger, _ = make_key('key-1')
+    server = KeyServer()
+    server.certs = {'key-1': cert}
+    cache = GoogleKeyCache(server.url)
+
+    claims = cache.verify(token(signer), AUDIENCE)
+    check(claims['email'] == 'tester@example.com', 'valid token verified')
+    check(server.requests == 1, f"first verification fetched the keys once ({server.requests} fetches)")
+
+    started = time.perf_counter()
+    for _ in range(500):
+        cache.verify(token(signer), AUDIENCE)
+    per_call = (time.perf_counter() - started) / 500 * 1000
+    check(server.requests == 1, f"500 more verifications made no fetch ({per_call:.2f} ms each, signing included)")
+
+    check(rejected(cache, token(signer, aud='someone-else')), 'wrong audience rejected')
+    check(rejected(cache, token(signer, iat=int(time.time()) - 7200, exp=int(time.time()) - 3600)),
+          'expired token rejected')
+    check(rejected(cache, token(signer, iss='https://evil.example.com')), 'wrong issuer rejected')
+    check(rejected(cache, token(forger)), 'signature from another key with the same key id rejected')
+    check(rejected(cache, 'not.a.token'), 'malformed token rejected')
+
+    # Google publishes a new key before its cached set expires
+    rotated, rotated_cert = make_key('key-2')
+    server.certs['key-2'] = rotated_cert
+    cache.last_fetch -= _google_keys.MIN_REFETCH_INTERVAL
+    check(cache.verify(token(rotated), AUDIENCE)['sub'] == '1234567890', 'token with a newly rotated key verified')
+    check(server.requests == 2, f"unknown key id caused one refetch ({server.requests} fetches)")
+    unknown, _ = make_key('key-3')
+    for _ in range(20):
+        rejected(cache, token(unknown))
+    check(server.requests == 2, f"repeated unknown key ids within {_google_keys.MIN_REFETCH_INTERVAL}s caused no fetch")
+
+    # Refresh ahead: keys inside the refresh window are used while one background fetch runs
+    server.cache_control = f"public, max-age={_google_keys.REFRESH_AHEAD + 1}"
+    cache = GoogleKeyCache(server.url)
+    cache.verify(token(signer), AUDIENCE)
+    before = server.requests
+    time.sleep(1.2)
+    cache.last_fetch -= _google_keys.MIN_REFETCH_INTERVAL
+    started = time.perf_counter()
+    for _ in range(10):
+        cache.verify(token(signer), AUDIENCE)
+    elapsed = (time.perf_counter() - started) * 1000
+    time.sleep(0.5)
+    check(server.requests == before + 1 and cache.stats['background_refreshes'] == 1,
+          f"one background refresh near expiry, callers not blocked ({elapsed:.1f} ms for 10 calls)")
+
+    # Age counts against max-age; a response already past its lifetime is refetched on next use
+    server.cache_control = 'public, max-age=600'
+    server.age = 600
+    cache = GoogleKeyCache(server.url)
+    cache.verify(token(signer), AUDIENCE)
+    before = server.requests
+    cache.verify(token(signer), AUDIENCE)
+    check(server.requests == before + 1, 'Age header subtracted from max-age')
+
+    # Concurrent callers on a cold cache share one fetch
+    server.age = None
+    cache = GoogleKeyCache(server.url)
+    before = server.requests
+    threads = [threading.Thread(target=cache.verify, args=(token(signer), AUDIENCE)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(server.requests == before + 1, f"16 concurrent cold verifications made {server.requests - before} fetch")
+
+    server.httpd.shutdown()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_google_keys()
@@ -0,0 +1,77 @@
+import os
+import sys
+from bson import ObjectId
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from _indexes import ensure_indexes
+
+# Hot queries from api/index.py, keyed by the route that issues them
+HOT_QUERIES = {
+    'register (email)': ({'email': 'sarah@example.com'}, None),
+    'login (email or name)': ({'$or': [{'email': 'sarah@example.com'}, {'name': 'sarah@example.com'}]}, None),
+    'electricians (rating sort)': (
+        {'specialty': {'$nin': ['Visitor', 'Administrator']}},
+        [('rating', -1), ('_id', -1)]
+    ),
+    'electricians (state filter)': (
+        {'$and': [{'specialty': {'$nin': ['Visitor', 'Administrator']}}, {'state': 'Lagos'}]},
+        [('rating', -1), ('_id', -1)]
+    ),
+    'electricians (reviews sort)': (
+        {'specialty': {'$nin': ['Visitor', 'Administrator']}},
+        [('reviews', -1), ('_id', -1)]
+    ),
+    'electricians (state filter, reviews sort)': (
+        {'$and': [{'specialty': {'$nin': ['Visitor', 'Administrator']}}, {'state': 'Lagos'}]},
+        [('reviews', -1), ('_id', -1)]
+    ),
+    'electricians (cursor page)': (
+        {'$and': [
+            {'specialty': {'$nin': ['Visitor', 'Administrator']}},
+            {'$or': [{'rating': {'$lt': 4.5}}, {'rating': 4.5, '_id': {'$lt': ObjectId()}}]}
+        ]},
+        [('rating', -1), ('_id', -1)]
+    ),
+}
+
+def plan_stages(plan):
+    """Collect every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+def verify_indexes():
+    load_dotenv('public/.env')
+    uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/sparkconnect')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client.get_database('sparkconnect' if 'mongodb+srv' in uri else None)
+
+    print("Ensuring indexes...")
+    ensure_indexes(db)
+
+    ok = True
+    for label, (query, sort) in HOT_QUERIES.items():
+        cursor = db.users.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+        if 'IXSCAN' in stages and 'COLLSCAN' not in stages:
+            print(f"[OK] {label}: {' <- '.join(stages)}")
+        else:
+            print(f"[FAIL] {label}: {' <- '.join(stages)}")
+            ok = False
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_indexes()
@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import time
+import email
+import email.policy
+import socket
+import argparse
+
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from _mail import MailQueue
+
+class RecordingHandler:
+    """Local SMTP stand-in: records messages and SMTP sessions, and fails chosen recipients.
+
+    tempfail@... is refused with 451 the first time and accepted after,
+    nouser@... is always refused with 550.
+    """
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.tempfailed = set()
+        self.delay = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('nouser@'):
+            return '550 No such user'
+        if address.startswith('tempfail@') and address not in self.tempfailed:
+            self.tempfailed.add(address)
+            return '451 Try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay:
+            time.sleep(self.delay)
+        self.sessions.add(id(session))
+        self.messages.append((envelope.rcpt_tos[0], envelope.content.decode('utf8', errors='replace')))
+        return '250 Message accepted for delivery'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def verify_mail_queue():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--in-process', action='store_true', help='use mongomock instead of a mongod')
+    args = parser.parse_args()
+
+    if args.in_process:
+        import mongomock
+        database = mongomock.MongoClient()['sparkconnect_mailtest']
+    else:
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)['sparkconnect_mailtest']
+    database.outbox.drop()
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    ok = True
+
+    def check(condition, label):
+        nonlocal ok
+        print(f"{'[OK]' if condition else '[FAIL]'} {label}")
+        ok = ok and condition
+
+    def make_queue(**options):
+        settings = {'server': '127.0.0.1', 'port': controller.port, 'use_tls': False, 'domain_rate': 100}
+        settings.update(options)
+        return MailQueue(lambda: database, **settings)
+
+    def drain(queue):
+        while queue.drain():
+            pass
+
+    print(f"SMTP stand-in on port {controller.port}")
+
+    # 1. One connection per batch
+    queue = make_queue()
+    for i in range(20):
+        queue.enqueue(f"user{i}@{'example.com' if i % 2 else 'example.org'}", f"Message {i}", 'Hello')
+    drain(queue)
+    check(len(handler.messages) == 20, f"20 queued messages delivered ({len(handler.messages)})")
+    check(len(handler.sessions) == 1 and queue.stats['connections'] == 1,
+          f"one SMTP connection for the batch ({len(handler.sessions)} sessions)")
+    check(database.outbox.count_documents({'status': 'sent'}) == 20, 'all marked sent')
+
+    # 2. Per-domain rate limit
+    handler.messages.clear()
+    queue = make_queue(domain_rate=5)
+    for i in range(8):
+        queue.enqueue(f"bulk{i}@limited.example", 'Rate limited', 'Hello')
+    queue.enqueue('other@example.net', 'Other domain', 'Hello')
+    drain(queue)
+    waiting = list(database.outbox.find({'domain': 'limited.example', 'status': 'queued'}))
+    check(len(handler.messages) == 6, f"5 sent to the limited domain plus 1 elsewhere ({len(handler.messages)})")
+    check(len(waiting) == 3 and all(m['due_at'] > time.time() and m['attempts'] == 0 for m in waiting),
+          'the other 3 postponed without using an attempt')
+
+    # 3. Temporary failures back off and retry; permanent ones fail at once
+    handler.messages.clear()
+    queue = make_queue()
+    temp_id = queue.enqueue('tempfail@example.com', 'Retry me', 'Hello')
+    perm_id = queue.enqueue('nouser@example.com', 'Bounce', 'Hello')
+    drain(queue)
+    temp = database.outbox.find_one({'_id': temp_id})
+    perm = database.outbox.find_one({'_id': perm_id})
+    check(temp['status'] == 'queued' and temp['attempts'] == 1 and temp['due_at'] > time.time() + 20,
+          f"451 rescheduled with backoff (retry in {temp['due_at'] - time.time():.0f}s)")
+    check(perm['status'] == 'failed' and perm['attempts'] == 1, '550 failed without retrying')
+    database.outbox.update_one({'_id': temp_id}, {'$set': {'due_at': time.time()}})
+    drain(queue)
+    check(database.outbox.find_one({'_id': temp_id})['status'] == 'sent', 'retry delivered once the server accepted it')
+
+    # 4. Unreachable server: the batch waits, nothing is lost
+    queue = make_queue(port=free_port())
+    down_ids = [queue.enqueue(f"down{i}@example.com", 'Server down', 'Hello') for i in range(3)]
+    drain(queue)
+    down = list(database.outbox.find({'_id': {'$in': down_ids}}))
+    check(all(m['status'] == 'queued' and m['attempts'] == 1 for m in down), 'connection refused keeps messages queued')
+
+    # 5. Abandoned lease: a message claimed by a dead worker is sent by the next one
+    handler.messages.clear()
+    lost_id = database.outbox.insert_one({'to': 'lease@example.com', 'domain': 'example.com', 'subject': 'Lease',
+                                          'body': 'Hello', 'status': 'sending', 'attempts': 0,
+                                          'due_at': time.time() - 1, 'created_at': time.time() - 400}).inserted_id
+    drain(make_queue())
+    check(database.outbox.find_one({'_id': lost_id})['status'] == 'sent', 'expired lease reclaimed and sent')
+
+    # 6. Password reset through the API returns before any SMTP work, even against a slow server
+    os.environ['MEDIA_WORKERS'] = '0'
+    os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    import index
+    from werkzeug.security import generate_password_hash
+
+    index.db = database
+    database.users.delete_many({'email': 'reset@example.com'})
+    database.users.insert_one({'name': 'Reset Tester', 'email': 'reset@example.com', 'specialty': 'Visitor',
+                               'password': generate_password_hash('old-password', 'pbkdf2:sha256:1000')})
+    index.mail_queue = make_queue()
+    index.mail_queue.get_db = index.get_db
+    handler.messages.clear()
+    handler.delay = 1.0
+    client = index.app.test_client()
+
+    # Without PUBLIC_URL or TRUSTED_HOSTS, a spoofed Host must not end up in a reset link
+    index.PUBLIC_URL, index.TRUSTED_HOSTS = None, set()
+    res = client.post('/api/auth/forgot-password', json={'email': 'reset@example.com'},
+                      headers={'Host': 'attacker.example'})
+    check(res.status_code == 503 and database.outbox.count_documents({'to': 'reset@example.com'}) == 0,
+          'no reset link built on an untrusted host')
+    index.TRUSTED_HOSTS = {'sparkconnect.example'}
+    res = client.post('/api/auth/forgot-password', json={'email': 'nobody@example.com'},
+                      headers={'Host': 'attacker.example'})
+    check(res.status_code == 503, 'host outside TRUSTED_HOSTS refused')
+    index.PUBLIC_URL = 'https://sparkconnect.example'
+
+    started = time.perf_counter()
+    res = client.post('/api/auth/forgot-password', json={'email': 'reset@example.com'})
+    elapsed = (time.perf_counter() - started) * 1000
+    check(res.status_code == 202 and elapsed < 500, f"forgot-password answered {res.status_code} in {elapsed:.0f} ms")
+    unknown = client.post('/api/auth/forgot-password', json={'email': 'nobody@example.com'})
+    check(unknown.status_code == 202 and unknown.get_json() == res.get_json(), 'same answer for an unknown email')
+
+    deadline = time.time() + 10
+    while not handler.messages and time.time() < deadline:
+        time.sleep(0.1)
+    handler.delay = 0
+    check(len(handler.messages) == 1, 'background worker delivered the reset email')
+    body = email.message_from_string(handler.messages[0][1], policy=email.policy.default).get_content() \
+        if handler.messages else ''
+    match = re.search(r'token=([\w.\-]+)', body)
+    token = match.group(1) if match else ''
+    check('https://sparkconnect.example/reset-password.html?token=' in body, 'reset link points at PUBLIC_URL')
+
+    res = client.post('/api/auth/reset-password', json={'token': token, 'password': 'new-password'})
+    check(res.status_code == 200, f"reset with the emailed token: {res.status_code}")
+    res = client.post('/api/auth/login', json={'email': 'reset@example.com', 'password': 'new-password'})
+    check(res.status_code == 200, 'login with the new password')
+    res = client.post('/api/auth/reset-password', json={'token': token, 'password': 'again'})
+    check(res.status_code == 400, 'the same link cannot be used twice')
+
+    controller.stop()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_mail_queue()
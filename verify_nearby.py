@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import random
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# The benchmark reads straight from MongoDB, not from the response cache
+os.environ['CACHE_BACKEND'] = 'none'
+os.environ['ENSURE_INDEXES'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import index
+from _geo import PLACES, geo_fields
+from _indexes import ensure_indexes
+
+PROFILES = 100000
+BUDGET_MS = 10
+# (label, lat, lng, radius km)
+QUERIES = [
+    ('Ikeja, 10 km', 6.60, 3.35, 10),
+    ('Lekki, 50 km', 6.47, 3.58, 50),
+    ('Central Abuja, 25 km', 9.06, 7.49, 25),
+    ('Port Harcourt, 50 km', 4.82, 7.03, 50),
+    ('Kano, 100 km', 12.0, 8.52, 100),
+    ('Rural Kogi, 300 km', 7.7, 6.9, 300),
+]
+
+def verify_nearby():
+    """Seed PROFILES synthetic profiles into a scratch database on a local mongod
+    and check that /api/electricians/nearby answers within BUDGET_MS at p95."""
+    load_dotenv('public/.env')
+    uri = os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017')
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client['sparkconnect_nearby_bench']
+
+    if db.users.estimated_document_count() != PROFILES:
+        print(f"Seeding {PROFILES} profiles...")
+        db.users.drop()
+        random.seed(13)
+        states = list(PLACES)
+        # Lagos, Abuja and Rivers get most of the profiles, as they would in practice
+        weights = [20 if s == 'Lagos' else 8 if s in ('FCT - Abuja', 'Rivers') else 1 for s in states]
+        specialties = ['Residential Wiring', 'Commercial Systems', 'Solar Panel Installer', 'Industrial Electrician']
+        docs = []
+        for i in range(PROFILES):
+            state = random.choices(states, weights)[0]
+            place = random.choice(PLACES[state])[0]
+            location = f"{place}, {state}" if random.random() < 0.7 else f"{state}, Nigeria"
+            docs.append({
+                'name': f"Electrician {i}",
+                'email': f"bench{i}@example.com",
+                'specialty': random.choice(specialties),
+                'state': state,
+                'location': location,
+                'rating': round(random.uniform(0, 5), 1),
+                'reviews': random.randint(0, 200),
+                **geo_fields(state, location)
+            })
+            if len(docs) == 5000:
+                db.users.insert_many(docs)
+                docs = []
+        if docs:
+            db.users.insert_many(docs)
+    ensure_indexes(db)
+
+    index.db = db
+    app = index.app.test_client()
+    ok = True
+    for label, lat, lng, radius in QUERIES:
+        url = f"/api/electricians/nearby?lat={lat}&lng={lng}&radius={radius}&limit=20"
+        app.get(url)     # warm up
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            res = app.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+        passed = p95 < BUDGET_MS and res.status_code == 200
+        ok = ok and passed
+        print(f"[{'OK' if passed else 'FAIL'}] {label}: p50 {p50:.2f} ms, p95 {p95:.2f} ms, "
+              f"{len(res.get_json()['electricians'])} results")
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_nearby()
@@ -0,0 +1,118 @@
+import os
+import sys
+import gzip
+import time
+import shutil
+import tempfile
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from _static import install
+
+def make_site(root):
+    """A small site: a page with a precompressed sibling, a fingerprinted script, a video and a secret"""
+    os.makedirs(os.path.join(root, 'js'))
+    page = b'<!DOCTYPE html><title>Test</title>' + b'<p>Hello</p>' * 500
+    files = {
+        'index.html': page,
+        'js/app.0123456789.js': b'console.log("app");\n' * 100,
+        'video.mp4': bytes(range(256)) * 4096,
+        'seed.py': b'SECRET = 1\n',
+        '.env': b'MONGO_URI=secret\n',
+    }
+    for rel, data in files.items():
+        with open(os.path.join(root, rel), 'wb') as f:
+            f.write(data)
+    with open(os.path.join(root, 'index.html.gz'), 'wb') as f:
+        f.write(gzip.compress(page))
+    return files
+
+def verify_static():
+    root = tempfile.mkdtemp(prefix='sparkconnect-static-')
+    files = make_site(root)
+    app = Flask(__name__)
+    site = install(app, root)
+    client = app.test_client()
+    ok = True
+
+    def check(condition, label):
+        nonlocal ok
+        print(f"{'[OK]' if condition else '[FAIL]'} {label}")
+        ok = ok and condition
+
+    video = files['video.mp4']
+
+    # Validators and the metadata cache
+    res = client.get('/video.mp4')
+    etag, last_modified = res.headers.get('ETag'), res.headers.get('Last-Modified')
+    check(res.status_code == 200 and res.data == video and etag and last_modified and
+          res.headers['Accept-Ranges'] == 'bytes', 'full GET with ETag, Last-Modified and Accept-Ranges')
+    calls = site.stats['stat_calls']
+    for _ in range(100):
+        client.get('/video.mp4', headers={'If-None-Match': etag})
+    check(site.stats['stat_calls'] == calls, f"100 repeat requests made {site.stats['stat_calls'] - calls} stat() calls")
+    check(client.get('/video.mp4', headers={'If-None-Match': etag}).status_code == 304, 'If-None-Match answered 304')
+    check(client.get('/video.mp4', headers={'If-Modified-Since': last_modified}).status_code == 304,
+          'If-Modified-Since answered 304')
+
+    # Byte ranges
+    res = client.get('/video.mp4', headers={'Range': 'bytes=1000-1999'})
+    check(res.status_code == 206 and res.data == video[1000:2000] and
+          res.headers['Content-Range'] == f"bytes 1000-1999/{len(video)}", 'Range gets 206 with exactly those bytes')
+    res = client.get('/video.mp4', headers={'Range': 'bytes=-500'})
+    check(res.status_code == 206 and res.data == video[-500:], 'suffix range gets the last 500 bytes')
+    res = client.get('/video.mp4', headers={'Range': f"bytes={len(video)}-"})
+    check(res.status_code == 416 and res.headers['Content-Range'] == f"bytes */{len(video)}",
+          'range past the end gets 416')
+    res = client.get('/video.mp4', headers={'Range': 'bytes=0-9', 'If-Range': '"stale-etag"'})
+    check(res.status_code == 200 and res.data == video, 'If-Range with an old ETag gets the whole file')
+    res = client.get('/video.mp4', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    check(res.status_code == 206 and res.data == video[:10], 'If-Range with the current ETag gets the range')
+
+    # Precompressed siblings
+    res = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+    check(res.headers.get('Content-Encoding') == 'gzip' and gzip.decompress(res.data) == files['index.html']
+          and 'Accept-Encoding' in res.headers.get('Vary', ''), 'index.html.gz sent to a gzip client')
+    res = client.get('/', headers={'Accept-Encoding': 'identity'})
+    check('Content-Encoding' not in res.headers and res.data == files['index.html'], 'identity client gets the file')
+    check(res.headers['ETag'] != client.get('/', headers={'Accept-Encoding': 'gzip'}).headers['ETag'],
+          'each encoding has its own ETag')
+
+    # Cache-Control
+    check(client.get('/js/app.0123456789.js').headers['Cache-Control'].endswith('immutable'),
+          'fingerprinted file cached as immutable')
+    check(client.get('/').headers['Cache-Control'] == 'no-cache', 'page revalidated on every use')
+
+    # Changes on disk are picked up once the cached metadata is re-checked; from here on, on every request
+    site.revalidate_interval = 0
+    time.sleep(0.01)
+    with open(os.path.join(root, 'video.mp4'), 'wb') as f:
+        f.write(b'new video')
+    res = client.get('/video.mp4', headers={'If-None-Match': etag})
+    check(res.status_code == 200 and res.data == b'new video', 'modified file gets a new ETag and body')
+    check(client.get('/', headers={'Accept-Encoding': 'gzip'}).status_code == 200, 'page still served')
+    time.sleep(0.01)
+    with open(os.path.join(root, 'index.html'), 'wb') as f:
+        f.write(b'<p>Rebuilt</p>')
+    res = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    check('Content-Encoding' not in res.headers and res.data == b'<p>Rebuilt</p>',
+          'precompressed sibling older than the page is ignored')
+
+    # What must not be served
+    check(client.get('/seed.py').status_code == 404, 'server-side .py file not served')
+    check(client.get('/.env').status_code == 404, 'dotfile not served')
+    check(client.get('/../verify_static.py').status_code == 404, 'path traversal refused')
+    check(client.get('/missing.png').status_code == 404, 'missing asset is a 404')
+    for i in range(site.max_entries + 500):
+        client.get(f"/missing-{i}.png")
+    check(site.snapshot()['cached_paths'] <= site.max_entries,
+          f"random 404s keep the metadata cache bounded ({site.snapshot()['cached_paths']} paths)")
+    check(client.get('/dashboard').data == b'<p>Rebuilt</p>', 'extension-less route falls back to index.html')
+
+    shutil.rmtree(root)
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_static()
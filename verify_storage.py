@@ -0,0 +1,203 @@
+import os
+import io
+import json
+import base64
+import sys
+import shutil
+import logging
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+def verify_storage():
+    """Run the upload routes against an S3-compatible bucket.
+
+    Uses a MinIO (or other S3) endpoint given with --endpoint-url, otherwise
+    an in-process moto server (pip install moto[server] boto3).
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--in-process', action='store_true', help='use mongomock instead of a mongod')
+    parser.add_argument('--endpoint-url', help='S3 endpoint, e.g. http://localhost:9000 for MinIO')
+    parser.add_argument('--bucket', default='sparkconnect-verify')
+    args = parser.parse_args()
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if endpoint_url is None:
+        from moto.server import ThreadedMotoServer
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = ThreadedMotoServer(port=0)
+        server.start()
+        host, port = server.get_host_and_port()
+        endpoint_url = f"http://{host}:{port}"
+        for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            os.environ.setdefault(name, 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    if args.in_process:
+        import mongomock
+        database = mongomock.MongoClient()['sparkconnect_storagetest']
+    else:
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)['sparkconnect_storagetest']
+    for collection in ('users', 'media', 'upload_refs', 'partial_uploads'):
+        database[collection].drop()
+
+    os.environ['MEDIA_WORKERS'] = '0'
+    import requests
+    from bson import ObjectId
+    import index
+    from _storage import S3Storage
+    from _media import derive
+    from _upload_gc import UploadReferences
+    from _uploads import ResumableUploads
+
+    storage = S3Storage(args.bucket, endpoint_url=endpoint_url)
+    try:
+        storage.client.create_bucket(Bucket=args.bucket)
+    except storage.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    ok = True
+
+    def check(condition, label):
+        nonlocal ok
+        print(f"{'[OK]' if condition else '[FAIL]'} {label}")
+        ok = ok and condition
+
+    # The backend on its own
+    first = storage.save_stream(io.BytesIO(b'x' * 5000), 'jpg', 10000)
+    again = storage.save_stream(io.BytesIO(b'x' * 5000), 'jpg', 10000)
+    head = storage.client.head_object(Bucket=args.bucket, Key=storage.object_key(first))
+    check(first == again and storage.size(first) == 5000 and head['ContentType'] == 'image/jpeg'
+          and 'immutable' in head['CacheControl'], 'same bytes stored once, with type and cache headers')
+    check(storage.key_for(storage.url(first)) == first and storage.key_for('assets/uploads/a.jpg') is None,
+          'URLs map back to keys')
+    storage.move(first, 'moved.jpg')
+    with storage.local_path('moved.jpg') as path:
+        moved = open(path, 'rb').read()
+    check(not storage.exists(first) and moved == b'x' * 5000, 'move, then read back through a local copy')
+    storage.delete('moved.jpg')
+    check(storage.size('moved.jpg') is None and list(storage.list_files()) == [], 'delete leaves the bucket empty')
+
+    # The app on the bucket: every upload component shares the backend
+    index.db = database
+    index.storage = index.resumable_uploads.storage = index.media_pipeline.storage = storage
+    index.upload_refs = refs = UploadReferences(index.get_db, storage, grace_seconds=0)
+    client = index.app.test_client()
+
+    res = client.post('/api/uploads/direct', json={'filename': 'clip.mp4', 'size': 10})
+    check(res.status_code == 401 and database.upload_refs.count_documents({}) == 0,
+          'anonymous clients cannot presign uploads')
+    user_id = str(database.users.insert_one({'name': 'Ada', 'email': 'ada@example.com'}).inserted_id)
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    res = client.post('/api/upload', data={'file': (io.BytesIO(b'avatar bytes'), 'avatar.jpg')},
+                      content_type='multipart/form-data')
+    url = res.get_json()['url']
+    check(res.status_code == 200 and url.startswith(endpoint_url) and storage.exists(storage.key_for(url)),
+          'form upload stored in the bucket')
+
+    payload = b'v' * 300000
+    res = client.post('/api/uploads/direct', json={'filename': 'clip.mp4', 'size': len(payload)})
+    start = res.get_json()
+    sent = requests.post(start['upload']['url'], data=start['upload']['fields'],
+                         files={'file': ('clip.mp4', payload)})
+    check(res.status_code == 201 and sent.status_code in (200, 204), 'presigned form accepted by the bucket')
+    with client.session_transaction() as sess:
+        sess['user_id'] = str(ObjectId())
+    res = client.post('/api/uploads/direct/complete', json={'token': start['token']})
+    check(res.status_code == 400, "another user cannot complete someone else's upload")
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    res = client.post('/api/uploads/direct/complete', json={'token': start['token']})
+    check(res.status_code == 200 and res.get_json() == {'url': start['url'], 'size': len(payload)}
+          and storage.client.get_object(Bucket=args.bucket, Key=storage.object_key(storage.key_for(start['url'])))
+          ['Body'].read() == payload, 'direct upload completed and stored under its key')
+    record = database.upload_refs.find_one({'_id': start['url']})
+    check(record is not None and record['size'] == len(payload), 'direct upload tracked for collection')
+
+    # Resumable uploads keep their chunks in the bucket, so another instance can take the next one
+    payload = b'r' * 250000
+    res = client.post('/api/uploads', json={'filename': 'long.mp4', 'size': len(payload)})
+    upload_id = res.get_json()['upload_id']
+    first_range = {'Content-Range': f"bytes 0-99999/{len(payload)}"}
+    res = client.put(f"/api/uploads/{upload_id}", data=payload[:100000], headers=first_range)
+    replayed = client.put(f"/api/uploads/{upload_id}", data=payload[:100000], headers=first_range)
+    check(res.get_json() == {'offset': 100000} and replayed.status_code == 409, 'chunk stored, replayed chunk is a 409')
+    other_instance = ResumableUploads(storage, index.get_db, index.MAX_RESUMABLE_BYTES)
+    offset, name = other_instance.append(upload_id, 100000, io.BytesIO(payload[100000:]))
+    parts = [obj for page in storage.list_objects(storage.object_key(other_instance.PARTS_PREFIX))
+             for obj in page.get('Contents', [])]
+    check(offset == len(payload) and storage.client.get_object(Bucket=args.bucket, Key=storage.object_key(name))
+          ['Body'].read() == payload and not parts and database.partial_uploads.count_documents({}) == 0,
+          'another instance finished the upload; chunks and progress cleaned up')
+    res = client.post('/api/uploads', json={'filename': 'huge.mp4', 'size': index.MAX_RESUMABLE_BYTES + 1})
+    check(res.status_code == 413 and res.get_json()['max_bytes'] == index.MAX_RESUMABLE_BYTES,
+          '413 reports the resumable limit')
+
+    res = client.post('/api/uploads/direct', json={'filename': 'big.mp4', 'size': 1000})
+    start = res.get_json()
+    policy = json.loads(base64.b64decode(start['upload']['fields']['policy']))
+    check(['content-length-range', 1, 1000] in policy['conditions'], 'signed policy limits the declared size')
+    if server is None:
+        # moto does not enforce the policy's size range; MinIO and S3 do
+        sent = requests.post(start['upload']['url'], data=start['upload']['fields'],
+                             files={'file': ('big.mp4', b'b' * 2000)})
+        check(sent.status_code >= 400 and not storage.exists(storage.key_for(start['url'])),
+              'bucket refuses a file larger than declared')
+    res = client.post('/api/uploads/direct/complete', json={'token': start['token']})
+    check(res.status_code == 409, 'completing a missing upload is a 409')
+    res = client.post('/api/uploads/direct/complete', json={'token': start['token'] + 'x'})
+    check(res.status_code == 400, 'tampered token is a 400')
+    res = client.post('/api/uploads/direct', json={'filename': 'notes.txt', 'size': 10})
+    check(res.status_code == 400, 'disallowed file type refused before presigning')
+
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        image = io.BytesIO()
+        Image.new('RGB', (800, 600), (200, 80, 40)).save(image, 'JPEG')
+        key = storage.save_stream(io.BytesIO(image.getvalue()), 'jpg', 10 ** 7)
+        entry = derive(key, storage)
+        variant = next(iter(entry['variants'].values()))
+        fmt = next(name for name in variant if name != 'width')
+        check(storage.exists(storage.key_for(variant[fmt])), f"variants written to the bucket ({fmt})")
+
+    # Collection quarantines under quarantine/ in the same bucket
+    report = refs.collect()
+    quarantined = [obj['Key'] for page in storage.list_objects(storage.QUARANTINE_PREFIX)
+                   for obj in page.get('Contents', [])]
+    # The unfinished direct upload has a record but no object
+    check(report['missing'] == 1 and len(quarantined) == report['files'] >= 2
+          and not storage.exists(storage.key_for(url)), f"{report['files']} orphaned files moved to quarantine")
+
+    # The local backend has no direct uploads; clients fall back to /api/upload
+    from _storage import LocalStorage
+    upload_dir = tempfile.mkdtemp(prefix='sparkconnect-uploads-')
+    index.storage = index.resumable_uploads.storage = index.media_pipeline.storage = LocalStorage(upload_dir)
+    index.upload_refs = UploadReferences(index.get_db, index.storage)
+    res = client.post('/api/uploads/direct', json={'filename': 'clip.mp4', 'size': 10})
+    check(res.status_code == 501, 'local storage answers 501 to direct uploads')
+    res = client.post('/api/upload', data={'file': (io.BytesIO(b'local bytes'), 'photo.jpg')},
+                      content_type='multipart/form-data')
+    check(res.get_json()['url'].startswith('assets/uploads/'), 'local uploads keep assets/uploads URLs')
+    with client.session_transaction() as sess:
+        sess.clear()
+    res = client.post('/api/upload', data={'file': (io.BytesIO(b'anonymous bytes'), 'photo.jpg')},
+                      content_type='multipart/form-data')
+    resumable = client.post('/api/uploads', json={'filename': 'clip.mp4', 'size': 10})
+    check(res.status_code == 401 and resumable.status_code == 401, 'anonymous form and resumable uploads refused')
+
+    shutil.rmtree(upload_dir)
+    if server is not None:
+        server.stop()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_storage()
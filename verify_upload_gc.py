@@ -0,0 +1,156 @@
+import os
+import io
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+def verify_upload_gc():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--in-process', action='store_true', help='use mongomock instead of a mongod')
+    args = parser.parse_args()
+
+    if args.in_process:
+        import mongomock
+        database = mongomock.MongoClient()['sparkconnect_uploadtest']
+    else:
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)['sparkconnect_uploadtest']
+    for collection in ('users', 'media', 'upload_refs'):
+        database[collection].drop()
+
+    os.environ['MEDIA_WORKERS'] = '0'
+    import index
+    from _upload_gc import UploadReferences
+
+    upload_dir = tempfile.mkdtemp(prefix='sparkconnect-uploads-')
+    quarantine_dir = tempfile.mkdtemp(prefix='sparkconnect-quarantine-')
+    index.db = database
+    # Every upload component shares this backend
+    index.storage.root = upload_dir
+    index.storage.quarantine_dir = quarantine_dir
+    index.upload_refs = refs = UploadReferences(index.get_db, index.storage, grace_seconds=3600)
+    client = index.app.test_client()
+    ok = True
+
+    def check(condition, label):
+        nonlocal ok
+        print(f"{'[OK]' if condition else '[FAIL]'} {label}")
+        ok = ok and condition
+
+    def upload(data):
+        # Uploads need a session; after an account deletion, upload as Ada
+        with client.session_transaction() as sess:
+            sess.setdefault('user_id', str(ada))
+        res = client.post('/api/upload', data={'file': (io.BytesIO(data), 'photo.jpg')},
+                          content_type='multipart/form-data')
+        return res.get_json()['url']
+
+    def login(user_id):
+        with client.session_transaction() as sess:
+            sess['user_id'] = str(user_id)
+
+    def exists(url):
+        return os.path.exists(os.path.join(upload_dir, url[len('assets/uploads/'):]))
+
+    ada = database.users.insert_one({'name': 'Ada', 'email': 'ada@example.com', 'gallery': []}).inserted_id
+    bayo = database.users.insert_one({'name': 'Bayo', 'email': 'bayo@example.com', 'gallery': []}).inserted_id
+    shared, solo, avatar, unused = (upload(bytes([n]) * (1000 * (n + 1))) for n in range(4))
+
+    # A variant recorded for solo, as the media worker would have written it
+    os.makedirs(os.path.join(upload_dir, 'variants'))
+    with open(os.path.join(upload_dir, 'variants', 'solo-thumb.webp'), 'wb') as f:
+        f.write(b'v' * 500)
+    database.media.insert_one({'_id': solo, 'poster': None,
+                               'variants': {'thumb': {'width': 160, 'webp': 'assets/uploads/variants/solo-thumb.webp'}}})
+
+    login(ada)
+    client.post('/api/user/gallery', json={'url': [shared, solo]})
+    client.put('/api/user/update', json={'image': avatar})
+    login(bayo)
+    client.post('/api/user/gallery', json={'url': shared})
+    record = database.upload_refs.find_one({'_id': shared})
+    check(sorted(record['refs']) == sorted([f"{ada}:gallery", f"{bayo}:gallery"]) and 'released_at' not in record,
+          'a file shared by two galleries is referenced by both')
+
+    report = refs.collect()
+    check(report['collected'] == 0 and exists(unused), 'unused upload kept during its grace period')
+    refs.grace_seconds = 0
+    report = refs.collect()
+    check(report['urls'] == [unused] and not exists(unused) and report['reclaimed_bytes'] == 4000,
+          f"unused upload collected after the grace period ({report['reclaimed_bytes']} bytes)")
+    check(any(files for _, _, files in os.walk(quarantine_dir)), 'collected file is in quarantine')
+
+    login(ada)
+    client.delete('/api/user/gallery', json={'url': shared})
+    client.delete('/api/user/gallery', json={'url': solo})
+    report = refs.collect()
+    check(report['urls'] == [solo] and exists(shared), 'file still in another gallery is kept')
+    check(report['files'] == 2 and report['reclaimed_bytes'] == 2500 and database.media.count_documents({}) == 0,
+          'removed gallery item collected with its variant and media record')
+
+    replacement = upload(b'new avatar')
+    client.put('/api/user/update', json={'image': replacement})
+    check(refs.collect()['urls'] == [avatar] and exists(replacement), 'replaced profile picture collected')
+
+    login(bayo)
+    client.delete('/api/user/delete')
+    check(refs.collect()['urls'] == [shared] and not exists(shared), "deleted account's last reference released")
+
+    # Referenced again between the claim and the final check: the file is put back
+    late = upload(b'late reference')
+
+    class Racing(UploadReferences):
+        def stage(self, paths):
+            staged = super().stage(paths)
+            self.reference(late, ada, 'gallery')
+            return staged
+
+    racing = Racing(index.get_db, index.storage, grace_seconds=0)
+    report = racing.collect()
+    check(report['restored'] == 1 and report['collected'] == 0 and exists(late), 'file referenced mid-run restored')
+
+    # A collector that dies holding a lease leaves the file for the first run after the lease,
+    # even with a grace period longer than the lease
+    crashed = upload(b'crashed collector')
+    database.upload_refs.update_one({'_id': crashed}, {'$set': {'released_at': time.time() - 7200}})
+    refs.grace_seconds = 3600
+    refs.claim(time.time())
+    check(refs.collect()['collected'] == 0, 'leased file skipped while the lease runs')
+    database.upload_refs.update_one({'_id': crashed}, {'$set': {'lease_until': time.time() - 1}})
+    check(refs.collect()['urls'] == [crashed], 'collected as soon as the lease runs out')
+    refs.grace_seconds = 0
+
+    # Cost follows the backlog: referenced files are never read
+    database.upload_refs.insert_many([{'_id': f"assets/uploads/busy{i}.jpg", 'refs': ['x:gallery'], 'size': 1}
+                                      for i in range(5000)])
+    started = time.perf_counter()
+    report = refs.collect()
+    elapsed = (time.perf_counter() - started) * 1000
+    check(report['collected'] == 0, f"nothing to collect among 5000 referenced files ({elapsed:.1f} ms)")
+
+    os.makedirs(os.path.join(quarantine_dir, '2000-01-01'))
+    check(refs.purge_quarantine() == 1, 'quarantine older than the retention purged')
+
+    # Rebuilding from scratch finds the live references and the orphans
+    orphan = upload(b'from before the index')
+    database.upload_refs.drop()
+    counts = refs.rebuild()
+    live = database.upload_refs.find_one({'_id': replacement})
+    check(counts['files'] == 3 and live['refs'] == [f"{ada}:image"] and 'released_at' not in live,
+          f"rebuild indexed {counts['files']} files with their references")
+    # late was only referenced in the index, never saved to a profile
+    check(sorted(refs.collect(dry_run=True)['urls']) == sorted([late, orphan]) and exists(orphan),
+          'dry run lists the orphans and keeps them')
+
+    shutil.rmtree(upload_dir)
+    shutil.rmtree(quarantine_dir)
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    verify_upload_gc()